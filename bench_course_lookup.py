@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark for course search.
+Builds a synthetic catalog (100k courses by default), checks that CourseIndex.search()
+returns the same top scores as exhaustive BM25 scoring, and compares lookup latency with
+the previous linear substring scan over the area field.
+
+Usage: python bench_course_lookup.py [--courses N] [--repeat N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+from chat.search import CourseIndex, tokenize, area_term
+
+AREAS = ["data science", "computer science", "mathematics", "physics", "humanities", "biology",
+         "chemistry", "economics", "psychology", "engineering", "history", "philosophy"]
+SUBJECT_PREFIX = {"data science": "DS", "computer science": "CS", "mathematics": "MATH", "physics": "PHYS",
+                  "humanities": "HUM", "biology": "BIO", "chemistry": "CHEM", "economics": "ECON",
+                  "psychology": "PSY", "engineering": "ENG", "history": "HIST", "philosophy": "PHIL"}
+TITLE_WORDS = ["introduction", "advanced", "applied", "statistics", "machine", "learning", "systems", "theory",
+               "methods", "analysis", "design", "programming", "algorithms", "networks", "modern", "ethics",
+               "probability", "databases", "optimization", "quantum", "cellular", "organic", "markets", "cognition",
+               "writing", "calculus", "linear", "algebra", "visualization", "security", "robotics", "seminar"]
+WHY_WORDS = ["foundations", "hands-on", "project", "research", "lab", "core", "elective", "capstone",
+             "survey", "practical", "skills", "concepts", "case", "studies", "preprocessing", "modeling"]
+QUERIES = ["data science", "machine learning", "statistics", "quantum physics", "programming",
+           "cs1234", "ethics of robotics", "probability theory", "organic chemistry lab", "history"]
+
+
+def synthetic_catalog(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    courses = []
+    for i in range(n):
+        area = rng.choice(AREAS)
+        courses.append({
+            "code": f"{SUBJECT_PREFIX[area]}{1000 + i % 9000}",
+            "title": " ".join(rng.sample(TITLE_WORDS, rng.randint(2, 4))).title(),
+            "area": area,
+            "level": "grad" if rng.random() < 0.3 else "undergrad",
+            "why": " ".join(rng.sample(WHY_WORDS, rng.randint(2, 5))),
+        })
+    return courses
+
+
+def scan_lookup(catalog, topic: str, level: str = "undergrad", limit: int = 4):
+    """The previous course_lookup matching: substring of area, exact level, catalog order."""
+    topic = topic.lower()
+    matches = [c for c in catalog if topic in c["area"] and c["level"] == level]
+    return matches[:limit]
+
+
+def exhaustive_scores(index: CourseIndex, query: str, level: str, limit: int):
+    terms = list(dict.fromkeys(tokenize(query) + (area_term(query),)))
+    scores = []
+    for doc_id, course in enumerate(index.courses):
+        if course["level"] != level:
+            continue
+        total = sum(index._impacts.get(term, {}).get(doc_id, 0.0) for term in terms)
+        if total > 0:
+            scores.append(total)
+    return sorted((round(s, 4) for s in scores), reverse=True)[:limit]
+
+
+def per_call_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--courses", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.courses)
+    t0 = time.perf_counter()
+    index = CourseIndex(catalog)
+    print(f"Catalog: {len(catalog):,} courses, index built in {time.perf_counter() - t0:.2f}s")
+
+    for query in QUERIES:
+        got = [score for score, _ in index.search(query, level="undergrad", limit=4)]
+        assert got == exhaustive_scores(index, query, "undergrad", 4), f"ranking mismatch for '{query}'"
+    print("Ranking: indexed top-4 scores match exhaustive BM25 scoring for every query")
+
+    print(f"\n{'query':<26}{'scan us':>12}{'index us':>12}")
+    total_scan = total_index = 0.0
+    for query in QUERIES:
+        scan = per_call_us(lambda: scan_lookup(catalog, query), max(args.repeat // 20, 5))
+        indexed = per_call_us(lambda: index.search(query, level="undergrad", limit=4), args.repeat)
+        total_scan += scan
+        total_index += indexed
+        print(f"{query:<26}{scan:>12.1f}{indexed:>12.1f}")
+    print(f"{'mean':<26}{total_scan / len(QUERIES):>12.1f}{total_index / len(QUERIES):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
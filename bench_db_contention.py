@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Contention benchmark for the database profiles.
+Runs several worker processes that each drive concurrent chats through post_message
+(agent runs replaced by an instant local stand-in, so only the database work is timed)
+against one shared database, and reports turns/second and failed turns per profile.
+
+Profiles:
+  sqlite-default   rollback journal, synchronous=FULL, no persistent connections
+  sqlite-wal       WAL, synchronous=NORMAL, 5s busy timeout, persistent connections
+  postgresql       DB_ENGINE=postgresql with the DB_* variables from the environment (--postgres)
+
+Usage: python bench_db_contention.py [--processes N] [--chats N] [--turns N] [--postgres]
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uni_agents', 'backend')
+
+PROFILES = {
+    "sqlite-default": {
+        "DB_ENGINE": "sqlite", "DB_SQLITE_JOURNAL_MODE": "delete", "DB_SQLITE_SYNCHRONOUS": "full",
+        "DB_SQLITE_BUSY_TIMEOUT": "5000", "DB_CONN_MAX_AGE": "0",
+    },
+    "sqlite-wal": {
+        "DB_ENGINE": "sqlite", "DB_SQLITE_JOURNAL_MODE": "wal", "DB_SQLITE_SYNCHRONOUS": "normal",
+        "DB_SQLITE_BUSY_TIMEOUT": "5000", "DB_CONN_MAX_AGE": "0",
+    },
+    "postgresql": {"DB_ENGINE": "postgresql"},
+}
+
+
+class InstantRunner:
+    """Stand-in for the Agents SDK runner: answers immediately without calling the API."""
+
+    async def run(self, agent, input_messages):
+        if agent.name == "Router Agent":
+            return types.SimpleNamespace(final_output="Course Advisor")
+        return types.SimpleNamespace(final_output=f"{agent.name} reply to turn {len(input_messages)}.")
+
+
+def setup_django(profile_env: dict) -> None:
+    os.environ.update(profile_env)
+    os.environ.setdefault("OPENAI_API_KEY", "bench-not-used")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    sys.path.insert(0, BACKEND_DIR)
+    import django
+    django.setup()
+
+
+def prepare(profile_env: dict) -> None:
+    setup_django(profile_env)
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def worker(profile_env: dict, chats: int, turns: int, start_at: float, results) -> None:
+    setup_django(profile_env)
+    from django.test import AsyncClient
+    from chat import agents_integration
+    agents_integration.runner = InstantRunner()
+
+    async def chat(client, stats):
+        session_id = None
+        for turn in range(turns):
+            t0 = time.perf_counter()
+            response = await client.post("/api/message/", json.dumps({"session_id": session_id, "text": f"question {turn}"}),
+                                         content_type="application/json")
+            if response.status_code == 200:
+                session_id = json.loads(response.content)["session_id"]
+                stats["ok"] += 1
+                stats["latencies"].append(time.perf_counter() - t0)
+            else:
+                stats["failed"] += 1
+
+    async def run_chats():
+        client = AsyncClient(raise_request_exception=False)
+        stats = {"ok": 0, "failed": 0, "latencies": []}
+        await asyncio.gather(*(chat(client, stats) for _ in range(chats)))
+        return stats
+
+    # Start all workers together so they contend for the database
+    time.sleep(max(0.0, start_at - time.time()))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results.put(asyncio.run(run_chats()))
+
+
+def run_profile(name: str, processes: int, chats: int, turns: int) -> None:
+    profile_env = dict(PROFILES[name])
+    if profile_env["DB_ENGINE"] == "sqlite":
+        profile_env["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="bench_db_"), "bench.sqlite3")
+
+    ctx = multiprocessing.get_context("spawn")
+    setup = ctx.Process(target=prepare, args=(profile_env,))
+    setup.start()
+    setup.join()
+
+    results = ctx.Queue()
+    start_at = time.time() + 3.0
+    procs = [ctx.Process(target=worker, args=(profile_env, chats, turns, start_at, results)) for _ in range(processes)]
+    for p in procs:
+        p.start()
+    stats = [results.get() for _ in procs]
+    elapsed = time.time() - start_at
+    for p in procs:
+        p.join()
+
+    ok = sum(s["ok"] for s in stats)
+    failed = sum(s["failed"] for s in stats)
+    latencies = sorted(l for s in stats for l in s["latencies"])
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+    print(f"{name:<16}{ok / elapsed:>12.1f}{failed:>10}{p50:>10.1f}{p95:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=4, help="worker processes (like server workers)")
+    parser.add_argument("--chats", type=int, default=8, help="concurrent chats per process")
+    parser.add_argument("--turns", type=int, default=25, help="messages per chat")
+    parser.add_argument("--postgres", action="store_true", help="also run the postgresql profile (needs DB_* env vars)")
+    args = parser.parse_args()
+
+    names = ["sqlite-default", "sqlite-wal"] + (["postgresql"] if args.postgres else [])
+    print(f"{args.processes} processes x {args.chats} concurrent chats x {args.turns} turns\n")
+    print(f"{'profile':<16}{'turns/s':>12}{'failed':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name in names:
+        run_profile(name, args.processes, args.chats, args.turns)
+
+
+if __name__ == "__main__":
+    main()
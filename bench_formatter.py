@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for agent response formatting.
+Compares the one-shot clean_agent_output() on a complete reply with the chunk-by-chunk
+StreamingFormatter at several chunk sizes, and checks that every chunking produces
+exactly the same text.
+
+Usage: python bench_formatter.py [--repeat N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+from chat.formatting import clean_agent_output, format_stream
+
+
+def sample_reply(items: int = 6) -> str:
+    """A Course Advisor style reply: escaped newlines, a bold numbered list and a closing question."""
+    parts = ["Here are some courses I recommend for data science. "]
+    for i in range(1, items + 1):
+        parts.append(f"{i}. **CS{300 + i} - Topic {i}**: Covers the \\\"core\\\" ideas of area {i}.\\n")
+    parts.append("These build on each other. 1. Start early. 2. Take STAT210 first. ")
+    parts.append("Would you like more details about prerequisites?\\n\\n\\n")
+    return "".join(parts)
+
+
+def chunked(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def per_call_us(fn, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    reply = sample_reply()
+    expected = clean_agent_output(reply)
+
+    # Equivalence: fixed chunk sizes plus random chunkings
+    rng = random.Random(0)
+    for size in (1, 2, 3, 4, 7, 16, 64, len(reply)):
+        assert format_stream(chunked(reply, size)) == expected, f"mismatch at chunk size {size}"
+    for _ in range(500):
+        cuts = sorted(rng.sample(range(1, len(reply)), rng.randint(1, 40)))
+        chunks = [reply[a:b] for a, b in zip([0] + cuts, cuts + [len(reply)])]
+        assert format_stream(chunks) == expected, "mismatch on random chunking"
+    print("Equivalence: streamed output matches clean_agent_output() for all chunkings")
+
+    print(f"\nReply length: {len(reply)} chars, {args.repeat} runs each (CPU time per response)")
+    print(f"{'mode':<28}{'us/response':>14}")
+    print(f"{'one-shot (complete text)':<28}{per_call_us(lambda: clean_agent_output(reply), args.repeat):>14.1f}")
+    for size in (4, 16, 64):
+        chunks = chunked(reply, size)
+        label = f"streamed, {size}-char chunks"
+        print(f"{label:<28}{per_call_us(lambda: format_stream(chunks), args.repeat):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark for OpenAI connection reuse.
+Starts a local mock Responses API server that counts TCP connections (and can add a
+delay to each new one, standing in for TCP/TLS setup), then sends messages through the
+Agents SDK the way the backend does: a Router Agent call followed by a specialist call.
+Compares a fresh event loop and client per message with the shared agent loop and
+pooled client from chat.agent_loop.
+
+Usage: python bench_http_pool.py [--messages N] [--connect-ms MS]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+from django.conf import settings
+
+settings.configure()
+
+from agents import Agent, Runner, set_default_openai_client, set_tracing_disabled
+from chat.agent_loop import AgentLoop, build_openai_client
+
+
+class MockServer:
+    """Minimal HTTP/1.1 keep-alive server answering every POST with a one-message Response."""
+
+    def __init__(self, connect_delay: float):
+        self.connect_delay = connect_delay
+        self.connections = 0
+        self.requests = 0
+        self.port = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._ready.wait()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                await reader.readexactly(length)
+                self.requests += 1
+                body = json.dumps(response_payload(self.requests)).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def response_payload(n: int) -> dict:
+    return {
+        "id": f"resp_{n}", "object": "response", "created_at": int(time.time()), "model": "gpt-4o-mini",
+        "status": "completed", "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+        "output": [{
+            "type": "message", "id": f"msg_{n}", "role": "assistant", "status": "completed",
+            "content": [{"type": "output_text", "text": "Course Advisor", "annotations": []}],
+        }],
+        "usage": {"input_tokens": 50, "output_tokens": 3, "total_tokens": 53,
+                  "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}},
+    }
+
+
+router = Agent(name="Router Agent", instructions="Route the message.", model="gpt-4o-mini")
+specialist = Agent(name="Course Advisor", instructions="Answer the message.", model="gpt-4o-mini")
+
+
+async def one_message(runner: Runner, text: str):
+    await runner.run(router, text)
+    await runner.run(specialist, text)
+
+
+def per_message_loop(server: MockServer, messages: int):
+    """Before: each message ran in its own event loop with its own client."""
+    runner = Runner()
+    for i in range(messages):
+        async def message():
+            client = build_openai_client()
+            set_default_openai_client(client)
+            await one_message(runner, f"question {i}")
+            await client.close()
+        asyncio.run(message())
+
+
+def shared_agent_loop(server: MockServer, messages: int):
+    """After: every message runs on one long-lived loop with one pooled client."""
+    runner = Runner()
+    loop = AgentLoop()
+    set_default_openai_client(build_openai_client())
+    for i in range(messages):
+        loop.run_sync(lambda: one_message(runner, f"question {i}"))
+    loop.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--connect-ms", type=float, default=20.0,
+                        help="delay added to each new connection, standing in for TCP/TLS setup")
+    args = parser.parse_args()
+
+    server = MockServer(args.connect_ms / 1000)
+    server.start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    set_tracing_disabled(True)
+
+    print(f"{args.messages} messages, 2 agent calls each, {args.connect_ms:.0f} ms per new connection\n")
+    print(f"{'mode':<22}{'connections':>13}{'per message':>13}{'ms/message':>12}")
+    for name, run in [("per-message loop", per_message_loop), ("shared agent loop", shared_agent_loop)]:
+        connections = server.connections
+        start = time.perf_counter()
+        run(server, args.messages)
+        elapsed = time.perf_counter() - start
+        opened = server.connections - connections
+        print(f"{name:<22}{opened:>13}{opened / args.messages:>13.2f}{elapsed / args.messages * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
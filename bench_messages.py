@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark for Message table writes and history reads on a large table.
+Fills a scratch SQLite database with N messages spread over many sessions, then measures
+  - one turn's writes (user message, tool call, agent reply) as separate autocommit
+    creates vs. one bulk_create inside a transaction
+  - history reads (recent window and full session) with and without the
+    (session, created_at, id) index
+
+Usage: python bench_messages.py [--messages N] [--sessions N] [--long-sessions N] [--samples N] [--db PATH]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import timedelta
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django
+from django.conf import settings
+
+
+def setup_django(db_path: str) -> None:
+    # Point the default database at the scratch file before any connection is opened
+    settings.DATABASES["default"]["NAME"] = db_path
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def fill(messages: int, sessions: int, long_sessions: int, batch: int = 20000):
+    """
+    Spread `messages` over the sessions; the first `long_sessions` sessions together get
+    a tenth of all messages, the kind of very long conversation an index matters most for.
+    """
+    from django.utils import timezone
+    from chat.models import Session, Message
+
+    session_objs = Session.objects.bulk_create([Session() for _ in range(sessions)], batch_size=batch)
+    long_objs, typical_objs = session_objs[:long_sessions], session_objs[long_sessions:]
+    rng = random.Random(0)
+    start = timezone.now() - timedelta(days=30)
+    senders = ["user", "Course Advisor", "Scheduling Assistant", "tool"]
+    t0 = time.perf_counter()
+    for offset in range(0, messages, batch):
+        rows = [
+            Message(session=rng.choice(long_objs if long_objs and i % 10 == 0 else typical_objs), sender=senders[i % 4],
+                    text=f"message {i} " + "lorem ipsum " * rng.randint(2, 30),
+                    created_at=start + timedelta(milliseconds=i))
+            for i in range(offset, min(offset + batch, messages))
+        ]
+        Message.objects.bulk_create(rows, batch_size=batch)
+        print(f"\r  inserted {offset + len(rows):,}/{messages:,}", end="", flush=True)
+    print(f"\r  inserted {messages:,} messages into {sessions:,} sessions in {time.perf_counter() - t0:.1f}s")
+    return typical_objs, long_objs
+
+
+def timed_ms(fn, samples: int):
+    times = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return statistics.mean(times), times[len(times) // 2], times[int(len(times) * 0.95)]
+
+
+def report(label: str, result) -> None:
+    mean, p50, p95 = result
+    print(f"{label:<44}{mean:>10.3f}{p50:>10.3f}{p95:>10.3f}")
+
+
+def bench_writes(session_objs, samples: int) -> None:
+    from django.db import transaction
+    from chat.models import Message
+    rng = random.Random(1)
+
+    def separate():
+        session = rng.choice(session_objs)
+        Message.objects.create(session=session, sender="user", text="When is the CS320 final?")
+        Message.objects.create(session=session, sender="tool", text='{"tool": "tool_academic_calendar"}')
+        Message.objects.create(session=session, sender="Scheduling Assistant", text="The CS320 final is on Dec 12.",
+                               meta={"routing": {"path": "local"}})
+
+    def batched():
+        session = rng.choice(session_objs)
+        with transaction.atomic():
+            Message.objects.bulk_create([
+                Message(session=session, sender="user", text="When is the CS320 final?"),
+                Message(session=session, sender="tool", text='{"tool": "tool_academic_calendar"}'),
+                Message(session=session, sender="Scheduling Assistant", text="The CS320 final is on Dec 12.",
+                        meta={"routing": {"path": "local"}}),
+            ])
+
+    report("turn write, 3 autocommit creates", timed_ms(separate, samples))
+    report("turn write, bulk_create in one transaction", timed_ms(batched, samples))
+
+
+def bench_reads(typical_objs, long_objs, samples: int, label: str) -> None:
+    from chat.models import Message
+    rng = random.Random(2)
+
+    def recent_window(sessions):
+        def read():
+            session = rng.choice(sessions)
+            list(Message.objects.filter(session=session).exclude(sender="tool")
+                 .order_by("-created_at", "-id").values("id", "sender", "text")[:40])
+        return read
+
+    def full_history():
+        session = rng.choice(typical_objs)
+        list(Message.objects.filter(session=session).order_by("created_at", "id"))
+
+    report(f"recent window (40), {label}", timed_ms(recent_window(typical_objs), samples))
+    if long_objs:
+        report(f"recent window (40), long session, {label}", timed_ms(recent_window(long_objs), samples))
+    report(f"full session history, {label}", timed_ms(full_history, samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--long-sessions", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--db", default="", help="scratch SQLite file (default: a temporary file, removed afterwards)")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench_messages_"), "bench.sqlite3")
+    print(f"Database: {db_path}")
+    setup_django(db_path)
+
+    from django.db import connection
+    from chat.models import Message
+
+    typical_objs, long_objs = fill(args.messages, args.sessions, args.long_sessions)
+    index = next(i for i in Message._meta.indexes if i.name == "chat_msg_session_created_idx")
+
+    print(f"\n{'operation':<44}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    bench_writes(typical_objs, args.samples)
+    bench_reads(typical_objs, long_objs, args.samples, "indexed")
+
+    with connection.schema_editor() as editor:
+        editor.remove_index(Message, index)
+    bench_reads(typical_objs, long_objs, max(args.samples // 10, 5), "no index")
+    with connection.schema_editor() as editor:
+        editor.add_index(Message, index)
+
+    if not args.db:
+        connection.close()
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ function App() {
   const [sessionId, setSessionId] = useState(localStorage.getItem("session_id"));
   const [input, setInput] = useState("");
   const [messages, setMessages] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const inputRef = useRef(null);
@@ -39,12 +40,28 @@ function App() {
     }
   };
 
+  // History is paginated: load the newest page, older pages on demand
   const loadHistory = async () => {
     try {
       const res = await fetch(`${API_BASE}/history/${sessionId}/`);
       if (res.ok) {
         const data = await res.json();
         setMessages(data.messages.map(m => ({ sender: m.sender, text: m.text })));
+        setOlderCursor(data.prev_cursor);
+      }
+    } catch (err) {
+      console.error("History loading error:", err);
+    }
+  };
+
+  const loadEarlier = async () => {
+    if (!olderCursor) return;
+    try {
+      const res = await fetch(`${API_BASE}/history/${sessionId}/?before=${encodeURIComponent(olderCursor)}`);
+      if (res.ok) {
+        const data = await res.json();
+        setMessages(prev => [...data.messages.map(m => ({ sender: m.sender, text: m.text })), ...prev]);
+        setOlderCursor(data.prev_cursor);
       }
     } catch (err) {
       console.error("History loading error:", err);
@@ -60,28 +77,80 @@ function App() {
     setError(null);
 
     try {
-      const res = await fetch(`${API_BASE}/message/`, {
+      // Stream the reply (Server-Sent Events) so routing and text show up as soon as they exist
+      const res = await fetch(`${API_BASE}/message/stream/`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ session_id: sessionId, text: input }),
       });
-      
-      const data = await res.json();
-      setLoading(false);
 
-      if (res.ok) {
-        setMessages(prev => [...prev, { sender: data.agent, text: data.text }]);
-        setInput("");
-        // Focus the input field after agent response
-        setTimeout(() => {
-          if (inputRef.current) {
-            inputRef.current.focus();
-          }
-        }, 100);
-      } else {
+      if (!res.ok || !res.body) {
+        const data = await res.json();
+        setLoading(false);
         setMessages(prev => [...prev, { sender: "System", text: data.error || "Unknown error" }]);
         setError(data.error || "Failed to send message");
+        return;
+      }
+
+      // Replace the last (streaming) agent message
+      const updateReply = (reply) => {
+        setMessages(prev => [...prev.slice(0, -1), { ...prev[prev.length - 1], ...reply }]);
+      };
+
+      const handleEvent = (event, data) => {
+        if (event === "routing") {
+          setLoading(false);
+          setMessages(prev => [...prev, { sender: data.agent, text: "" }]);
+        } else if (event === "delta") {
+          setMessages(prev => {
+            const last = prev[prev.length - 1];
+            return [...prev.slice(0, -1), { ...last, text: last.text + data.text }];
+          });
+        } else if (event === "done") {
+          updateReply({ sender: data.agent, text: data.text });
+        } else if (event === "busy") {
+          // Not stored on the server: show it in place of the reply so the user can resend
+          updateReply({ sender: "System", text: data.error });
+          setError(`${data.error} (retry in ${data.retry_after}s)`);
+        } else if (event === "error") {
+          if (data.text) {
+            updateReply({ sender: data.agent, text: data.text });
+          } else {
+            setMessages(prev => [...prev, { sender: "System", text: data.error || "Unknown error" }]);
+            setError(data.error || "Failed to send message");
+          }
+        }
+      };
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+          const frame = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          let event = "message";
+          let data = "";
+          for (const line of frame.split("\n")) {
+            if (line.startsWith("event: ")) event = line.slice(7);
+            else if (line.startsWith("data: ")) data += line.slice(6);
+          }
+          if (data) handleEvent(event, JSON.parse(data));
+        }
       }
+
+      setLoading(false);
+      setInput("");
+      // Focus the input field after agent response
+      setTimeout(() => {
+        if (inputRef.current) {
+          inputRef.current.focus();
+        }
+      }, 100);
     } catch (err) {
       setLoading(false);
       setError("Failed to send message. Please check if the backend is running.");
@@ -101,6 +170,7 @@ function App() {
       setSessionId(data.session_id);
       localStorage.setItem("session_id", data.session_id);
       setMessages([]);
+      setOlderCursor(null);
       setError(null);
       // Focus input after clearing chat
       setTimeout(() => {
@@ -208,6 +278,12 @@ function App() {
           </aside>
 
           <div className="messages-container">
+          {olderCursor && (
+            <button className="load-earlier" onClick={loadEarlier}>
+              Load earlier messages
+            </button>
+          )}
+
           {messages.length === 0 && !loading && (
             <div className="welcome-message">
               <h3>Welcome to Ask UNE! 👋</h3>
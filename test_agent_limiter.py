@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Checks the agent concurrency limiter without any LLM calls: per-agent quotas, priority
+order of waiters, 429 when the wait queue is full and 503 when a waiter times out.
+"""
+
+import os
+import sys
+import asyncio
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+django.setup()
+
+from chat.limiter import AgentLimiter, LimiterBusy
+
+POET, ADVISOR, ROUTER = "University Poet", "Course Advisor", "Router Agent"
+
+
+async def _started(task):
+    # Let the task run up to its first await (it is then waiting in the queue)
+    for _ in range(3):
+        await asyncio.sleep(0)
+    return task
+
+
+def test_quota_does_not_block_other_agents():
+    async def run():
+        limiter = AgentLimiter(max_concurrency=4, quotas={POET: 1})
+        await limiter.acquire(POET)
+        second_poet = await _started(asyncio.create_task(limiter.acquire(POET)))
+        assert not second_poet.done(), "the poet quota is 1"
+
+        # Another agent gets a slot although a poet is waiting
+        await asyncio.wait_for(limiter.acquire(ADVISOR), 1)
+        assert limiter.stats()["active"] == {POET: 1, ADVISOR: 1}
+
+        limiter.release(POET, 0.1)
+        await asyncio.wait_for(second_poet, 1)
+        assert limiter.stats()["active"] == {POET: 1, ADVISOR: 1}
+    asyncio.run(run())
+
+
+def test_waiters_run_in_priority_order():
+    async def run():
+        limiter = AgentLimiter(max_concurrency=1, priorities={ROUTER: 0, POET: 5})
+        await limiter.acquire(ADVISOR)
+        order = []
+
+        async def wait(agent):
+            await limiter.acquire(agent)
+            order.append(agent)
+
+        poet = await _started(asyncio.create_task(wait(POET)))
+        router = await _started(asyncio.create_task(wait(ROUTER)))
+        limiter.release(ADVISOR, 0.1)
+        await asyncio.wait_for(router, 1)
+        assert order == [ROUTER] and not poet.done(), "the router queued later but has priority"
+        limiter.release(ROUTER, 0.1)
+        await asyncio.wait_for(poet, 1)
+        assert order == [ROUTER, POET]
+    asyncio.run(run())
+
+
+def test_full_queue_answers_429():
+    async def run():
+        limiter = AgentLimiter(max_concurrency=1, queue_size=2, queue_timeout=5)
+        await limiter.acquire(ADVISOR)
+        waiters = [await _started(asyncio.create_task(limiter.acquire(ADVISOR))) for _ in range(2)]
+        assert limiter.saturated()
+        try:
+            await limiter.acquire(ADVISOR)
+        except LimiterBusy as e:
+            assert e.status == 429 and e.retry_after >= 1
+        else:
+            raise AssertionError("a full queue must reject new waiters")
+        assert limiter.stats()["rejected_queue_full"] == 1
+
+        # Queued waiters still get their turn
+        for waiter in waiters:
+            limiter.release(ADVISOR, 0.1)
+            await asyncio.wait_for(waiter, 1)
+        assert not limiter.saturated()
+    asyncio.run(run())
+
+
+def test_wait_timeout_answers_503():
+    async def run():
+        limiter = AgentLimiter(max_concurrency=1, queue_timeout=0.05)
+        await limiter.acquire(ADVISOR)
+        try:
+            await limiter.acquire(POET)
+        except LimiterBusy as e:
+            assert e.status == 503
+        else:
+            raise AssertionError("a waiter without a slot must time out")
+        stats = limiter.stats()
+        assert stats["queue_depth"] == 0 and stats["rejected_wait_timeout"] == 1
+
+        # The timed-out waiter left no trace: the slot goes straight to the next caller
+        limiter.release(ADVISOR, 0.1)
+        await asyncio.wait_for(limiter.acquire(POET), 1)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_quota_does_not_block_other_agents()
+    test_waiters_run_in_priority_order()
+    test_full_queue_answers_429()
+    test_wait_timeout_answers_503()
+    print("✅ AgentLimiter enforces quotas and priorities and answers 429/503 when busy")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Checks that the compiled keyword matcher finds every keyword on word boundaries in one
+pass, including keywords nested in longer ones and keywords shared by several categories.
+"""
+
+import os
+import re
+import sys
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+from chat.routing import KeywordMatcher
+
+RULES = {
+    "schedule": ["when", "when is", "exam", "final exam"],
+    "follow_up": ["that", "that course", "what about"],
+    "course": ["course", "exam"],
+}
+
+
+def hits(matcher, text):
+    return sorted((m.category, m.keyword, m.start, m.end) for m in matcher.scan(text))
+
+
+def test_nested_keywords():
+    matcher = KeywordMatcher(RULES)
+    assert hits(matcher, "When is that course final exam?") == [
+        ("course", "course", 13, 19),
+        ("course", "exam", 26, 30),
+        ("follow_up", "that", 8, 12),
+        ("follow_up", "that course", 8, 19),
+        ("schedule", "exam", 26, 30),
+        ("schedule", "final exam", 20, 30),
+        ("schedule", "when", 0, 4),
+        ("schedule", "when is", 0, 7),
+    ]
+
+
+def test_word_boundaries():
+    matcher = KeywordMatcher(RULES)
+    # No hits inside longer words, and a prefix keyword needs a boundary after it
+    assert hits(matcher, "whenever thatcher examined courses") == []
+    assert hits(matcher, "when island") == [("schedule", "when", 0, 4)]
+
+
+def test_matches_plain_substring_search():
+    """Every keyword hit agrees with a naive per-keyword word-boundary search."""
+    matcher = KeywordMatcher(RULES)
+    text = "what about that course? when is the final exam, when is the exam"
+    expected = sorted(
+        (category, keyword, m.start(), m.end())
+        for category, keywords in RULES.items()
+        for keyword in keywords
+        for m in re.finditer(r"(?<!\w)" + re.escape(keyword) + r"(?!\w)", text)
+    )
+    assert hits(matcher, text) == expected
+
+
+def test_empty_rules():
+    assert KeywordMatcher({}).scan("anything") == []
+
+
+if __name__ == "__main__":
+    test_nested_keywords()
+    test_word_boundaries()
+    test_matches_plain_substring_search()
+    test_empty_rules()
+    print("✅ KeywordMatcher finds nested keywords on word boundaries")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Checks that structured schedule questions are answered locally from the demo calendar,
+one per supported fact, and that messages which mention a course and a schedule fact
+without asking for it are not, so they still reach the Router Agent and the specialists.
+"""
+
+import os
+import sys
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+
+# Run on Django's test database (created once per process), never the development one:
+# until a catalog is imported it serves the demo courses and schedules
+if not connection.settings_dict["NAME"].startswith("file:memorydb"):
+    connection.creation.create_test_db(verbosity=0)
+
+from chat.local_answers import LOCAL_ANSWER_AGENT, detect_intent, local_answer
+
+NOTE = "Dates and rooms are subject to change, so check with your instructor."
+
+# (message, intent, answer without the note), one per field and template
+LOOKUPS = [
+    ("When is the CS320 final?", {"code": "CS320", "field": "final"},
+     "The CS320 (Intro to Machine Learning) final exam is on Thursday, December 12, 2024."),
+    ("When is the cs 320 midterm?", {"code": "CS320", "field": "midterm"},
+     "The CS320 (Intro to Machine Learning) midterm exam is on Tuesday, October 15, 2024."),
+    ("When does CS320 start?", {"code": "CS320", "field": "start"},
+     "CS320 (Intro to Machine Learning) starts on Tuesday, September 3, 2024."),
+    ("When does CS320 end?", {"code": "CS320", "field": "end"},
+     "CS320 (Intro to Machine Learning) ends on Sunday, December 15, 2024."),
+    ("Where does CS320 meet?", {"code": "CS320", "field": "location"},
+     "CS320 (Intro to Machine Learning) meets in Science Building 201."),
+    ("What room is STAT-210 in?", {"code": "STAT210", "field": "location"},
+     "STAT210 (Applied Statistics) meets in Math Building 105."),
+    ("What time does CS320 meet?", {"code": "CS320", "field": "times"},
+     "CS320 (Intro to Machine Learning) meets MWF 10:00-11:00 AM."),
+    # CS499 has presentations instead of exams
+    ("When is the CS499 final?", {"code": "CS499", "field": "final"},
+     "CS499 (Data Science Capstone) has a final presentation instead of an exam, on Tuesday, December 10, 2024."),
+    ("When is the CS499 midterm?", {"code": "CS499", "field": "midterm"},
+     "CS499 (Data Science Capstone) has a midterm presentation instead of an exam, on Friday, November 1, 2024."),
+]
+
+NOT_LOOKUPS = [
+    "Write me a haiku about the CS320 final",
+    "Compose a poem about where CS320 meets",
+    "Write a poem about when the CS320 final is",
+    "Is the CS320 final hard?",
+    "Can I skip the CS320 final?",
+    "CS320 final grades",
+    "The CS320 midterm was brutal",
+    "Should I worry about when the CS320 final is?",
+]
+
+
+def test_lookups_are_answered_locally():
+    for text, intent, answer in LOOKUPS:
+        assert detect_intent(text) == intent, f"'{text}' should be detected as {intent}"
+        result = local_answer(text)
+        assert result is not None, f"'{text}' should be answered locally"
+        assert result["agent"] == LOCAL_ANSWER_AGENT and result["intent"] == intent
+        assert result["text"] == f"{answer} {NOTE}"
+
+
+def test_not_lookups_fall_through():
+    for text in NOT_LOOKUPS:
+        assert detect_intent(text) is None, f"'{text}' should go to the agents, not a local answer"
+
+
+if __name__ == "__main__":
+    test_lookups_are_answered_locally()
+    test_not_lookups_fall_through()
+    print(f"✅ {len(LOOKUPS)} schedule lookups are answered locally and {len(NOT_LOOKUPS)} other messages "
+          f"fall through to the agents")
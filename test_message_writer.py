@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Checks the write-behind MessageWriter against a database: a failed batch is retried
+turn by turn, a turn that keeps failing is dropped and reported for its session only,
+a full queue refuses new turns, stop() flushes what is queued, and a session's reader
+never sees fewer rows than were acknowledged.
+"""
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+django.setup()
+
+from django.db import OperationalError, connection
+
+# Run on Django's test database (created once per process), never the development one
+if not connection.settings_dict["NAME"].startswith("file:memorydb"):
+    connection.creation.create_test_db(verbosity=0)
+
+from chat import persistence
+from chat.models import Message, Session
+from chat.persistence import MessageWriter
+
+
+def make_turn(session, text):
+    return [Message(session=session, sender="user", text=text),
+            Message(session=session, sender="Course Advisor", text=f"re: {text}")]
+
+
+def stored(session):
+    return list(Message.objects.filter(session=session).order_by("id").values_list("text", flat=True))
+
+
+@contextmanager
+def failing_writes(should_fail):
+    """Make write_messages() raise whenever should_fail(messages) is true."""
+    write_messages = persistence.write_messages
+
+    def write(messages):
+        if should_fail(messages):
+            raise RuntimeError("database is locked")
+        return write_messages(messages)
+
+    persistence.write_messages = write
+    try:
+        yield
+    finally:
+        persistence.write_messages = write_messages
+
+
+def test_failed_batch_is_retried():
+    session = Session.objects.create()
+    writer = MessageWriter(batch_size=10, flush_interval=0.2)
+    calls = []
+
+    def fail_twice(messages):
+        calls.append(len(messages))
+        return len(calls) <= 2
+
+    written = []
+    with failing_writes(fail_twice):
+        for i in range(3):
+            assert writer.submit(session.id, make_turn(session, f"turn {i}"), on_written=written.append)
+        assert writer.wait_for_session(session.id, timeout=10)
+        writer.stop()
+
+    # The batch failed as a whole, then the first turn failed once more and was retried
+    assert calls[0] == 6 and calls[1:] == [2, 2, 2, 2]
+    assert stored(session) == [text for i in range(3) for text in (f"turn {i}", f"re: turn {i}")]
+    assert len(written) == 3 and all(m.pk is not None for turn in written for m in turn)
+    assert writer.take_failure(session.id) is None
+    assert writer.counts["rows_written"] == 6 and writer.counts["rows_dropped"] == 0
+
+
+def test_dropped_turn_is_reported_for_its_session():
+    good, bad = Session.objects.create(), Session.objects.create()
+    writer = MessageWriter(batch_size=10, flush_interval=0.2)
+    dropped = []
+    with failing_writes(lambda messages: any(m.session_id == bad.id for m in messages)):
+        assert writer.submit(good.id, make_turn(good, "kept"))
+        assert writer.submit(bad.id, make_turn(bad, "lost"), on_failed=dropped.append)
+        assert writer.submit(good.id, make_turn(good, "kept too"))
+        assert writer.flush(timeout=10)
+        writer.stop()
+
+    # One bad turn does not take the rest of the batch with it
+    assert stored(good) == ["kept", "re: kept", "kept too", "re: kept too"]
+    assert stored(bad) == []
+    assert len(dropped) == 1 and all(m.pk is None for m in dropped[0])
+    assert "database is locked" in writer.take_failure(bad.id)
+    assert writer.take_failure(bad.id) is None, "a failure is reported once"
+    assert writer.take_failure(good.id) is None
+    assert writer.stats()["rows_dropped"] == 2
+
+
+def test_full_queue_refuses_turns():
+    session = Session.objects.create()
+    writer = MessageWriter(maxsize=1, batch_size=1, flush_interval=0)
+    writing, release = threading.Event(), threading.Event()
+
+    def hold(messages):
+        writing.set()
+        assert release.wait(10)
+        return False
+
+    with failing_writes(hold):
+        assert writer.submit(session.id, make_turn(session, "being written"))
+        assert writing.wait(10)
+        assert writer.submit(session.id, make_turn(session, "queued"))
+        # The caller writes this one itself; it is not counted as pending
+        assert not writer.submit(session.id, make_turn(session, "refused"))
+        assert writer.pending(session.id) == 4 and writer.counts["queue_full"] == 1
+        release.set()
+        assert writer.wait_for_session(session.id, timeout=10)
+        writer.stop()
+    assert stored(session) == ["being written", "re: being written", "queued", "re: queued"]
+
+
+def test_stop_flushes_queued_turns():
+    session = Session.objects.create()
+    # A flush interval longer than the test: only stop() gets the batch written
+    writer = MessageWriter(batch_size=100, flush_interval=60)
+    for i in range(5):
+        assert writer.submit(session.id, make_turn(session, f"turn {i}"))
+    writer.stop()
+    assert len(stored(session)) == 10 and writer.pending(session.id) == 0
+    assert not writer.submit(session.id, make_turn(session, "late")), "a stopped writer refuses turns"
+
+
+def count_rows(session):
+    # The test database is in-memory SQLite in shared-cache mode, where a read that
+    # meets the writer thread's open transaction fails at once instead of waiting
+    for _ in range(100):
+        try:
+            return Message.objects.filter(session=session).count()
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            time.sleep(0.01)
+    raise AssertionError("the messages table stayed locked")
+
+
+def test_reader_never_sees_fewer_rows_than_acknowledged():
+    sessions = [Session.objects.create() for _ in range(4)]
+    writer = MessageWriter(batch_size=5, flush_interval=0.01)
+    acknowledged = {session.id: 0 for session in sessions}
+    short_reads = []
+
+    def client(session):
+        for i in range(15):
+            turn = make_turn(session, f"turn {i}")
+            assert writer.submit(session.id, turn)
+            acknowledged[session.id] += len(turn)
+            assert writer.wait_for_session(session.id, timeout=10)
+            rows = count_rows(session)
+            if rows < acknowledged[session.id]:
+                short_reads.append((session.id, rows, acknowledged[session.id]))
+
+    # Fail every third write so some turns go through the retry path
+    writes = []
+    with failing_writes(lambda messages: writes.append(1) or len(writes) % 3 == 0):
+        threads = [threading.Thread(target=client, args=(session,)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        writer.stop()
+
+    assert short_reads == []
+    for session in sessions:
+        assert len(stored(session)) == acknowledged[session.id] == 30
+        assert writer.take_failure(session.id) is None
+
+
+if __name__ == "__main__":
+    test_failed_batch_is_retried()
+    test_dropped_turn_is_reported_for_its_session()
+    test_full_queue_refuses_turns()
+    test_stop_flushes_queued_turns()
+    test_reader_never_sees_fewer_rows_than_acknowledged()
+    print("✅ MessageWriter retries failed batches, reports dropped turns and never loses acknowledged rows")
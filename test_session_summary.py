@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Checks that summary compaction folds every unsummarized turn, including turns that fell
+out of the session state's window before compaction first ran, so none of them is lost
+from the agents' context.
+"""
+
+import os
+import sys
+import asyncio
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# chat.views imports the agents module, which needs a key; no model is called here
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test import override_settings
+
+# Run on Django's test database (created once per process), never the development one
+if not connection.settings_dict["NAME"].startswith("file:memorydb"):
+    connection.creation.create_test_db(verbosity=0)
+
+from chat import session_state
+from chat.models import Message, Session
+from chat.views import _compact_history
+
+TURNS = 12
+
+
+def make_session():
+    session = Session.objects.create()
+    for i in range(TURNS):
+        sender = "user" if i % 2 == 0 else "Course Advisor"
+        Message.objects.create(session=session, sender=sender, text=f"turn {i}")
+        if sender != "user":
+            Message.objects.create(session=session, sender="tool", text="{}")
+    return session
+
+
+@override_settings(SESSION_STATE_WINDOW=4, CONVERSATION_SUMMARY_THRESHOLD=3, CONVERSATION_SUMMARY_KEEP_RECENT=2,
+                   CONVERSATION_SUMMARIZER="chat.context.extractive_summarizer")
+def test_evicted_turns_are_folded():
+    session = make_session()
+    state = asyncio.run(session_state.build_state(session))
+    # The summary was off while the session grew: most turns are outside the window
+    assert len(state["messages"]) == 4 and state["evicted"] == TURNS - 4
+
+    asyncio.run(_compact_history(session, state))
+
+    session.refresh_from_db()
+    summary = session.metadata["summary"]
+    assert summary["turns"] == TURNS - 2
+    for i in range(TURNS - 2):
+        assert f"turn {i}" in summary["text"], f"turn {i} was dropped instead of summarized"
+    kept = list(session.messages.exclude(sender="tool").filter(id__gt=summary["through_id"])
+                .order_by("id").values_list("text", flat=True))
+    assert kept == [f"turn {i}" for i in range(TURNS - 2, TURNS)]
+
+
+if __name__ == "__main__":
+    test_evicted_turns_are_folded()
+    print("✅ Turns that fell out of the window are folded into the session summary")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Checks SingleFlight: concurrent callers with the same key share one call, its error
+reaches every one of them, one caller's cancellation does not cancel it for the
+others, and the key is released once the call finishes.
+"""
+
+import os
+import sys
+import asyncio
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+from chat.cache import SingleFlight
+
+CALLERS = 5
+
+
+class Call:
+    """A call that finishes when released, counting how often it was started."""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.started = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.started += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+async def _started(tasks):
+    # Let the callers run up to their first await (they then wait on the shared call)
+    for _ in range(3):
+        await asyncio.sleep(0)
+    return tasks
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight = SingleFlight("test")
+        call, other = Call(result="answer"), Call(result="other answer")
+        callers = await _started([asyncio.create_task(flight.do("key", call)) for _ in range(CALLERS)])
+        other_caller = await _started(asyncio.create_task(flight.do("other key", other)))
+        assert flight.stats()["in_flight"] == 2
+
+        call.release.set()
+        other.release.set()
+        assert await asyncio.gather(*callers) == ["answer"] * CALLERS
+        assert await other_caller == "other answer"
+        assert call.started == 1 and other.started == 1, "a key's call runs once, other keys run their own"
+        stats = flight.stats()
+        assert stats["calls"] == 2 and stats["coalesced"] == CALLERS - 1
+    asyncio.run(run())
+
+
+def test_error_reaches_every_caller():
+    async def run():
+        flight = SingleFlight("test")
+        call = Call(error=ValueError("router failed"))
+        callers = await _started([asyncio.create_task(flight.do("key", call)) for _ in range(CALLERS)])
+        call.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert call.started == 1
+        assert all(isinstance(r, ValueError) and str(r) == "router failed" for r in results), results
+    asyncio.run(run())
+
+
+def test_key_is_released_after_the_call():
+    async def run():
+        flight = SingleFlight("test")
+        failing = Call(error=ValueError("router failed"))
+        failing.release.set()
+        try:
+            await flight.do("key", failing)
+        except ValueError:
+            pass
+        assert flight.stats()["in_flight"] == 0, "a failed call keeps its key"
+
+        # Nothing is kept: the next caller runs a fresh call, and so does the one after it
+        for result in ("first", "second"):
+            call = Call(result=result)
+            call.release.set()
+            assert await flight.do("key", call) == result
+            assert call.started == 1 and flight.stats()["in_flight"] == 0
+        assert flight.stats()["calls"] == 3 and flight.stats()["coalesced"] == 0
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def run():
+        flight = SingleFlight("test")
+        call = Call(result="answer")
+        first, second = await _started([asyncio.create_task(flight.do("key", call)) for _ in range(2)])
+        first.cancel()
+        await asyncio.sleep(0)
+        call.release.set()
+        assert await second == "answer"
+        assert first.cancelled() and call.started == 1
+        assert flight.stats()["in_flight"] == 0
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_concurrent_callers_share_one_call()
+    test_error_reaches_every_caller()
+    test_key_is_released_after_the_call()
+    test_cancelled_caller_does_not_cancel_the_others()
+    print(f"✅ SingleFlight runs a key's call once for {CALLERS} concurrent callers and releases the key after it")
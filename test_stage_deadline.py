@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Checks run_stage without any LLM calls: a call that outlives its timeout raises
+TimeoutError (and the Router Agent then falls back to keyword routing), and a hedged
+second attempt wins over a stalled first one, with the losing attempt cancelled.
+"""
+
+import os
+import sys
+import asyncio
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# agents_integration needs a key at import; no model is called here
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+
+import django
+django.setup()
+
+from django.test import override_settings
+
+from chat import agents_integration
+from chat.deadline import Deadline, run_stage, stage_timer
+
+
+class Call:
+    """An attempt that returns `result` after `delay` seconds (None: never) and records how it ended."""
+
+    def __init__(self, result, delay):
+        self.result = result
+        self.delay = delay
+        self.outcome = "running"
+
+    async def __call__(self):
+        try:
+            if self.delay is None:
+                await asyncio.Event().wait()
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.outcome = "cancelled"
+            raise
+        self.outcome = "finished"
+        return self.result
+
+
+def attempts(*calls):
+    """make_call for run_stage: each call starts the next attempt."""
+    pending = list(calls)
+    return lambda: pending.pop(0)()
+
+
+async def _settle():
+    # Let cancelled attempts run their except clauses
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_slow_call_times_out():
+    async def run():
+        slow = Call("late", delay=5)
+        try:
+            await run_stage("test_timeout", attempts(slow), timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            raise AssertionError("a call slower than its timeout must raise TimeoutError")
+        await _settle()
+        assert slow.outcome == "cancelled", "the timed-out call keeps running"
+        assert stage_timer.counts["test_timeout_timeouts"] == 1
+    asyncio.run(run())
+
+
+def test_router_timeout_falls_back_to_keyword_routing():
+    calls = []
+
+    async def stalled_router(agent, input_messages):
+        calls.append(agent.name)
+        await asyncio.sleep(5)
+
+    user_text = "what courses are there about machine learning"
+    run_agent = agents_integration.run_agent
+    agents_integration.run_agent = stalled_router
+    try:
+        # Threshold above any confidence, so the Router Agent is always asked
+        with override_settings(ROUTER_TIMEOUT=0.05, ROUTER_FAST_PATH_THRESHOLD=2, AGENT_HEDGE_PERCENTILE=0):
+            routing = asyncio.run(agents_integration.choose_agent(
+                [], user_text, [{"role": "user", "content": user_text}], deadline=Deadline(0)))
+    finally:
+        agents_integration.run_agent = run_agent
+
+    assert calls == ["Router Agent"]
+    assert routing["path"] == "fallback" and routing["timed_out"] == ["router"]
+    assert routing["agent"] == agents_integration.determine_target_agent(user_text, [])
+
+
+def test_hedged_call_wins_over_stalled_call():
+    async def run():
+        stalled, hedge = Call("first", delay=None), Call("second", delay=0.01)
+        result = await run_stage("test_hedge", attempts(stalled, hedge), timeout=5, hedge_after=0.05)
+        await _settle()
+        assert result == "second"
+        assert stalled.outcome == "cancelled", "the losing attempt keeps running"
+        assert stage_timer.counts["test_hedge_hedges"] == 1 and stage_timer.counts["test_hedge_hedges_won"] == 1
+    asyncio.run(run())
+
+
+def test_first_call_wins_over_late_hedge():
+    async def run():
+        first, hedge = Call("first", delay=0.1), Call("second", delay=5)
+        result = await run_stage("test_hedge_lost", attempts(first, hedge), timeout=5, hedge_after=0.02)
+        await _settle()
+        assert result == "first"
+        assert hedge.outcome == "cancelled", "the losing attempt keeps running"
+        assert stage_timer.counts["test_hedge_lost_hedges_lost"] == 1
+    asyncio.run(run())
+
+
+def test_hedge_and_first_call_both_time_out():
+    async def run():
+        first, hedge = Call("first", delay=None), Call("second", delay=None)
+        try:
+            await run_stage("test_hedge_timeout", attempts(first, hedge), timeout=0.1, hedge_after=0.02)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            raise AssertionError("run_stage must time out when no attempt finishes")
+        await _settle()
+        assert first.outcome == hedge.outcome == "cancelled"
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_slow_call_times_out()
+    test_router_timeout_falls_back_to_keyword_routing()
+    test_hedged_call_wins_over_stalled_call()
+    test_first_call_wins_over_late_hedge()
+    test_hedge_and_first_call_both_time_out()
+    print("✅ run_stage times out slow calls and cancels the losing hedged attempt")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Checks that StreamingFormatter produces exactly what clean_agent_output produces for the
+whole reply, however the reply is split into chunks.
+"""
+
+import os
+import sys
+import random
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'uni_agents', 'backend'))
+
+from chat.formatting import clean_agent_output, format_stream
+
+REPLIES = [
+    "Here are some options: 1. **CS101** Intro. 2. **CS201** Data structures. Would you like more?",
+    "  Line one\\nLine two\\n\\n\\n\\nLine three\\t(tab) and a quote \\\"x\\\" and a backslash \\\\n.  ",
+    '"A quoted reply.\\nDo you need anything else?"',
+    "The final exam is on 2024-12-12. 3. **Study** early. Is there anything else?\n\n\n\n",
+    "Ends with a held-back prefix 10. *",
+    "Trailing period.",
+    "",
+]
+
+
+def chunkings(text, rng):
+    """Single characters, every split point, and random chunk sizes."""
+    yield list(text)
+    for i in range(len(text) + 1):
+        yield [text[:i], text[i:]]
+    for _ in range(50):
+        chunks, pos = [], 0
+        while pos < len(text):
+            size = rng.randint(1, 8)
+            chunks.append(text[pos:pos + size])
+            pos += size
+        yield chunks
+
+
+def test_any_chunking_matches_clean_agent_output():
+    rng = random.Random(0)
+    for reply in REPLIES:
+        expected = clean_agent_output(reply)
+        for chunks in chunkings(reply, rng):
+            assert format_stream(chunks) == expected, f"{chunks!r} formatted differently"
+
+
+if __name__ == "__main__":
+    test_any_chunking_matches_clean_agent_output()
+    print(f"✅ Streamed formatting matches clean_agent_output for {len(REPLIES)} replies under every chunking")
@@ -0,0 +1,13 @@
+"""
+ASGI entry point. Serve with an ASGI server so the async chat views share one event
+loop per worker, e.g.:
+
+    uvicorn backend.asgi:application --workers 4
+"""
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+application = get_asgi_application()
@@ -49,12 +49,59 @@ TEMPLATES = [
     },
 ]
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Database profile, chosen with DB_ENGINE:
+#   sqlite      local file (DB_NAME, default db.sqlite3); the PRAGMAs in SQLITE_PRAGMAS are
+#               applied to every new connection (see chat.apps). WAL lets readers run alongside
+#               the writer, and busy_timeout makes concurrent writers wait instead of failing.
+#   postgresql  DB_NAME/DB_USER/DB_PASSWORD/DB_HOST/DB_PORT; connections can be pooled with
+#               DB_POOL_MAX_SIZE > 0 (psycopg 3, Django 5.1+, the way to reuse them under ASGI).
+# Persistent connections (kept open DB_CONN_MAX_AGE seconds) are off by default: the app runs
+# under ASGI, where each async request's queries may run on a different thread and leave a
+# connection behind, so Django recommends CONN_MAX_AGE = 0 there. Only raise it under WSGI.
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "0"))
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("DB_NAME", "uni_agents"),
+            "USER": os.getenv("DB_USER", ""),
+            "PASSWORD": os.getenv("DB_PASSWORD", ""),
+            "HOST": os.getenv("DB_HOST", "localhost"),
+            "PORT": os.getenv("DB_PORT", "5432"),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+    if DB_POOL_MAX_SIZE:
+        # The pool replaces persistent connections; Django requires CONN_MAX_AGE = 0 with it
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": DB_POOL_MAX_SIZE,
+        }
+elif DB_ENGINE == "sqlite":
+    SQLITE_PRAGMAS = {
+        "journal_mode": os.getenv("DB_SQLITE_JOURNAL_MODE", "wal"),
+        "synchronous": os.getenv("DB_SQLITE_SYNCHRONOUS", "normal"),
+        "busy_timeout": int(os.getenv("DB_SQLITE_BUSY_TIMEOUT", "5000")),  # milliseconds
+    }
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("DB_NAME", str(BASE_DIR / "db.sqlite3")),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "OPTIONS": {
+                # sqlite3 module lock timeout (seconds), kept in line with busy_timeout
+                "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+            },
+        }
     }
-}
+else:
+    raise ValueError(f"Unknown DB_ENGINE '{DB_ENGINE}'. Expected 'sqlite' or 'postgresql'.")
 
 
 STATIC_URL = "/static/"
@@ -63,3 +110,123 @@ STATIC_URL = "/static/"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     print("Warning: OPENAI_API_KEY not set. Set it in environment before running agents.")
+
+# HTTP connection pool of the worker's shared OpenAI client (chat.agent_loop). Connections are
+# kept alive for OPENAI_KEEPALIVE_EXPIRY seconds, so consecutive messages skip TCP/TLS setup.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# Routing: keyword classifier confidence at or above which the Router Agent LLM call is skipped.
+# Set above 1.0 to always consult the Router Agent.
+ROUTER_FAST_PATH_THRESHOLD = float(os.getenv("ROUTER_FAST_PATH_THRESHOLD", "0.7"))
+
+# Structured schedule questions (a course code plus final, midterm, start, end, location or
+# times) are answered from the calendar data without any LLM call.
+LOCAL_ANSWERS_ENABLED = os.getenv("LOCAL_ANSWERS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Speculative specialist: when the Router Agent is consulted, start the keyword router's pick at
+# the same time and keep its reply if the Router Agent agrees (cancelled otherwise). Saves the
+# router's latency on hits at the cost of wasted tokens on misses. Non-streaming replies only.
+SPECULATIVE_SPECIALIST = os.getenv("SPECULATIVE_SPECIALIST", "false").lower() in ("1", "true", "yes")
+
+# Time budget per message (seconds, 0 disables) shared by the Router Agent and the specialist.
+# The Router Agent gets at most ROUTER_TIMEOUT of it and falls back to keyword routing when
+# it runs out; a specialist that runs out gets the generic reply instead of a second LLM call.
+# With AGENT_HEDGE_PERCENTILE (e.g. 95; 0 disables), a call in one of AGENT_HEDGE_STAGES that
+# is slower than that percentile of the stage's recent latencies (after AGENT_HEDGE_MIN_SAMPLES
+# calls) gets a second attempt; the first to answer wins.
+AGENT_REQUEST_DEADLINE = float(os.getenv("AGENT_REQUEST_DEADLINE", "60"))
+ROUTER_TIMEOUT = float(os.getenv("ROUTER_TIMEOUT", "8"))
+AGENT_HEDGE_PERCENTILE = float(os.getenv("AGENT_HEDGE_PERCENTILE", "0"))
+AGENT_HEDGE_STAGES = [s.strip() for s in os.getenv("AGENT_HEDGE_STAGES", "router").split(",") if s.strip()]
+AGENT_HEDGE_MIN_SAMPLES = int(os.getenv("AGENT_HEDGE_MIN_SAMPLES", "20"))
+
+
+def _agent_numbers(value: str) -> dict:
+    """Parse "Agent Name=N,Other Agent=M" into {"Agent Name": N, "Other Agent": M}."""
+    pairs = (item.rsplit("=", 1) for item in value.split(",") if "=" in item)
+    return {name.strip(): int(number) for name, number in pairs}
+
+
+# Concurrent agent runs (LLM calls) per process: at most AGENT_MAX_CONCURRENCY in flight
+# (0 disables the limit) and at most AGENT_CONCURRENCY_QUOTAS[agent] for one agent. Calls
+# over the limit wait in a queue of AGENT_QUEUE_SIZE, served by AGENT_PRIORITIES (lower
+# first, default 1). A full queue answers 429 and a wait over AGENT_QUEUE_TIMEOUT seconds
+# answers 503, both with Retry-After.
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "16"))
+AGENT_CONCURRENCY_QUOTAS = _agent_numbers(os.getenv("AGENT_CONCURRENCY_QUOTAS", "University Poet=2,Conversation Summarizer=2"))
+AGENT_PRIORITIES = _agent_numbers(os.getenv("AGENT_PRIORITIES", "Router Agent=0,University Poet=2,Conversation Summarizer=2"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "64"))
+AGENT_QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT", "10"))
+
+# Agent tool result cache (memoized per tool, keyed on arguments and the catalog version).
+# Set TOOL_CACHE_BACKEND to a CACHES alias to share results between workers.
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "1024"))
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "600"))
+TOOL_CACHE_BACKEND = os.getenv("TOOL_CACHE_BACKEND", "")
+
+# Routing rule-set file shared by the keyword routers. Edits are picked up without a restart;
+# each worker checks the file's mtime at most every ROUTING_RULES_RELOAD_INTERVAL seconds (0 disables).
+ROUTING_RULES_FILE = os.getenv("ROUTING_RULES_FILE", str(BASE_DIR / "chat" / "routing_rules.json"))
+ROUTING_RULES_RELOAD_INTERVAL = float(os.getenv("ROUTING_RULES_RELOAD_INTERVAL", "5"))
+
+# Router Agent decision cache (in-process LRU with TTL). Set ROUTING_CACHE_BACKEND to a
+# CACHES alias to share decisions between workers.
+ROUTING_CACHE_SIZE = int(os.getenv("ROUTING_CACHE_SIZE", "2048"))
+ROUTING_CACHE_TTL = float(os.getenv("ROUTING_CACHE_TTL", "3600"))
+ROUTING_CACHE_BACKEND = os.getenv("ROUTING_CACHE_BACKEND", "")
+
+# History sent to specialist agents: "all", "last_n" (CONTEXT_MAX_TURNS), "token_budget"
+# (CONTEXT_TOKEN_BUDGET) or "pinned" (first turn plus recent turns within both limits).
+CONTEXT_POLICY = os.getenv("CONTEXT_POLICY", "all")
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "20"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Rolling conversation summary: once a session has more than CONVERSATION_SUMMARY_THRESHOLD
+# unsummarized turns (0 disables), all but the last CONVERSATION_SUMMARY_KEEP_RECENT are
+# folded into a summary stored in Session.metadata. CONVERSATION_SUMMARIZER is a dotted path
+# to a callable(previous_summary, turns); "chat.context.extractive_summarizer" is a
+# deterministic local alternative to the LLM summarizer.
+CONVERSATION_SUMMARY_THRESHOLD = int(os.getenv("CONVERSATION_SUMMARY_THRESHOLD", "0"))
+CONVERSATION_SUMMARY_KEEP_RECENT = int(os.getenv("CONVERSATION_SUMMARY_KEEP_RECENT", "6"))
+CONVERSATION_SUMMARIZER = os.getenv("CONVERSATION_SUMMARIZER", "chat.agents_integration.summarize_with_agent")
+
+# The Router Agent sees only the previous agent, previous user message and this many
+# characters of the previous reply, so its prompt size does not grow with the session.
+ROUTER_DIGEST_REPLY_CHARS = int(os.getenv("ROUTER_DIGEST_REPLY_CHARS", "200"))
+
+# Per-session conversation state (last agent, turn count, recent window) cached so a
+# message turn does not reload the transcript. Set SESSION_STATE_BACKEND to a CACHES
+# alias when running several workers so they all see each other's turns. Specialists get
+# their history from this window of SESSION_STATE_WINDOW turns; when older unsummarized
+# turns exist and CONTEXT_POLICY could still send them ("all", "pinned", or limits larger
+# than the window), the full history is read from the database instead.
+SESSION_STATE_WINDOW = int(os.getenv("SESSION_STATE_WINDOW", "40"))
+SESSION_STATE_CACHE_SIZE = int(os.getenv("SESSION_STATE_CACHE_SIZE", "1024"))
+SESSION_STATE_CACHE_TTL = float(os.getenv("SESSION_STATE_CACHE_TTL", "1800"))
+SESSION_STATE_BACKEND = os.getenv("SESSION_STATE_BACKEND", "")
+
+# Session history endpoint page size (default and upper bound for ?limit=)
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+
+# Message persistence: "sync" writes each turn before replying; "write_behind" writes the
+# user message, replies and writes the tool calls and reply in batches from a background
+# thread (history reads still see every acknowledged message, or answer 500 if some were
+# dropped after failed writes). MESSAGE_WRITE_DURABILITY "queued" acknowledges once queued (a crash
+# loses what is still queued); "flushed" waits for the batch commit. A full queue falls back
+# to a synchronous write. Requests that need a session's queued writes committed (history,
+# new messages, flushed acknowledgements) answer 503 after MESSAGE_WRITE_WAIT_TIMEOUT seconds.
+MESSAGE_WRITE_MODE = os.getenv("MESSAGE_WRITE_MODE", "sync")
+MESSAGE_WRITE_DURABILITY = os.getenv("MESSAGE_WRITE_DURABILITY", "queued")
+MESSAGE_WRITE_QUEUE_SIZE = int(os.getenv("MESSAGE_WRITE_QUEUE_SIZE", "1000"))
+MESSAGE_WRITE_BATCH_SIZE = int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "100"))
+MESSAGE_WRITE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_WRITE_FLUSH_INTERVAL", "0.05"))
+MESSAGE_WRITE_WAIT_TIMEOUT = float(os.getenv("MESSAGE_WRITE_WAIT_TIMEOUT", "5"))
+
+# Course catalog and schedules (chat.catalog): served from the database once imported with
+# `manage.py import_catalog`, cached in each worker and reloaded when a newer import has
+# committed. The version is checked at most every CATALOG_RELOAD_INTERVAL seconds.
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "5"))
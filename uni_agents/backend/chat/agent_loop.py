@@ -0,0 +1,130 @@
+import atexit
+import asyncio
+import threading
+import concurrent.futures
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI
+
+_DONE = object()
+
+
+def build_openai_client() -> AsyncOpenAI:
+    """
+    The worker's OpenAI client: one keep-alive httpx pool sized by OPENAI_MAX_CONNECTIONS /
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS, so agent calls reuse TCP/TLS connections instead of
+    opening new ones. API key and base URL come from the environment as usual.
+    """
+    limits = httpx.Limits(
+        max_connections=getattr(settings, "OPENAI_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=getattr(settings, "OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20),
+        keepalive_expiry=getattr(settings, "OPENAI_KEEPALIVE_EXPIRY", 30.0),
+    )
+    timeout = httpx.Timeout(getattr(settings, "OPENAI_TIMEOUT", 60.0), connect=5.0)
+    return AsyncOpenAI(http_client=httpx.AsyncClient(limits=limits), timeout=timeout)
+
+
+class AgentLoop:
+    """
+    One long-lived event loop per process, on a background thread, that every agent
+    run uses. An async HTTP pool belongs to the loop it was opened on: requests served
+    on short-lived loops (runserver runs each async view on a new one) would leave the
+    pool behind and pay for new connections every message. Here the shared client's
+    connections outlive requests whatever server runs the app.
+
+    run() awaits a coroutine on the agent loop from any loop; cancelling the caller
+    cancels it there too. iterate() does the same for an async iterator (a stream).
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="chat-agent-loop", daemon=True)
+                self._thread.start()
+                self._loop = loop
+                atexit.register(self.stop)
+        return self._loop
+
+    async def run(self, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await make_call() on the agent loop (directly if already on it)."""
+        loop = self.loop()
+        if asyncio.get_running_loop() is loop:
+            return await make_call()
+        self.counts["calls"] += 1
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_call(make_call), loop))
+
+    def run_sync(self, make_call: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """Run make_call() on the agent loop from sync code (scripts, management commands)."""
+        self.counts["calls"] += 1
+        return asyncio.run_coroutine_threadsafe(_call(make_call), self.loop()).result(timeout)
+
+    def spawn(self, make_call: Callable[[], Awaitable[Any]]) -> "concurrent.futures.Future":
+        """
+        Start make_call() on the agent loop without waiting for it, for work that should
+        not hold up a response. It outlives the request (and its loop, under runserver).
+        """
+        self.counts["spawned"] += 1
+        return asyncio.run_coroutine_threadsafe(_call(make_call), self.loop())
+
+    def call_soon(self, callback: Callable[[], Any]) -> None:
+        """Run callback() on the agent loop (e.g. to cancel something running there)."""
+        self.loop().call_soon_threadsafe(callback)
+
+    async def iterate(self, make_iterator: Callable[[], Any]) -> AsyncIterator[Any]:
+        """Iterate make_iterator() (an async iterable) on the agent loop, item by item."""
+        iterator = await self.run(lambda: _aiter(make_iterator))
+        try:
+            while True:
+                item = await self.run(lambda: _anext(iterator))
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            # Abandoned early (error, timeout, client gone): close it on its own loop
+            if hasattr(iterator, "aclose"):
+                asyncio.run_coroutine_threadsafe(_close(iterator), self.loop())
+
+    def stop(self) -> None:
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": bool(self._loop and self._loop.is_running()), **self.counts}
+
+
+async def _call(make_call: Callable[[], Awaitable[Any]]) -> Any:
+    return await make_call()
+
+
+async def _aiter(make_iterator: Callable[[], Any]) -> Any:
+    return make_iterator().__aiter__()
+
+
+async def _close(iterator) -> None:
+    try:
+        await iterator.aclose()
+    except Exception as e:
+        print(f"DEBUG - Error closing an agent stream: {e}")
+
+
+async def _anext(iterator) -> Any:
+    # StopAsyncIteration cannot cross the thread boundary as a future's exception
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _DONE
+
+
+agent_loop = AgentLoop()
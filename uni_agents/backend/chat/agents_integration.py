@@ -1,33 +1,76 @@
 import os
 import json
-from typing import Dict, Any, List, Optional
+import time
+import asyncio
+import hashlib
+from collections import Counter
+from typing import Dict, Any, List, Optional, AsyncIterator, Callable
 from dotenv import load_dotenv
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
 
 load_dotenv()
 try:
     # Preferred: official Agents SDK
-    from agents import Agent, Runner, tool, Handoff, function_tool
-    from openai import OpenAI
+    from agents import Agent, Runner, tool, Handoff, function_tool, set_default_openai_client
 except Exception:
     # fallback imports to make errors clear if the package differs
     raise ImportError("Could not import Agents SDK modules. Please ensure you installed the OpenAI Agents SDK per official docs.")
 
 from .tools import course_lookup, academic_calendar
+from .routing import AGENT_NAMES, get_rules, matched_categories, find_last_agent, last_turn_digest, classify_query
+from .cache import SingleFlight, TTLCache, normalize_text, tool_caches
+from .formatting import clean_agent_output, StreamingFormatter
+from .context import apply_context_policy, estimate_tokens
+from .session_state import session_state_cache
+from .persistence import message_writer
+from .local_answers import local_answer
+from .deadline import Deadline, run_stage, stage_timer
+from .limiter import LimiterBusy, agent_limiter
+from .agent_loop import agent_loop, build_openai_client
 
 # OpenAI client (Responses API) - not used directly here, but SDK will use it under the hood
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") 
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY environment variable must be set.")
+# One pooled keep-alive client per worker, used on the agent loop (see chat.agent_loop)
+openai_client = build_openai_client()
+set_default_openai_client(openai_client)
+
+# Identical tool calls already in flight (same tool, same arguments) are shared rather
+# than run again; see also router_flight below
+tool_flight = SingleFlight("tools")
+
+def _run_tool(tool_fn, **kwargs):
+    # Executor threads outlive requests, so recycle stale or broken DB connections the
+    # way Django does around each request
+    close_old_connections()
+    try:
+        return tool_fn(**kwargs)
+    finally:
+        close_old_connections()
+
+async def call_tool(tool_fn, **kwargs):
+    """
+    Run a sync tool on a thread of the agent loop's executor. Tools run on the agent loop,
+    outside any request, so thread_sensitive=True would serialize every tool call of the
+    process on asgiref's single shared thread.
+    """
+    return await sync_to_async(_run_tool, thread_sensitive=False)(tool_fn, **kwargs)
 
-# Example function-tool wrappers so agents can call our local functions
+# Function-tool wrappers so agents can call our local functions. The tools read the
+# catalog from the database, which Django only allows outside the event loop.
 @function_tool
-def tool_course_lookup(topic: str = "data science", level: str = "undergrad", limit: int = 4) -> Dict:
-    return course_lookup(topic=topic, level=level, limit=limit)
+async def tool_course_lookup(topic: str = "data science", level: str = "undergrad", limit: int = 4) -> Dict:
+    key = json.dumps(["course_lookup", topic, level, limit])
+    return await tool_flight.do(key, lambda: call_tool(course_lookup, topic=topic, level=level, limit=limit))
 
 @function_tool
-def tool_academic_calendar(query: str = "") -> Dict:
-    return academic_calendar(query=query)
+async def tool_academic_calendar(query: str = "") -> Dict:
+    key = json.dumps(["academic_calendar", query])
+    return await tool_flight.do(key, lambda: call_tool(academic_calendar, query=query))
 
 # Build specialist agents
 course_advisor_agent = Agent(
@@ -74,58 +117,37 @@ scheduling_agent = Agent(
     model="gpt-4o-mini",
 )
 
-# Router agent - determines which agent should handle the query with conversation context awareness
+# Router agent - determines which agent should handle the query from a short digest of the
+# conversation (previous agent, previous user message, start of the previous reply)
 router_agent = Agent(
     name="Router Agent",
     instructions=(
-        "You are the Router Agent. Your ONLY job is to determine which agent should handle a query. "
-        "You MUST respond with ONLY the exact agent name - nothing else.\n\n"
-
-        "CRITICAL INSTRUCTION: Your response must be EXACTLY one of these four agent names (copy exactly):\n"
+        "You are the Router Agent. Your ONLY job is to decide which agent should handle the current message. "
+        "Respond with EXACTLY one of these agent names and nothing else:\n"
         "Course Advisor\n"
         "University Poet\n"
         "Scheduling Assistant\n"
         "Triage Agent\n\n"
 
-        "DO NOT:\n"
-        "- Provide course recommendations\n"
-        "- Give any advice or information\n"
-        "- Add explanations or additional text\n"
-        "- Use brackets, quotes, or formatting\n"
-        "- Answer the user's question\n\n"
-
-        "ONLY respond with the agent name that should handle the query.\n\n"
-
-        "ROUTING RULES:\n"
-        "- ANY question about courses, classes, academic planning, study, education, majors, degrees, curriculum, credits, prerequisites, electives, subjects, course codes, computer science, data science, AI, machine learning, programming, statistics → Course Advisor\n"
-        "- ANY request for haiku, poetry, verses, creative writing about campus → University Poet\n"
-        "- ANY question about schedules, dates, times, exams, calendar, deadlines, registration → Scheduling Assistant\n"
-        "- General greetings, unclear requests, help requests → Triage Agent\n\n"
-
-        "CONTEXT ANALYSIS: Look at conversation history formatted as '[Agent Name]: response text' to understand what was previously discussed.\n\n"
-
-        "ROUTING PRIORITY:\n"
-        "1. If user asks about courses/education/academic topics → Course Advisor\n"
-        "2. If user asks for poetry/haiku/creative writing → University Poet\n"
-        "3. If user asks about schedules/dates/times → Scheduling Assistant\n"
-        "4. If previous specialist agent responded and current query is a follow-up → same specialist\n"
-        "5. If general greeting or unclear → Triage Agent\n\n"
-
-        "FOLLOW-UP DETECTION:\n"
-        "If you see '[Course Advisor]:' in recent history and user asks 'what about', 'tell me more', 'also', 'and', 'electives', 'prerequisites' → Course Advisor\n"
-        "If you see '[University Poet]:' in recent history and user asks 'write another', 'more poetry', 'another one' → University Poet\n"
-        "If you see '[Scheduling Assistant]:' in recent history and user asks 'when do', 'what about deadlines' → Scheduling Assistant\n\n"
-
-        "EXAMPLES (respond with ONLY the agent name):\n"
-        "User: 'What courses should I take for data science?' → Course Advisor\n"
-        "User: 'undergrad in ML' (after course discussion) → Course Advisor\n"
-        "User: 'What about electives?' (after course discussion) → Course Advisor\n"
-        "User: 'Write me a haiku' → University Poet\n"
-        "User: 'Write another one' (after poetry) → University Poet\n"
-        "User: 'When do exams start?' → Scheduling Assistant\n"
-        "User: 'Hello' → Triage Agent\n\n"
-
-        "REMEMBER: Respond with ONLY the agent name. No explanations, no course advice, no additional text."
+        "Do not answer the question, give advice, explain, or add quotes or formatting.\n\n"
+
+        "ROUTING RULES (in priority order):\n"
+        "1. Courses, classes, academic planning, majors, degrees, credits, prerequisites, electives, course codes, "
+        "computer science, data science, AI, machine learning, programming, statistics → Course Advisor\n"
+        "2. Haiku, poetry, verses, creative writing about campus → University Poet\n"
+        "3. Schedules, dates, times, exams, calendar, deadlines, registration → Scheduling Assistant\n"
+        "4. A follow-up to the previous agent ('what about', 'tell me more', 'also', 'another one') → the previous agent\n"
+        "5. Greetings, unclear or general help requests → Triage Agent\n\n"
+
+        "The input lists the previous agent, the previous user message and the start of the previous reply "
+        "(when there are any), then the current message. An explicit new topic overrides the previous agent.\n\n"
+
+        "EXAMPLES:\n"
+        "'What courses should I take for data science?' → Course Advisor\n"
+        "'What about electives?' (previous agent: Course Advisor) → Course Advisor\n"
+        "'Write another one' (previous agent: University Poet) → University Poet\n"
+        "'When do exams start?' → Scheduling Assistant\n"
+        "'Hello' → Triage Agent"
     ),
     tools=[],
     model="gpt-4o-mini",
@@ -147,223 +169,291 @@ triage_agent = Agent(
     model="gpt-4o-mini",
 )
 
+# Agent name -> agent used to execute the routing decision
+AGENT_MAPPING = {
+    "Course Advisor": course_advisor_agent,
+    "University Poet": university_poet_agent,
+    "Scheduling Assistant": scheduling_agent,
+    "Triage Agent": triage_agent
+}
+
+# Folds older turns into the session's running summary (see CONVERSATION_SUMMARIZER)
+summarizer_agent = Agent(
+    name="Conversation Summarizer",
+    instructions=(
+        "You maintain a running summary of a conversation between a student and the university "
+        "support agents. You are given the current summary and the turns to add to it. "
+        "Reply with the updated summary only: a few short sentences or bullet points covering "
+        "the student's goals, facts they shared (year, major, courses), and answers or "
+        "recommendations already given, noting which agent gave them. Drop small talk."
+    ),
+    tools=[],
+    model="gpt-4o-mini",
+)
+
 # Runner to execute agent runs on demand
 runner = Runner()
 
-def format_agent_response(text: str) -> str:
+async def run_agent(agent, input_messages):
     """
-    Format agent responses for better readability.
+    runner.run() on the agent loop, inside one of the process's agent slots (see
+    chat.limiter). Raises LimiterBusy when no slot is available.
     """
-    if not isinstance(text, str):
-        return str(text)
-
-    # Add proper line breaks after numbered lists
-    import re
+    async with agent_limiter.slot(agent.name):
+        return await agent_loop.run(lambda: runner.run(agent, input_messages))
+
+async def start_streamed(agent, input_messages):
+    # run_streamed() schedules the run on the running loop, so call it on the agent loop
+    return runner.run_streamed(agent, input_messages)
+
+# Router Agent decisions cached by normalized query + last agent. The key carries a digest
+# of the router instructions, so editing them invalidates every cached decision.
+ROUTER_INSTRUCTIONS_DIGEST = hashlib.sha1(router_agent.instructions.encode("utf-8")).hexdigest()[:12]
+routing_cache = TTLCache(
+    "routing",
+    maxsize=getattr(settings, "ROUTING_CACHE_SIZE", 2048),
+    ttl=getattr(settings, "ROUTING_CACHE_TTL", 3600),
+    shared_backend=getattr(settings, "ROUTING_CACHE_BACKEND", ""),
+)
+# Router Agent calls in flight, by routing cache key: a burst of the same question
+# (before the first answer is cached) makes one router call
+router_flight = SingleFlight("router")
 
-    # Add line breaks before numbered items (1., 2., etc.)
-    text = re.sub(r'(\d+\.\s\*\*)', r'\n\n\1', text)
+# How each message was routed: 'local', 'cache', 'router' or 'fallback'
+routing_path_counts = Counter()
 
-    # Add line breaks after sentences that end with periods followed by numbers
-    text = re.sub(r'(\.\s)(\d+\.\s)', r'\1\n\n\2', text)
+# Reply used when no agent produced one (failed or out of time)
+FALLBACK_REPLY = "I'm here to help! How can I assist you with courses, schedules, or campus life?"
 
-    # Add line breaks before "Would you like" or similar closing questions
-    text = re.sub(r'(\.\s)(Would you like|Do you need|Is there anything)', r'\1\n\n\2', text)
+# Speculative specialist runs (SPECULATIVE_SPECIALIST): attempts, hits, misses, and the
+# latency saved by hits / spent on cancelled runs, in milliseconds
+speculation_counts = Counter()
 
-    # Clean up multiple consecutive newlines
-    text = re.sub(r'\n{3,}', '\n\n', text)
+def routing_cache_key(user_text: str, session_messages: List[Dict[str, Any]] = None) -> str:
+    last_agent = find_last_agent(session_messages) or ""
+    return f"{ROUTER_INSTRUCTIONS_DIGEST}|{last_agent}|{normalize_text(user_text)}"
 
-    # Remove leading/trailing whitespace
-    text = text.strip()
+def invalidate_routing_cache() -> None:
+    """
+    Drop cached Router Agent decisions, e.g. after changing the router instructions at runtime.
+    """
+    routing_cache.clear()
 
-    return text
+def get_metrics() -> Dict[str, Any]:
+    """
+    Process-wide counters for the agents layer, served by the metrics endpoint.
+    """
+    return {
+        "routing_paths": dict(routing_path_counts),
+        "routing_cache": routing_cache.stats(),
+        "session_state_cache": session_state_cache.stats(),
+        "message_writer": message_writer.stats(),
+        "tool_caches": {name: cache.stats() for name, cache in tool_caches.items()},
+        "single_flight": {"router": router_flight.stats(), "tools": tool_flight.stats()},
+        "speculation": {**speculation_counts, "hit_rate": speculation_hit_rate()},
+        "stages": stage_timer.stats(),
+        "agent_limiter": agent_limiter.stats(),
+        "agent_loop": agent_loop.stats(),
+    }
+
+def request_deadline() -> Deadline:
+    """Time budget for one message, shared by the router and specialist stages."""
+    return Deadline(getattr(settings, "AGENT_REQUEST_DEADLINE", 60))
+
+def hedge_delay(stage: str) -> Optional[float]:
+    """
+    Seconds after which a stage's call gets a hedged second attempt: its recent
+    AGENT_HEDGE_PERCENTILE latency, for the stages in AGENT_HEDGE_STAGES (None: no hedge).
+    """
+    pct = getattr(settings, "AGENT_HEDGE_PERCENTILE", 0)
+    if not pct or stage not in getattr(settings, "AGENT_HEDGE_STAGES", ["router"]):
+        return None
+    return stage_timer.percentile(stage, pct, getattr(settings, "AGENT_HEDGE_MIN_SAMPLES", 20))
 
+async def summarize_with_agent(previous_summary: str, turns: List[Dict[str, str]]) -> str:
+    """
+    Default CONVERSATION_SUMMARIZER: ask the Conversation Summarizer agent to fold the
+    given turns into the previous summary.
+    """
+    transcript = "\n".join(f"{turn['sender']}: {turn['text']}" for turn in turns)
+    prompt = f"Current summary:\n{previous_summary or '(none)'}\n\nTurns to add:\n{transcript}"
+    result = await run_agent(summarizer_agent, prompt)
+    return str(result.final_output).strip()
 
+def get_summarizer():
+    """
+    The summarizer named by the CONVERSATION_SUMMARIZER setting (a dotted path to a
+    callable taking (previous_summary, turns); it may be sync or async).
+    """
+    return import_string(getattr(settings, "CONVERSATION_SUMMARIZER", "chat.agents_integration.summarize_with_agent"))
 
 def determine_target_agent(user_text: str, session_messages: List[Dict[str, Any]] = None) -> str:
     """
     Determine which agent should handle the user's query based on content analysis and conversation context.
     Priority: 1) Strong agent keywords, 2) Follow-up context, 3) Default to Triage
     """
-    user_lower = user_text.lower()
-    
     print(f"DEBUG - Routing analysis for: '{user_text}'")
+
+    # One pass over the text with the active rule set finds every keyword category
+    rules = get_rules()
+    categories = matched_categories(rules.scan(user_text))
     
-    # FIRST PRIORITY: Check for strong agent-specific indicators
-    
-    # Poetry requests (University Poet) - highest specificity
-    poetry_indicators = ['haiku', 'poem', 'poetry', 'verse', 'write me a', 'compose a']
-    if any(indicator in user_lower for indicator in poetry_indicators):
-        print(f"DEBUG - Poetry request detected, routing to: University Poet")
-        return "University Poet"
-    
-    # Course-related queries (Course Advisor)
-    course_keywords = [
-        'course', 'courses', 'class', 'classes', 'major', 'degree', 'study', 'studying',
-        'academic', 'curriculum', 'credit', 'credits', 'cs320', 'stat210', 'cs250', 'cs499',
-        'computer science', 'data science', 'artificial intelligence', 'machine learning',
-        'programming', 'statistics', 'undergraduate', 'graduate', 'what should i take',
-        'recommend', 'recommendation', 'subject', 'subjects'
-    ]
-    if any(keyword in user_lower for keyword in course_keywords):
-        print(f"DEBUG - Course query detected, routing to: Course Advisor")
-        return "Course Advisor"
-    
-    # Schedule-related queries (Scheduling Assistant)
-    schedule_keywords = [
-        'schedule', 'time', 'exam', 'exams', 'calendar', 'date', 'dates', 'when', 
-        'semester', 'deadline', 'deadlines', 'final', 'finals', 'midterm', 'midterms',
-        'start', 'end', 'begins', 'registration', 'when do', 'when does', 'when is'
-    ]
-    if any(keyword in user_lower for keyword in schedule_keywords):
-        print(f"DEBUG - Schedule query detected, routing to: Scheduling Assistant")
-        return "Scheduling Assistant"
+    # FIRST PRIORITY: Check for strong agent-specific indicators, in rule priority order
+    # (poetry, then courses, then schedules in the default rule set)
+    keyword_agent = rules.pick_agent(categories)
+    if keyword_agent:
+        print(f"DEBUG - Keyword match detected, routing to: {keyword_agent}")
+        return keyword_agent
     
     # SECOND PRIORITY: Check conversation context for follow-up questions
     # (Only if no strong agent-specific keywords were found above)
     if session_messages:
         # Look for the most recent non-user message to see which agent was active
-        last_agent = None
-        for msg in reversed(session_messages):
-            if msg.get('sender') not in ['user', 'You', 'tool']:
-                last_agent = msg.get('sender')
-                break
+        last_agent = find_last_agent(session_messages)
         
         # If we have a recent specialist agent and this looks like a follow-up question
-        if last_agent and last_agent != "Triage Agent":
-            follow_up_indicators = [
-                'tell me more', 'more details', 'what about', 'can you explain', 
-                'prerequisites', 'requirements', 'how about', 'what are the',
-                'more information', 'details about', 'expand on', 'elaborate',
-                'that course', 'those courses', 'about it', 'about that'
-            ]
-            
+        if last_agent and last_agent != rules.default_agent:
             # Check if this is a follow-up question
-            if any(indicator in user_lower for indicator in follow_up_indicators):
+            if rules.is_follow_up(categories):
                 print(f"DEBUG - Follow-up detected, routing to: {last_agent}")
                 return last_agent
             
             # Also check if the question is short and contextual (likely a follow-up)
-            if len(user_text.split()) <= 8 and any(word in user_lower for word in ['it', 'that', 'this', 'them', 'those']):
+            if rules.is_contextual_follow_up(user_text, categories):
                 print(f"DEBUG - Contextual follow-up detected, routing to: {last_agent}")
                 return last_agent
     
     # THIRD PRIORITY: Default to Triage Agent for general queries
-    print(f"DEBUG - General query, routing to: Triage Agent")
-    return "Triage Agent"
+    print(f"DEBUG - General query, routing to: {rules.default_agent}")
+    return rules.default_agent
 
 def determine_agent_from_content(user_text: str, response_text: str, session_messages: List[Dict[str, Any]] = None) -> str:
     """
     Fallback method to determine which agent should have responded based on content analysis and conversation context.
     """
-    user_lower = user_text.lower()
-    response_lower = response_text.lower()
-
     print(f"DEBUG - Analyzing user text: '{user_text}'")
     print(f"DEBUG - Response preview: '{response_text[:100]}...'")
 
+    # One pass over each text with the active rule set finds every keyword category
+    rules = get_rules()
+    categories = matched_categories(rules.scan(user_text))
+
     # First, check conversation context - if the last agent response was from a specialist,
     # and this seems like a follow-up, continue with the same agent
     if session_messages:
         # Look for the most recent non-user message to see which agent was active
-        last_agent = None
-        for msg in reversed(session_messages):
-            if msg.get('sender') not in ['user', 'You', 'tool']:
-                last_agent = msg.get('sender')
-                print(f"DEBUG - Found last agent: {last_agent}")
-                break
+        last_agent = find_last_agent(session_messages)
+        if last_agent:
+            print(f"DEBUG - Found last agent: {last_agent}")
 
         # If we have a recent specialist agent and this looks like a follow-up question
-        if last_agent and last_agent != "Triage Agent":
-            follow_up_indicators = [
-                'tell me more', 'more details', 'what about', 'can you explain',
-                'prerequisites', 'requirements', 'how about', 'what are the',
-                'more information', 'details about', 'expand on', 'elaborate',
-                'that course', 'those courses', 'about it', 'about that'
-            ]
-
+        if last_agent and last_agent != rules.default_agent:
             # Check if this is a follow-up question
-            if any(indicator in user_lower for indicator in follow_up_indicators):
+            if rules.is_follow_up(categories):
                 print(f"DEBUG - Detected follow-up question, continuing with: {last_agent}")
                 return last_agent
 
             # Also check if the question is short and contextual (likely a follow-up)
-            if len(user_text.split()) <= 8 and any(word in user_lower for word in ['it', 'that', 'this', 'them', 'those']):
+            if rules.is_contextual_follow_up(user_text, categories):
                 print(f"DEBUG - Detected contextual follow-up, continuing with: {last_agent}")
                 return last_agent
 
-    # Check for poetry/haiku requests first (most specific)
-    poetry_indicators = ['haiku', 'poem', 'poetry', 'verse', 'write me a', 'compose']
-    if any(indicator in user_lower for indicator in poetry_indicators):
-        print(f"DEBUG - Detected poetry request")
-        return "University Poet"
-
-    # Check response content for haiku patterns
+    # Check response content for haiku patterns (only poetry keywords outrank this,
+    # and they pick the same agent)
     lines = response_text.strip().split('\n')
     if len(lines) == 3 and all(len(line.strip()) > 0 for line in lines):
         # Looks like a haiku structure
         print(f"DEBUG - Detected haiku structure in response")
         return "University Poet"
 
-    # Check for course-related keywords (Course Advisor)
-    course_keywords = [
-        'course', 'courses', 'class', 'classes', 'major', 'degree', 'study', 'studying',
-        'academic', 'curriculum', 'credit', 'credits', 'cs320', 'stat210', 'cs250', 'cs499',
-        'computer science', 'data science', 'artificial intelligence', 'machine learning',
-        'programming', 'statistics', 'undergraduate', 'graduate'
-    ]
-    if any(keyword in user_lower for keyword in course_keywords):
-        print(f"DEBUG - Detected course-related keywords")
-        return "Course Advisor"
-
-    # Check for schedule-related keywords (Scheduling Assistant)
-    schedule_keywords = [
-        'schedule', 'time', 'exam', 'exams', 'calendar', 'date', 'dates', 'when',
-        'semester', 'deadline', 'deadlines', 'final', 'finals', 'midterm', 'midterms',
-        'start', 'end', 'begins', 'registration'
-    ]
-    if any(keyword in user_lower for keyword in schedule_keywords):
-        print(f"DEBUG - Detected schedule-related keywords")
-        return "Scheduling Assistant"
+    # Check the user's text for agent keywords, in rule priority order
+    keyword_agent = rules.pick_agent(categories)
+    if keyword_agent:
+        print(f"DEBUG - Detected keywords for: {keyword_agent}")
+        return keyword_agent
 
     # Check response content for agent-specific patterns
-    if any(word in response_lower for word in ['cs320', 'stat210', 'cs250', 'cs499', 'recommended courses', 'course selection']):
-        print(f"DEBUG - Detected course content in response")
-        return "Course Advisor"
-
-    if any(word in response_lower for word in ['haiku', 'syllables', 'poem', 'verse']):
-        print(f"DEBUG - Detected poetry content in response")
-        return "University Poet"
-
-    if any(word in response_lower for word in ['schedule', 'exam', 'calendar', 'semester', 'deadline']):
-        print(f"DEBUG - Detected schedule content in response")
-        return "Scheduling Assistant"
+    response_agent = rules.pick_agent(matched_categories(rules.scan(response_text)), scope="response")
+    if response_agent:
+        print(f"DEBUG - Detected {response_agent} content in response")
+        return response_agent
 
     # Default to Triage Agent for general queries
     print(f"DEBUG - Defaulting to Triage Agent")
-    return "Triage Agent"
+    return rules.default_agent
 
-async def run_triage_and_handle(session_messages: List[Dict[str, Any]], user_text: str) -> Dict[str, Any]:
+def parse_routing_decision(router_result) -> str:
     """
-    Use Router Agent to determine routing, then call the appropriate agent directly.
-    Returns: { 'agent': agent_name, 'text': ..., 'tool_calls': [...], 'events': [...] }
+    Extract a clean agent name from the Router Agent output.
     """
-    # Convert session messages for Router Agent (with agent context for routing decisions)
-    router_conversation_history = []
-    if session_messages:
-        for msg in session_messages[:-1]:  # exclude the current user message
-            if msg['sender'] == 'user':
-                router_conversation_history.append({"role": "user", "content": msg['text']})
-            elif msg['sender'] not in ['tool']:  # agent messages
-                # Include agent name in the content for Router Agent context
-                agent_context = f"[{msg['sender']}]: {msg['text']}"
-                router_conversation_history.append({"role": "assistant", "content": agent_context})
+    # Extract the routing decision
+    routing_decision = router_result.final_output if hasattr(router_result, 'final_output') else str(router_result)
+    if isinstance(routing_decision, str):
+        routing_decision = routing_decision.strip().strip('"\'')
+        # Remove brackets if Router Agent added them
+        routing_decision = routing_decision.strip('[]')
+
+        # If the response is too long, it means Router Agent gave advice instead of just agent name
+        # Extract just the agent name from the beginning
+        if len(routing_decision) > 50:  # Agent names should be short
+            print(f"DEBUG - Router Agent gave long response instead of agent name, extracting...")
+            # Look for agent names at the start of the response
+            for agent_name in AGENT_NAMES:
+                if routing_decision.startswith(agent_name):
+                    routing_decision = agent_name
+                    break
+            else:
+                # If no agent name found at start, default based on content
+                if any(word in routing_decision.lower() for word in ['course', 'class', 'study', 'academic', 'machine learning', 'data science']):
+                    routing_decision = "Course Advisor"
+                elif any(word in routing_decision.lower() for word in ['haiku', 'poem', 'poetry']):
+                    routing_decision = "University Poet"
+                elif any(word in routing_decision.lower() for word in ['schedule', 'exam', 'calendar']):
+                    routing_decision = "Scheduling Assistant"
+                else:
+                    routing_decision = "Triage Agent"
+
+    print(f"DEBUG - Router Agent raw decision: '{router_result.final_output if hasattr(router_result, 'final_output') else str(router_result)}'")
+    print(f"DEBUG - Router Agent cleaned decision: '{routing_decision}'")
 
-    # Router Agent input with context
-    router_input_messages = router_conversation_history + [{"role": "user", "content": user_text}]
+    return routing_decision
+
+def build_router_digest(session_messages: List[Dict[str, Any]], user_text: str) -> str:
+    """
+    Router Agent input: the previous agent, the previous user message and the first
+    ROUTER_DIGEST_REPLY_CHARS characters of the previous reply, then the current message.
+    Its size does not depend on the length of the session.
+    """
+    digest = last_turn_digest(session_messages)
+    reply_chars = getattr(settings, "ROUTER_DIGEST_REPLY_CHARS", 200)
+    lines = []
+    if digest["last_agent"]:
+        lines.append(f"Previous agent: {digest['last_agent']}")
+    if digest["last_user"]:
+        lines.append(f"Previous user message: {digest['last_user'][:reply_chars]}")
+    if digest["last_reply"]:
+        reply = " ".join(digest["last_reply"].split())
+        lines.append(f"Previous reply: {reply[:reply_chars]}{'...' if len(reply) > reply_chars else ''}")
+    lines.append(f"Current message: {user_text}")
+    return "\n".join(lines)
+
+def build_conversation_inputs(session_messages: List[Dict[str, Any]], user_text: str, conversation_summary: str = "",
+                              agent_history: Optional[List[Dict[str, str]]] = None, evicted_turns: int = 0):
+    """
+    Build the Router Agent input (a short digest of the previous turn, see build_router_digest)
+    and the specialist input (clean history, trimmed by the configured context policy).
+    If the session has a running summary of older turns, the specialist input starts with it.
+    agent_history is the prior specialist history when the caller already has it (see
+    session_state); otherwise it is derived from session_messages. evicted_turns counts
+    older turns the caller left out of agent_history; they are reported as dropped.
+    Returns: (router_input_messages, agent_input_messages, context_report)
+    """
+    # Router Agent input: a fixed-size digest of the previous turn, not the transcript
+    router_input_messages = [{"role": "user", "content": build_router_digest(session_messages, user_text)}]
 
     # Convert session messages for actual agent execution (without agent prefixes)
-    agent_conversation_history = []
-    if session_messages:
+    agent_conversation_history = list(agent_history) if agent_history is not None else []
+    if agent_history is None and session_messages:
         for msg in session_messages[:-1]:  # exclude the current user message
             if msg['sender'] == 'user':
                 agent_conversation_history.append({"role": "user", "content": msg['text']})
@@ -371,98 +461,257 @@ async def run_triage_and_handle(session_messages: List[Dict[str, Any]], user_tex
                 # No agent prefix for actual agent execution
                 agent_conversation_history.append({"role": "assistant", "content": msg['text']})
 
+    # Keep the specialist's history within the configured turn/token limits
+    agent_conversation_history, context_report = apply_context_policy(
+        agent_conversation_history,
+        policy=getattr(settings, "CONTEXT_POLICY", "all"),
+        max_turns=getattr(settings, "CONTEXT_MAX_TURNS", None),
+        token_budget=getattr(settings, "CONTEXT_TOKEN_BUDGET", None),
+    )
+    context_report["turns_dropped"] += evicted_turns
+    context_report["turns_evicted"] = evicted_turns
+    print(f"DEBUG - Context policy '{context_report['policy']}': sent {context_report['turns_sent']} turns "
+          f"({context_report['tokens_sent']} tokens), dropped {context_report['turns_dropped']} turns "
+          f"({context_report['tokens_dropped']} tokens)")
+
     # Agent execution input without prefixes
     agent_input_messages = agent_conversation_history + [{"role": "user", "content": user_text}]
 
-    # Debug: Print conversation context for Router Agent
-    print(f"DEBUG - Conversation context for Router Agent:")
+    # Older turns folded into the session summary are sent as background, not verbatim
+    context_report["summary_tokens"] = 0
+    if conversation_summary:
+        summary_message = {"role": "system", "content": f"Summary of the earlier conversation:\n{conversation_summary}"}
+        agent_input_messages = [summary_message] + agent_input_messages
+        context_report["summary_tokens"] = estimate_tokens(summary_message["content"])
+
+    return router_input_messages, agent_input_messages, context_report
+
+async def choose_agent(session_messages: List[Dict[str, Any]], user_text: str, router_input_messages: List[Dict[str, str]],
+                       speculate: Optional[Callable[[str], None]] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    Pick the agent for this message: local keyword fast path when confident, then the
+    routing cache, then the Router Agent. If the Router Agent fails or takes longer than
+    ROUTER_TIMEOUT (or what is left of the deadline), fall back to keyword routing.
+    speculate, if given, is called with the keyword router's pick just before the Router
+    Agent call (so that agent can start running alongside it).
+    Returns the routing record: { 'agent': ..., 'path': 'local'|'cache'|'router'|'fallback', ... }
+    """
+    # Debug: Print the digest sent to the Router Agent
+    print(f"DEBUG - Routing digest for Router Agent:")
     for i, msg in enumerate(router_input_messages):
         content_preview = msg['content'][:100] + "..." if len(msg['content']) > 100 else msg['content']
         print(f"  {i+1}. {msg['role']}: {content_preview}")
 
-    try:
-        # Step 1: Use Router Agent to determine which agent should handle this
-        print(f"DEBUG - Running Router Agent to determine routing for: '{user_text}'")
-        router_result = await runner.run(router_agent, router_input_messages)
-
-        # Extract the routing decision
-        routing_decision = router_result.final_output if hasattr(router_result, 'final_output') else str(router_result)
-        if isinstance(routing_decision, str):
-            routing_decision = routing_decision.strip().strip('"\'')
-            # Remove brackets if Router Agent added them
-            routing_decision = routing_decision.strip('[]')
-
-            # If the response is too long, it means Router Agent gave advice instead of just agent name
-            # Extract just the agent name from the beginning
-            if len(routing_decision) > 50:  # Agent names should be short
-                print(f"DEBUG - Router Agent gave long response instead of agent name, extracting...")
-                # Look for agent names at the start of the response
-                for agent_name in ["Course Advisor", "University Poet", "Scheduling Assistant", "Triage Agent"]:
-                    if routing_decision.startswith(agent_name):
-                        routing_decision = agent_name
-                        break
-                else:
-                    # If no agent name found at start, default based on content
-                    if any(word in routing_decision.lower() for word in ['course', 'class', 'study', 'academic', 'machine learning', 'data science']):
-                        routing_decision = "Course Advisor"
-                    elif any(word in routing_decision.lower() for word in ['haiku', 'poem', 'poetry']):
-                        routing_decision = "University Poet"
-                    elif any(word in routing_decision.lower() for word in ['schedule', 'exam', 'calendar']):
-                        routing_decision = "Scheduling Assistant"
-                    else:
-                        routing_decision = "Triage Agent"
-
-        print(f"DEBUG - Router Agent raw decision: '{router_result.final_output if hasattr(router_result, 'final_output') else str(router_result)}'")
-        print(f"DEBUG - Router Agent cleaned decision: '{routing_decision}'")
-
-        # Step 2: Get the appropriate agent based on routing decision
-        agent_mapping = {
-            "Course Advisor": course_advisor_agent,
-            "University Poet": university_poet_agent,
-            "Scheduling Assistant": scheduling_agent,
-            "Triage Agent": triage_agent
-        }
+    # Step 0: Score the query locally; a confident keyword match skips the Router Agent call
+    local_routing = classify_query(user_text, session_messages)
+    routing = {
+        "path": "router",
+        "local_agent": local_routing["agent"],
+        "confidence": local_routing["confidence"],
+        "reason": local_routing["reason"],
+    }
 
-        target_agent = agent_mapping.get(routing_decision, triage_agent)
-        target_agent_name = routing_decision if routing_decision in agent_mapping else "Triage Agent"
+    try:
+        fast_path_threshold = getattr(settings, "ROUTER_FAST_PATH_THRESHOLD", 0.7)
+        if local_routing["confidence"] >= fast_path_threshold:
+            routing_decision = local_routing["agent"]
+            routing["path"] = "local"
+            print(f"DEBUG - Local fast path ({local_routing['reason']}, confidence {local_routing['confidence']}): '{routing_decision}'")
+        else:
+            cache_key = routing_cache_key(user_text, session_messages)
+            routing_decision = routing_cache.get(cache_key)
+            if routing_decision:
+                routing["path"] = "cache"
+                print(f"DEBUG - Routing cache hit: '{routing_decision}'")
+            else:
+                # Step 1: Use Router Agent to determine which agent should handle this
+                print(f"DEBUG - Running Router Agent to determine routing for: '{user_text}' "
+                      f"(local confidence {local_routing['confidence']} < {fast_path_threshold})")
+                if speculate is not None:
+                    speculate(local_routing["agent"])
+                deadline = deadline or request_deadline()
+                router_result = await router_flight.do(cache_key, lambda: run_stage(
+                    "router", lambda: run_agent(router_agent, router_input_messages),
+                    timeout=deadline.stage_timeout(getattr(settings, "ROUTER_TIMEOUT", 0)),
+                    hedge_after=hedge_delay("router"),
+                ))
+                routing_decision = parse_routing_decision(router_result)
+                if routing_decision in AGENT_MAPPING:
+                    routing_cache.set(cache_key, routing_decision)
+    except asyncio.TimeoutError as e:
+        print(f"DEBUG - Router Agent timed out, falling back to keyword routing: {e}")
+        routing_decision = determine_target_agent(user_text, session_messages)
+        routing["path"] = "fallback"
+        routing.setdefault("timed_out", []).append("router")
+    except LimiterBusy as e:
+        print(f"DEBUG - No slot for the Router Agent, falling back to keyword routing: {e}")
+        routing_decision = determine_target_agent(user_text, session_messages)
+        routing["path"] = "fallback"
+        routing["busy"] = True
+    except Exception as e:
+        print(f"DEBUG - Router Agent failed, falling back to keyword routing: {e}")
+        routing_decision = determine_target_agent(user_text, session_messages)
+        routing["path"] = "fallback"
 
-        print(f"DEBUG - Selected agent: {target_agent_name}")
+    # Step 2: Get the appropriate agent based on routing decision
+    routing["agent"] = routing_decision if routing_decision in AGENT_MAPPING else "Triage Agent"
+    routing_path_counts[routing["path"]] += 1
 
-        # Step 3: Run the selected agent (using clean conversation history without agent prefixes)
-        print(f"DEBUG - Running {target_agent_name} with clean conversation history")
-        print(f"DEBUG - Clean conversation context for {target_agent_name}:")
-        for i, msg in enumerate(agent_input_messages):
-            content_preview = msg['content'][:100] + "..." if len(msg['content']) > 100 else msg['content']
-            print(f"  {i+1}. {msg['role']}: {content_preview}")
+    print(f"DEBUG - Selected agent: {routing['agent']}")
+    return routing
 
-        result = await runner.run(target_agent, agent_input_messages)
+async def try_local_answer(user_text: str) -> Optional[Dict[str, Any]]:
+    """
+    Answer a structured schedule question ("When is the CS320 final?") from the calendar
+    data without any LLM call (see local_answers). Returns a run_triage_and_handle result
+    with routing path 'local_answer' and answered_locally set, or None for any other message.
+    """
+    if not getattr(settings, "LOCAL_ANSWERS_ENABLED", True):
+        return None
+    try:
+        answer = await sync_to_async(local_answer)(user_text)
+    except Exception as e:
+        print(f"DEBUG - Local answer failed, using the agents: {e}")
+        return None
+    if answer is None:
+        return None
+
+    routing = {"path": "local_answer", "agent": answer["agent"], "intent": answer["intent"]}
+    routing_path_counts[routing["path"]] += 1
+    print(f"DEBUG - Answered locally ({answer['intent']['field']} of {answer['intent']['code']}): {answer['agent']}")
+    return {
+        "agent": answer["agent"],
+        "text": answer["text"],
+        "tool_calls": [],
+        "events": [],
+        "routing": routing,
+        "context": {"turns_sent": 0, "tokens_sent": 0},
+        "answered_locally": True
+    }
+
+def speculation_hit_rate() -> float:
+    attempts = speculation_counts["attempts"]
+    return round(speculation_counts["hits"] / attempts, 3) if attempts else 0.0
+
+async def _timed_run(agent, input_messages, timeout: Optional[float]):
+    start = time.perf_counter()
+    result = await run_stage("specialist", lambda: run_agent(agent, input_messages), timeout=timeout)
+    return result, time.perf_counter() - start
+
+def speculation_starter(speculation: Dict[str, Any], agent_input_messages: List[Dict[str, str]],
+                        deadline: Deadline) -> Callable[[str], None]:
+    """
+    Callback for choose_agent(speculate=...): start the predicted specialist as a task
+    and record it in `speculation` for resolve_speculation().
+    """
+    def start(predicted_agent: str) -> None:
+        agent = AGENT_MAPPING.get(predicted_agent)
+        if agent is None:
+            return
+        task = asyncio.ensure_future(_timed_run(agent, agent_input_messages, deadline.stage_timeout()))
+        # A cancelled or unused run's exception is not an error of this turn
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        speculation.update({"agent": predicted_agent, "task": task, "started": time.perf_counter()})
+        print(f"DEBUG - Speculatively running {predicted_agent} alongside the Router Agent")
+    return start
+
+async def resolve_speculation(speculation: Dict[str, Any], routing: Dict[str, Any]):
+    """
+    Settle a speculative specialist run once routing has decided. If the routed agent is
+    the one that was started, wait for and return its result; otherwise cancel it and
+    return None so the routed agent runs. Records the outcome in routing['speculation'].
+    """
+    task = speculation.get("task")
+    if task is None:
+        return None
+    router_seconds = time.perf_counter() - speculation["started"]
+    speculation_counts["attempts"] += 1
+    if routing["agent"] != speculation["agent"]:
+        task.cancel()
+        speculation_counts["misses"] += 1
+        speculation_counts["wasted_ms"] += round(router_seconds * 1000, 1)
+        routing["speculation"] = {"agent": speculation["agent"], "hit": False}
+        print(f"DEBUG - Speculation miss: predicted {speculation['agent']}, routed to {routing['agent']} "
+              f"(hit rate {speculation_hit_rate()})")
+        return None
+
+    result, specialist_seconds = await task
+    # Run one after the other, the turn would have taken router + specialist time
+    saved_ms = round((router_seconds + specialist_seconds - (time.perf_counter() - speculation["started"])) * 1000, 1)
+    speculation_counts["hits"] += 1
+    speculation_counts["saved_ms"] += saved_ms
+    routing["speculation"] = {"agent": speculation["agent"], "hit": True, "saved_ms": saved_ms}
+    print(f"DEBUG - Speculation hit: {speculation['agent']} ran alongside the Router Agent, saved {saved_ms} ms "
+          f"(hit rate {speculation_hit_rate()})")
+    return result
+
+def cancel_speculation(speculation: Dict[str, Any]) -> None:
+    task = speculation.get("task")
+    if task is not None and not task.done():
+        task.cancel()
+
+def extract_tool_calls(result) -> List[Any]:
+    tool_calls = []
+    if hasattr(result, 'tool_calls') and result.tool_calls:
+        tool_calls = result.tool_calls
+    elif hasattr(result, 'messages'):
+        for message in result.messages:
+            if hasattr(message, 'tool_calls') and message.tool_calls:
+                tool_calls.extend(message.tool_calls)
+    return tool_calls
+
+def print_agent_context(target_agent_name: str, agent_input_messages: List[Dict[str, str]]) -> None:
+    print(f"DEBUG - Running {target_agent_name} with clean conversation history")
+    print(f"DEBUG - Clean conversation context for {target_agent_name}:")
+    for i, msg in enumerate(agent_input_messages):
+        content_preview = msg['content'][:100] + "..." if len(msg['content']) > 100 else msg['content']
+        print(f"  {i+1}. {msg['role']}: {content_preview}")
 
-        # Extract the final output
-        final_output = result.final_output if hasattr(result, 'final_output') else str(result)
+async def run_triage_and_handle(session_messages: List[Dict[str, Any]], user_text: str, conversation_summary: str = "",
+                          agent_history: Optional[List[Dict[str, str]]] = None, evicted_turns: int = 0) -> Dict[str, Any]:
+    """
+    Route the query (local keyword fast path when confident, otherwise the Router Agent),
+    then call the appropriate agent directly. Structured schedule questions are answered
+    from the calendar data without either (see try_local_answer).
+    Returns: { 'agent': agent_name, 'text': ..., 'tool_calls': [...], 'events': [...], 'routing': {...}, 'context': {...} }
+    'routing' records which path picked the agent: 'local', 'cache', 'router', 'fallback'
+    or 'local_answer' (the result then also has answered_locally=True).
+    'context' reports how many history turns and tokens were sent to and dropped for the specialist.
+    conversation_summary is the session's running summary of turns older than session_messages;
+    agent_history optionally supplies the prior specialist history ready-made, without
+    evicted_turns older turns (see build_conversation_inputs).
+    """
+    local_result = await try_local_answer(user_text)
+    if local_result is not None:
+        return local_result
+
+    router_input_messages, agent_input_messages, context_report = build_conversation_inputs(
+        session_messages, user_text, conversation_summary, agent_history, evicted_turns)
+    routing = {}
+    # Router and specialist share one AGENT_REQUEST_DEADLINE budget
+    deadline = request_deadline()
+    # With SPECULATIVE_SPECIALIST, the keyword router's pick starts alongside the Router Agent
+    speculation = {}
+    speculate = speculation_starter(speculation, agent_input_messages, deadline) if getattr(settings, "SPECULATIVE_SPECIALIST", False) else None
 
-        # Clean up the output
-        if isinstance(final_output, str):
-            # Remove extra quotes and unescape newlines
-            if final_output.startswith('"') and final_output.endswith('"'):
-                final_output = final_output[1:-1]
+    try:
+        routing = await choose_agent(session_messages, user_text, router_input_messages, speculate=speculate, deadline=deadline)
+        target_agent_name = routing["agent"]
+        target_agent = AGENT_MAPPING[target_agent_name]
 
-            # Unescape common escape sequences
-            final_output = final_output.replace('\\n', '\n')
-            final_output = final_output.replace('\\"', '"')
-            final_output = final_output.replace('\\\\', '\\')
-            final_output = final_output.replace('\\t', '\t')
+        # Step 3: Run the selected agent (using clean conversation history without agent prefixes)
+        result = await resolve_speculation(speculation, routing)
+        if result is None:
+            print_agent_context(target_agent_name, agent_input_messages)
+            result = await run_stage("specialist", lambda: run_agent(target_agent, agent_input_messages),
+                                     timeout=deadline.stage_timeout(), hedge_after=hedge_delay("specialist"))
 
-            # Additional formatting improvements
-            final_output = format_agent_response(final_output)
+        # Extract the final output and clean it up
+        final_output = result.final_output if hasattr(result, 'final_output') else str(result)
+        final_output = clean_agent_output(final_output)
 
         # Extract tool calls if any
-        tool_calls = []
-        if hasattr(result, 'tool_calls') and result.tool_calls:
-            tool_calls = result.tool_calls
-        elif hasattr(result, 'messages'):
-            for message in result.messages:
-                if hasattr(message, 'tool_calls') and message.tool_calls:
-                    tool_calls.extend(message.tool_calls)
+        tool_calls = extract_tool_calls(result)
 
         print(f"DEBUG - Final responding agent: {target_agent_name}")
         print(f"DEBUG - Final output preview: {final_output[:100]}...")
@@ -471,38 +720,155 @@ async def run_triage_and_handle(session_messages: List[Dict[str, Any]], user_tex
             "agent": target_agent_name,
             "text": final_output,
             "tool_calls": tool_calls,
-            "events": getattr(result, 'events', [])
+            "events": getattr(result, 'events', []),
+            "routing": routing,
+            "context": context_report
+        }
+
+    except LimiterBusy:
+        # Overloaded: let the view answer 429/503 rather than queue a second agent call
+        raise
+
+    except asyncio.TimeoutError as e:
+        # Out of budget: a second agent call would only overrun it further
+        print(f"DEBUG - {e}, replying without an agent")
+        # Keeps an earlier router timeout: timed_out lists every stage that ran out of time
+        routing.update({"path": routing.get("path", "fallback"), "agent": "Triage Agent"})
+        routing.setdefault("timed_out", []).append("specialist")
+        return {
+            "agent": "Triage Agent",
+            "text": FALLBACK_REPLY,
+            "tool_calls": [],
+            "events": [],
+            "routing": routing,
+            "context": context_report
         }
 
     except Exception as e:
         print(f"DEBUG - Error in triage and handle: {e}")
         # Fallback to keyword-based routing
         target_agent_name = determine_target_agent(user_text, session_messages)
+        routing["path"] = "fallback"
+        routing["agent"] = target_agent_name
 
         # Get the appropriate agent
-        agent_mapping = {
-            "Course Advisor": course_advisor_agent,
-            "University Poet": university_poet_agent,
-            "Scheduling Assistant": scheduling_agent,
-            "Triage Agent": triage_agent
-        }
-
-        target_agent = agent_mapping.get(target_agent_name, triage_agent)
+        target_agent = AGENT_MAPPING.get(target_agent_name, triage_agent)
 
         try:
-            result = await runner.run(target_agent, agent_input_messages)
+            result = await run_stage("fallback", lambda: run_agent(target_agent, agent_input_messages),
+                                     timeout=deadline.stage_timeout())
             final_output = result.final_output if hasattr(result, 'final_output') else str(result)
 
             return {
                 "agent": target_agent_name,
                 "text": final_output,
                 "tool_calls": [],
-                "events": []
+                "events": [],
+                "routing": routing,
+                "context": context_report
             }
-        except:
+        except Exception as e:
+            print(f"DEBUG - Fallback agent failed too: {e}")
+            routing["agent"] = "Triage Agent"
             return {
                 "agent": "Triage Agent",
-                "text": f"I'm here to help! How can I assist you with courses, schedules, or campus life?",
+                "text": FALLBACK_REPLY,
                 "tool_calls": [],
-                "events": []
+                "events": [],
+                "routing": routing,
+                "context": context_report
             }
+    finally:
+        # Also when the request itself is cancelled mid-turn
+        cancel_speculation(speculation)
+
+async def stream_triage_and_handle(session_messages: List[Dict[str, Any]], user_text: str, conversation_summary: str = "",
+                                   agent_history: Optional[List[Dict[str, str]]] = None,
+                                   evicted_turns: int = 0) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of run_triage_and_handle. Yields events as they happen:
+      { 'type': 'routing', 'agent': ..., 'routing': {...} }   as soon as the agent is chosen
+      { 'type': 'delta', 'text': ... }                        formatted specialist text as it is generated
+      { 'type': 'done', 'agent': ..., 'text': ..., 'tool_calls': [...], 'routing': {...}, 'context': {...} }
+    The deltas concatenate to the 'done' text, which is the same cleaned and formatted text
+    run_triage_and_handle returns.
+    If the specialist run fails, an { 'type': 'error', 'agent': ..., 'text': ... } event ends the stream;
+    if it gets no agent slot, a { 'type': 'busy', 'status': 429|503, 'retry_after': ... } event does.
+    A locally answered question yields routing, one delta with the whole answer, and done.
+    """
+    local_result = await try_local_answer(user_text)
+    if local_result is not None:
+        yield {"type": "routing", "agent": local_result["agent"], "routing": local_result["routing"]}
+        yield {"type": "delta", "text": local_result["text"]}
+        yield {"type": "done", **local_result}
+        return
+
+    router_input_messages, agent_input_messages, context_report = build_conversation_inputs(
+        session_messages, user_text, conversation_summary, agent_history, evicted_turns)
+
+    deadline = request_deadline()
+    routing = await choose_agent(session_messages, user_text, router_input_messages, deadline=deadline)
+    target_agent_name = routing["agent"]
+    yield {"type": "routing", "agent": target_agent_name, "routing": routing}
+
+    print_agent_context(target_agent_name, agent_input_messages)
+    # Deltas go through the same cleanup as the final text, chunk by chunk
+    formatter = StreamingFormatter()
+    try:
+        # The agent slot is held until the stream ends
+        async with agent_limiter.slot(target_agent_name):
+            # Started and consumed on the agent loop, like every other agent run
+            streamed = await agent_loop.run(lambda: start_streamed(AGENT_MAPPING[target_agent_name], agent_input_messages))
+            events = agent_loop.iterate(streamed.stream_events)
+            try:
+                while True:
+                    # The rest of the deadline bounds the whole stream, checked at every event
+                    try:
+                        event = await asyncio.wait_for(events.__anext__(), deadline.remaining())
+                    except StopAsyncIteration:
+                        break
+                    # Only raw model text deltas are forwarded; tool calls and handoffs arrive as run items
+                    if event.type == "raw_response_event" and getattr(event.data, "type", "") == "response.output_text.delta":
+                        text = formatter.feed(event.data.delta)
+                        if text:
+                            yield {"type": "delta", "text": text}
+            finally:
+                if not streamed.is_complete:
+                    # Out of time, failed or abandoned: stop the run before its slot is released
+                    agent_loop.call_soon(streamed.cancel)
+    except Exception as e:
+        if isinstance(e, asyncio.TimeoutError):
+            stage_timer.counts["specialist_timeouts"] += 1
+            routing.setdefault("timed_out", []).append("specialist")
+            e = f"out of time after {deadline.seconds:.1f}s"
+        elif isinstance(e, LimiterBusy):
+            # Like run_triage_and_handle raising LimiterBusy: nothing to store, the client retries
+            print(f"DEBUG - No slot for {target_agent_name}: {e}")
+            yield {"type": "busy", "status": e.status, "retry_after": e.retry_after, "routing": routing}
+            return
+        print(f"DEBUG - Error while streaming {target_agent_name}: {e}")
+        yield {
+            "type": "error",
+            "agent": "Triage Agent",
+            "text": FALLBACK_REPLY,
+            "routing": routing,
+            "context": context_report
+        }
+        return
+
+    tail = formatter.finish()
+    if tail:
+        yield {"type": "delta", "text": tail}
+
+    final_output = clean_agent_output(streamed.final_output)
+    print(f"DEBUG - Final responding agent: {target_agent_name}")
+    print(f"DEBUG - Final output preview: {str(final_output)[:100]}...")
+
+    yield {
+        "type": "done",
+        "agent": target_agent_name,
+        "text": final_output,
+        "tool_calls": extract_tool_calls(streamed),
+        "routing": routing,
+        "context": context_report
+    }
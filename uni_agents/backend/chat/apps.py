@@ -0,0 +1,36 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+# PRAGMAs that may be set from settings.SQLITE_PRAGMAS
+SQLITE_PRAGMA_NAMES = {"journal_mode", "synchronous", "busy_timeout", "cache_size", "temp_store", "mmap_size"}
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Apply settings.SQLITE_PRAGMAS (WAL, synchronous level, busy timeout, ...) to each
+    new SQLite connection.
+    """
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if name not in SQLITE_PRAGMA_NAMES or not str(value).replace("-", "").isalnum():
+                raise ValueError(f"Unsupported SQLite PRAGMA setting {name}={value!r}")
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+class ChatConfig(AppConfig):
+    name = "chat"
+
+    def ready(self):
+        connection_created.connect(configure_sqlite_connection, dispatch_uid="chat.configure_sqlite_connection")
+
+        # Compile the routing rule set once at startup; workers pick up later edits
+        # to the file on their own (see ROUTING_RULES_RELOAD_INTERVAL).
+        from .routing import configure_rules
+        configure_rules(
+            getattr(settings, "ROUTING_RULES_FILE", None),
+            getattr(settings, "ROUTING_RULES_RELOAD_INTERVAL", 5.0),
+        )
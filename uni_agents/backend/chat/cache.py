@@ -0,0 +1,227 @@
+import json
+import time
+import asyncio
+import hashlib
+import inspect
+import functools
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL and hit/miss counters.
+
+    If shared_backend names a Django cache alias (see CACHES in settings), entries are
+    also written there and local misses fall through to it, so several workers can
+    share results. The local LRU is always consulted first.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300.0, shared_backend: str = ""):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_backend = shared_backend
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def _shared(self):
+        if not self.shared_backend:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_backend]
+
+    def _shared_key(self, shared, key: str) -> str:
+        # The generation lives in the shared cache so clear() in one worker invalidates
+        # the entries written by all of them. Django cache keys must be short and free
+        # of spaces/control characters, hence the digest.
+        generation = shared.get_or_set(f"chat:{self.name}:generation", 0, timeout=None)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return f"chat:{self.name}:{generation}:{digest}"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+        shared = self._shared()
+        if shared is not None:
+            value = shared.get(self._shared_key(shared, key), _MISSING)
+            if value is not _MISSING:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: str, value: Any) -> None:
+        self._store(key, value)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(shared, key), value, timeout=self.ttl)
+
+    def _store(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(self._shared_key(shared, key))
+
+    def clear(self) -> None:
+        """
+        Drop every entry. Shared entries are orphaned by bumping the shared key
+        generation rather than deleted one by one.
+        """
+        with self._lock:
+            self._data.clear()
+        shared = self._shared()
+        if shared is not None:
+            generation_key = f"chat:{self.name}:generation"
+            try:
+                shared.incr(generation_key)
+            except ValueError:
+                shared.set(generation_key, 1, timeout=None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_hits": self.shared_hits,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Normalize free text for use in cache keys: lower-case, collapse whitespace and
+    drop trailing punctuation, so 'When are finals?' and 'when are  finals' share a key.
+    """
+    return " ".join((text or "").lower().split()).rstrip("?!. ")
+
+
+# Result caches created by memoize_tool(), by tool name (reported by the metrics endpoint)
+tool_caches: Dict[str, TTLCache] = {}
+
+
+def _key_value(value: Any) -> Any:
+    return normalize_text(value) if isinstance(value, str) else value
+
+
+def memoize_tool(name: str, version: Callable[[], Any], echo: Iterable[str] = ()):
+    """
+    Memoize a tool function that is pure in its arguments and a data version.
+
+    The key is the call's arguments (defaults applied, strings normalized with
+    normalize_text) plus version(), e.g. the catalog version, so a new import or a
+    new day never serves old results. Entries live in a TTLCache sized by
+    TOOL_CACHE_SIZE / TOOL_CACHE_TTL (TOOL_CACHE_BACKEND shares them between workers).
+    Arguments named in `echo` are copied into the result as the caller gave them,
+    since calls that share a key may spell them differently. The wrapper keeps the
+    function's signature, so it can still be decorated with @function_tool.
+    """
+    from django.conf import settings
+
+    cache = TTLCache(
+        f"tool:{name}",
+        maxsize=getattr(settings, "TOOL_CACHE_SIZE", 1024),
+        ttl=getattr(settings, "TOOL_CACHE_TTL", 600),
+        shared_backend=getattr(settings, "TOOL_CACHE_BACKEND", ""),
+    )
+    tool_caches[name] = cache
+    echo = list(echo)
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {arg: _key_value(value) for arg, value in bound.arguments.items()}
+            key = json.dumps([version(), arguments], sort_keys=True, default=str)
+            result = cache.get(key, _MISSING)
+            if result is _MISSING:
+                result = fn(*args, **kwargs)
+                cache.set(key, result)
+            if echo and isinstance(result, dict):
+                result = {**result, **{arg: bound.arguments[arg] for arg in echo}}
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent async calls: while a call for a key is in flight,
+    later callers with the same key await its result (or error) instead of starting
+    their own. Nothing is kept once the call finishes; combine with a cache for that.
+
+    The shared call is shielded, so one caller being cancelled does not cancel it for
+    the others. Calls are only shared within one event loop.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, "asyncio.Task"] = {}
+        self.counts: Counter = Counter()
+
+    async def do(self, key: str, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            self.counts["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        task = loop.create_task(make_call())
+        self._calls[key] = task
+        task.add_done_callback(functools.partial(self._finished, key))
+        self.counts["calls"] += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: "asyncio.Task") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the error retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        calls, coalesced = self.counts["calls"], self.counts["coalesced"]
+        return {
+            "in_flight": len(self._calls),
+            "calls": calls,
+            "coalesced": coalesced,
+            "coalesced_rate": round(coalesced / (calls + coalesced), 3) if calls + coalesced else 0.0,
+        }
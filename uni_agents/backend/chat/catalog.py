@@ -0,0 +1,269 @@
+import re
+import time
+import itertools
+import threading
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max
+
+from .search import CourseIndex
+
+# Demo catalog, served until courses are imported (manage.py import_catalog)
+COURSE_CATALOG = [
+    # Data Science Courses
+    {"code": "CS320", "title": "Intro to Machine Learning", "area": "data science", "level": "undergrad", "why": "Intro to supervised learning"},
+    {"code": "STAT210", "title": "Applied Statistics", "area": "data science", "level": "undergrad", "why": "Probability and stats foundations"},
+    {"code": "CS250", "title": "Data Wrangling", "area": "data science", "level": "undergrad", "why": "ETL & preprocessing for ML"},
+    {"code": "CS499", "title": "Data Science Capstone", "area": "data science", "level": "undergrad", "why": "Project-based course"},
+    
+    # Computer Science Courses
+    {"code": "CS101", "title": "Introduction to Programming", "area": "computer science", "level": "undergrad", "why": "Programming fundamentals"},
+    {"code": "CS201", "title": "Data Structures", "area": "computer science", "level": "undergrad", "why": "Core CS concepts"},
+    {"code": "CS301", "title": "Algorithms", "area": "computer science", "level": "undergrad", "why": "Algorithm design and analysis"},
+    {"code": "CS401", "title": "Software Engineering", "area": "computer science", "level": "undergrad", "why": "Large-scale software development"},
+    
+    # Other Courses
+    {"code": "HUM101", "title": "Creative Writing", "area": "humanities", "level": "undergrad", "why": "Writing skills and creativity"},
+    {"code": "MATH201", "title": "Calculus II", "area": "mathematics", "level": "undergrad", "why": "Advanced calculus concepts"},
+    {"code": "PHYS101", "title": "General Physics", "area": "physics", "level": "undergrad", "why": "Physics fundamentals"},
+]
+
+# Demo course schedules with start dates, exam dates, and class times, served until
+# schedules are imported
+COURSE_SCHEDULES = {
+    # Data Science Courses
+    "CS320": {
+        "start_date": "2024-09-03",
+        "end_date": "2024-12-15", 
+        "midterm_exam": "2024-10-15",
+        "final_exam": "2024-12-12",
+        "class_times": "MWF 10:00-11:00 AM",
+        "location": "Science Building 201"
+    },
+    "STAT210": {
+        "start_date": "2024-09-03",
+        "end_date": "2024-12-15",
+        "midterm_exam": "2024-10-18",
+        "final_exam": "2024-12-14",
+        "class_times": "TTh 2:00-3:30 PM",
+        "location": "Math Building 105"
+    },
+    "CS250": {
+        "start_date": "2024-09-05",
+        "end_date": "2024-12-17",
+        "midterm_exam": "2024-10-20",
+        "final_exam": "2024-12-16",
+        "class_times": "MW 1:00-2:30 PM",
+        "location": "Computer Lab 301"
+    },
+    "CS499": {
+        "start_date": "2024-09-03",
+        "end_date": "2024-12-15",
+        "midterm_presentation": "2024-11-01",
+        "final_presentation": "2024-12-10",
+        "class_times": "F 3:00-5:00 PM",
+        "location": "Conference Room A"
+    },
+    
+    # Computer Science Courses
+    "CS101": {
+        "start_date": "2024-09-03",
+        "end_date": "2024-12-15",
+        "midterm_exam": "2024-10-12",
+        "final_exam": "2024-12-11",
+        "class_times": "MWF 9:00-10:00 AM",
+        "location": "Computer Lab 101"
+    },
+    "CS201": {
+        "start_date": "2024-09-03",
+        "end_date": "2024-12-15",
+        "midterm_exam": "2024-10-17",
+        "final_exam": "2024-12-13",
+        "class_times": "TTh 11:00-12:30 PM",
+        "location": "Computer Lab 201"
+    },
+
+}
+
+# Course codes as written in messages: "CS320", "cs 320", "STAT-210"
+COURSE_CODE_PATTERN = re.compile(r"\b([a-z]{1,6})[ -]?(\d{2,4}[a-z]?)\b", re.IGNORECASE)
+
+
+def course_codes_in(text: str) -> List[str]:
+    """Candidate course codes in the text, normalized to upper case without separators."""
+    return [(letters + digits).upper() for letters, digits in COURSE_CODE_PATTERN.findall(text or "")]
+
+
+# Schedule fields in the order they are shown; empty ones are left out of a schedule
+SCHEDULE_FIELDS = ["start_date", "end_date", "midterm_exam", "final_exam", "midterm_presentation",
+                   "final_presentation", "class_times", "location"]
+
+
+class Catalog:
+    """
+    Read-only snapshot of the course catalog and schedules at one data version
+    (0: nothing imported yet). A reload builds the search index before it publishes
+    the new catalog; the first catalog of a worker is published at once and indexed
+    on a background thread, and search() scans it until the index is ready.
+    """
+
+    def __init__(self, version: int, courses: List[Dict[str, Any]], schedules: Dict[str, Dict[str, str]]):
+        self.version = version
+        self.courses = courses
+        self.schedules = schedules
+        self.by_code = {course["code"]: course for course in courses}
+        # Normalized code -> schedule key, for codes found with course_codes_in()
+        self._schedule_codes = {"".join(code.split()).replace("-", "").upper(): code for code in schedules}
+        self._index: Optional[CourseIndex] = None
+        self._index_lock = threading.Lock()
+        self._indexing = False
+
+    def find_scheduled_code(self, text: str) -> Optional[str]:
+        """First course code mentioned in the text that has a schedule, if any."""
+        for candidate in course_codes_in(text):
+            code = self._schedule_codes.get(candidate)
+            if code is not None:
+                return code
+        return None
+
+    def scheduled_codes_in(self, text: str) -> List[str]:
+        """Every distinct course code mentioned in the text that has a schedule."""
+        codes = (self._schedule_codes.get(candidate) for candidate in course_codes_in(text))
+        return list(dict.fromkeys(code for code in codes if code is not None))
+
+    def build_index(self) -> CourseIndex:
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = CourseIndex(self.courses)
+        return self._index
+
+    def build_index_in_background(self) -> None:
+        """Start building the search index on a background thread (once)."""
+        with self._index_lock:
+            if self._index is not None or self._indexing:
+                return
+            self._indexing = True
+        threading.Thread(target=self.build_index, name="chat-catalog-index", daemon=True).start()
+
+    @property
+    def indexed(self) -> bool:
+        return self._index is not None
+
+    def search(self, query: str, level: Optional[str] = None, limit: int = 4) -> List[Dict[str, Any]]:
+        """
+        Courses ranked by the search index. Until the index is built (seconds on a
+        large catalog) falls back to the plain match: the query within the area name,
+        exact level, in catalog order.
+        """
+        index = self._index
+        if index is not None:
+            return [course for _, course in index.search(query, level=level, limit=limit)]
+        self.build_index_in_background()
+        query = (query or "").strip().lower()
+        matches = (course for course in self.courses
+                   if query in course.get("area", "").lower() and (not level or course.get("level") == level))
+        return list(itertools.islice(matches, max(limit, 0)))
+
+
+def catalog_version() -> int:
+    """Id of the latest committed import, 0 if the catalog was never imported."""
+    from .models import CatalogImport
+    return CatalogImport.objects.aggregate(version=Max("id"))["version"] or 0
+
+
+def load_catalog(version: int) -> Catalog:
+    """
+    Read the catalog from the database. Courses and schedules each come from the demo
+    data until their first import.
+    """
+    from .models import CatalogImport, Course, CourseSchedule
+    imported = set(CatalogImport.objects.values_list("kind", flat=True).distinct()) if version else set()
+
+    if CatalogImport.KIND_COURSES in imported:
+        courses = list(Course.objects.order_by("id").values("code", "title", "area", "level", "why"))
+    else:
+        courses = COURSE_CATALOG
+
+    if CatalogImport.KIND_SCHEDULES in imported:
+        schedules = {}
+        rows = CourseSchedule.objects.order_by("id").values("course_code", *SCHEDULE_FIELDS)
+        for row in rows.iterator(chunk_size=2000):
+            schedules[row["course_code"]] = {
+                field: value.isoformat() if hasattr(value, "isoformat") else value
+                for field in SCHEDULE_FIELDS
+                if (value := row[field])
+            }
+    else:
+        schedules = COURSE_SCHEDULES
+    return Catalog(version, courses, schedules)
+
+
+# Active catalog. Like the routing rules, a reload builds a new Catalog and swaps this
+# reference, so a request that fetched the catalog keeps a consistent snapshot.
+_catalog: Optional[Catalog] = None
+_last_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def _reload(force: bool) -> Catalog:
+    # Called with _reload_lock held
+    global _catalog, _last_check
+    _last_check = time.monotonic()
+    version = catalog_version()
+    if force or _catalog is None or version != _catalog.version:
+        catalog = load_catalog(version)
+        if _catalog is None:
+            # The first load runs inline in a request: don't make it wait for the index
+            catalog.build_index_in_background()
+        else:
+            # Reloads run in the background: index before publishing, so the previous
+            # catalog keeps serving ranked results meanwhile
+            catalog.build_index()
+        _catalog = catalog
+        print(f"DEBUG - Loaded course catalog version {version}: {len(catalog.courses)} courses, "
+              f"{len(catalog.schedules)} schedules")
+    return _catalog
+
+
+def reload_catalog(force: bool = False) -> Catalog:
+    """Reload the catalog if a newer import was committed (or always, with force=True)."""
+    with _reload_lock:
+        return _reload(force)
+
+
+def _reload_in_background() -> None:
+    # Runs with _reload_lock already acquired by get_catalog()
+    try:
+        _reload(False)
+    except Exception as e:
+        print(f"DEBUG - Course catalog reload failed, keeping version {_catalog.version}: {e}")
+    finally:
+        _reload_lock.release()
+        connections.close_all()
+
+
+def get_catalog() -> Catalog:
+    """
+    Return the cached catalog, checking for a newer import at most every
+    CATALOG_RELOAD_INTERVAL seconds. The check and any rebuild run on a background
+    thread while requests carry on with the current catalog; only the very first
+    load happens inline (its index is built in the background). Reads the database,
+    so call it from sync code.
+    """
+    catalog = _catalog
+    if catalog is None:
+        return reload_catalog()
+    interval = getattr(settings, "CATALOG_RELOAD_INTERVAL", 5.0)
+    if time.monotonic() - _last_check >= interval and _reload_lock.acquire(blocking=False):
+        # Only one thread checks the version at a time
+        threading.Thread(target=_reload_in_background, name="chat-catalog-reload", daemon=True).start()
+    return catalog
+
+
+def invalidate_catalog() -> None:
+    """Make the next get_catalog() check the version (called when an import commits)."""
+    global _last_check
+    _last_check = float("-inf")
@@ -0,0 +1,159 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    # Optional: exact token counts for OpenAI models
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Context policies for the history sent to specialist agents
+POLICY_ALL = "all"                  # every prior turn
+POLICY_LAST_N = "last_n"            # the last max_turns turns
+POLICY_TOKEN_BUDGET = "token_budget"  # the most recent turns that fit in token_budget
+POLICY_PINNED = "pinned"            # the first turn plus the most recent turns within both limits
+POLICIES = [POLICY_ALL, POLICY_LAST_N, POLICY_TOKEN_BUDGET, POLICY_PINNED]
+
+# Approximate per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Token count of a piece of text: exact with tiktoken installed, otherwise the usual
+    ~4 characters per token estimate for English text.
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def apply_context_policy(history: List[Dict[str, str]], policy: str = POLICY_ALL,
+                         max_turns: Optional[int] = None,
+                         token_budget: Optional[int] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Trim prior conversation turns (one turn = one user or assistant message) according to
+    the policy. The current user message is not part of `history` and is never dropped.
+    Returns: (kept_history, report) where report holds turns/tokens sent and dropped.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown context policy '{policy}'. Expected one of: {', '.join(POLICIES)}")
+
+    costs = [message_tokens(m) for m in history]
+    keep = [True] * len(history)
+
+    if policy != POLICY_ALL and history:
+        pinned = 1 if policy == POLICY_PINNED else 0
+        turn_limit = max_turns if policy in (POLICY_LAST_N, POLICY_PINNED) and max_turns is not None else None
+        budget = token_budget if policy in (POLICY_TOKEN_BUDGET, POLICY_PINNED) and token_budget is not None else None
+
+        used_turns = pinned
+        used_tokens = sum(costs[:pinned])
+        # Walk back from the newest turn and stop at the first one that does not fit,
+        # so the window stays contiguous
+        cutoff = pinned
+        for i in range(len(history) - 1, pinned - 1, -1):
+            if turn_limit is not None and used_turns + 1 > turn_limit:
+                cutoff = i + 1
+                break
+            if budget is not None and used_tokens + costs[i] > budget:
+                cutoff = i + 1
+                break
+            used_turns += 1
+            used_tokens += costs[i]
+        for i in range(pinned, cutoff):
+            keep[i] = False
+
+    kept = [m for m, k in zip(history, keep) if k]
+    report = {
+        "policy": policy,
+        "turns_sent": len(kept),
+        "turns_dropped": len(history) - len(kept),
+        "tokens_sent": sum(c for c, k in zip(costs, keep) if k),
+        "tokens_dropped": sum(c for c, k in zip(costs, keep) if not k),
+    }
+    return kept, report
+
+
+def needs_older_turns(recent: List[Dict[str, str]], policy: str = POLICY_ALL, max_turns: Optional[int] = None,
+                      token_budget: Optional[int] = None) -> bool:
+    """
+    Whether the policy's limits could keep turns older than `recent` (the newest turns),
+    i.e. whether the caller has to load the full history rather than just a recent window.
+    "all" relies on the session summary for turns older than the window, and "pinned"
+    only needs the first turn on top of it (the caller loads that one turn).
+    """
+    if policy == POLICY_LAST_N:
+        return max_turns is None or max_turns > len(recent)
+    if policy == POLICY_TOKEN_BUDGET:
+        return token_budget is None or sum(message_tokens(m) for m in recent) < token_budget
+    return False
+
+
+# Longest line kept per turn, and total length, of the deterministic summary
+SUMMARY_LINE_CHARS = 160
+SUMMARY_MAX_CHARS = 2000
+
+
+def extractive_summarizer(previous_summary: str, turns: List[Dict[str, str]]) -> str:
+    """
+    Deterministic local summarizer: one line per folded turn with the speaker and the
+    first sentence of what they said, appended to the previous summary. Oldest lines are
+    dropped once the summary exceeds SUMMARY_MAX_CHARS. Used in tests and benchmarks,
+    and as a no-cost option in production.
+    """
+    lines = previous_summary.splitlines() if previous_summary else []
+    for turn in turns:
+        text = " ".join(turn.get("text", "").split())
+        first_sentence = text.split(". ")[0]
+        if len(first_sentence) > SUMMARY_LINE_CHARS:
+            first_sentence = first_sentence[:SUMMARY_LINE_CHARS - 3] + "..."
+        lines.append(f"{turn.get('sender', 'unknown')}: {first_sentence}")
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+async def compact_history(session_messages: List[Dict[str, Any]], summary: Optional[Dict[str, Any]],
+                          summarizer, threshold: int, keep_recent: int) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Fold older turns into a running summary once the unsummarized history grows past
+    `threshold` turns, keeping the newest `keep_recent` turns verbatim.
+
+    session_messages are the stored messages newer than the current summary, oldest
+    first; each needs 'id', 'sender' and 'text'. summarizer is called as
+    summarizer(previous_summary_text, turns) and may be sync or async.
+    Returns: (remaining_messages, summary) where summary is
+    { 'text': ..., 'through_id': <id of the last folded message>, 'turns': <total folded> },
+    or the summary passed in if nothing was folded.
+    """
+    conversational = [m for m in session_messages if m.get("sender") != "tool"]
+    if threshold <= 0 or len(conversational) <= threshold:
+        return session_messages, summary
+
+    to_fold = conversational[:len(conversational) - keep_recent]
+    # Turns still queued for writing have no id yet; fold them on a later turn
+    if not to_fold or any(m["id"] is None for m in to_fold):
+        return session_messages, summary
+
+    previous_text = (summary or {}).get("text", "")
+    new_text = summarizer(previous_text, [{"sender": m["sender"], "text": m["text"]} for m in to_fold])
+    if hasattr(new_text, "__await__"):
+        new_text = await new_text
+
+    through_id = to_fold[-1]["id"]
+    cut = next(i for i, m in enumerate(session_messages) if m["id"] == through_id) + 1
+    new_summary = {
+        "text": new_text,
+        "through_id": through_id,
+        "turns": (summary or {}).get("turns", 0) + len(to_fold),
+    }
+    return session_messages[cut:], new_summary
@@ -0,0 +1,118 @@
+import time
+import asyncio
+import threading
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class Deadline:
+    """
+    Time budget for one request, shared by its stages (router, specialist, ...).
+    A budget of 0 or less means no deadline.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds > 0 else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None without a deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def stage_timeout(self, cap: float = 0) -> Optional[float]:
+        """Timeout for the next stage: what is left of the budget, at most `cap` seconds (0: no cap)."""
+        remaining = self.remaining()
+        if cap > 0:
+            return cap if remaining is None else min(cap, remaining)
+        return remaining
+
+
+class StageTimer:
+    """
+    Per-stage latency samples (a bounded window of recent successful calls) and
+    timeout / hedge counters, for the metrics endpoint and hedge delays.
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples: Dict[str, deque] = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self._window)).append(seconds)
+
+    def percentile(self, stage: str, pct: float, min_samples: int = 20) -> Optional[float]:
+        """The stage's pct-th percentile latency, or None with fewer than min_samples samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def stats(self) -> Dict[str, Any]:
+        stages = {}
+        with self._lock:
+            names = list(self._samples)
+        for stage in names:
+            stages[stage] = {
+                "p50_ms": round((self.percentile(stage, 50, 1) or 0) * 1000, 1),
+                "p95_ms": round((self.percentile(stage, 95, 1) or 0) * 1000, 1),
+            }
+        return {"latency": stages, **self.counts}
+
+
+stage_timer = StageTimer()
+
+
+async def run_stage(stage: str, make_call: Callable[[], Awaitable[Any]], timeout: Optional[float],
+                    hedge_after: Optional[float] = None) -> Any:
+    """
+    Await make_call() within `timeout` seconds (None: no limit). With hedge_after, a
+    second attempt starts if the first has not finished after that many seconds; the
+    first attempt to succeed wins and the other is cancelled. Raises asyncio.TimeoutError
+    when the time runs out (counted as '<stage>_timeouts'), or the error of the last
+    attempt to fail.
+    """
+    start = time.monotonic()
+    deadline = start + timeout if timeout is not None else None
+    first = asyncio.ensure_future(make_call())
+    attempts = {first}
+    hedged = False
+    error: Optional[BaseException] = None
+    try:
+        while attempts:
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not hedged and hedge_after is not None:
+                hedge_wait = max(0.0, start + hedge_after - time.monotonic())
+                wait = hedge_wait if wait is None else min(wait, hedge_wait)
+            done, _ = await asyncio.wait(attempts, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                attempts.discard(attempt)
+                if attempt.exception() is None:
+                    stage_timer.record(stage, time.monotonic() - start)
+                    if hedged:
+                        stage_timer.counts[f"{stage}_hedges_won" if attempt is not first else f"{stage}_hedges_lost"] += 1
+                    return attempt.result()
+                error = attempt.exception()
+            if done:
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                stage_timer.counts[f"{stage}_timeouts"] += 1
+                raise asyncio.TimeoutError(f"{stage} did not finish within {timeout:.1f}s")
+            if not hedged and hedge_after is not None:
+                hedged = True
+                attempts.add(asyncio.ensure_future(make_call()))
+                stage_timer.counts[f"{stage}_hedges"] += 1
+                print(f"DEBUG - {stage} slower than {hedge_after:.2f}s, sending a hedged second attempt")
+        raise error
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
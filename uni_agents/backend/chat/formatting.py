@@ -0,0 +1,214 @@
+import re
+from typing import Iterable, List
+
+# Formatting passes applied to agent replies, in order
+_NUMBERED_BOLD = re.compile(r'(\d+\.\s\*\*)')
+_SENTENCE_THEN_NUMBER = re.compile(r'(\.\s)(\d+\.\s)')
+_CLOSING_QUESTION = re.compile(r'(\.\s)(Would you like|Do you need|Is there anything)')
+_EXTRA_NEWLINES = re.compile(r'\n{3,}')
+
+# Escape sequences replaced in agent output, in order (each pass sees the previous pass's output)
+_UNESCAPES = [('\\n', '\n'), ('\\"', '"'), ('\\\\', '\\'), ('\\t', '\t')]
+
+
+def format_agent_response(text: str) -> str:
+    """
+    Format agent responses for better readability.
+    """
+    if not isinstance(text, str):
+        return str(text)
+
+    # Add line breaks before numbered items (1., 2., etc.)
+    text = _NUMBERED_BOLD.sub(r'\n\n\1', text)
+
+    # Add line breaks after sentences that end with periods followed by numbers
+    text = _SENTENCE_THEN_NUMBER.sub(r'\1\n\n\2', text)
+
+    # Add line breaks before "Would you like" or similar closing questions
+    text = _CLOSING_QUESTION.sub(r'\1\n\n\2', text)
+
+    # Clean up multiple consecutive newlines
+    text = _EXTRA_NEWLINES.sub('\n\n', text)
+
+    # Remove leading/trailing whitespace
+    text = text.strip()
+
+    return text
+
+
+def clean_agent_output(final_output):
+    """
+    Strip wrapping quotes, unescape escape sequences and apply format_agent_response.
+    """
+    if isinstance(final_output, str):
+        # Remove extra quotes and unescape newlines
+        if final_output.startswith('"') and final_output.endswith('"'):
+            final_output = final_output[1:-1]
+
+        # Unescape common escape sequences
+        for old, new in _UNESCAPES:
+            final_output = final_output.replace(old, new)
+
+        # Additional formatting improvements
+        final_output = format_agent_response(final_output)
+
+    return final_output
+
+
+def _prefix_alternation(phrases: List[str]) -> str:
+    prefixes = {phrase[:i] for phrase in phrases for i in range(1, len(phrase))}
+    return "(?:" + "|".join(re.escape(p) for p in sorted(prefixes, key=len, reverse=True)) + ")"
+
+
+class _StreamReplace:
+    """
+    Incremental str.replace for a two-character escape sequence. A trailing first
+    character is held back until the next chunk shows whether it starts a sequence.
+    """
+
+    def __init__(self, old: str, new: str):
+        self.old, self.new = old, new
+        self._pending = ""
+
+    def feed(self, chunk: str, final: bool = False) -> str:
+        text = self._pending + chunk
+        self._pending = ""
+        out = []
+        i = 0
+        while True:
+            j = text.find(self.old, i)
+            if j < 0:
+                break
+            out.append(text[i:j])
+            out.append(self.new)
+            i = j + len(self.old)
+        if not final and len(text) > i and text[-1] == self.old[0]:
+            out.append(text[i:-1])
+            self._pending = text[-1]
+        else:
+            out.append(text[i:])
+        return "".join(out)
+
+
+class _StreamSub:
+    """
+    Incremental re.sub. `tail` matches (anchored at the end) any suffix that could still
+    grow into a match; that suffix is held back, never a complete match that it overlaps.
+    Everything before it is substituted and released.
+    """
+
+    def __init__(self, pattern, repl: str, tail: str, start_chars: str):
+        self.pattern, self.repl = pattern, repl
+        self.tail = re.compile(tail + r"\Z")
+        # Characters a match must start with; most chunks contain none and pass straight through
+        self.start_chars = re.compile(start_chars)
+        self._pending = ""
+
+    def feed(self, chunk: str, final: bool = False) -> str:
+        text = self._pending + chunk
+        if not self.start_chars.search(text):
+            self._pending = ""
+            return text
+        if final:
+            self._pending = ""
+            return self.pattern.sub(self.repl, text)
+        cut = self._safe_cut(text)
+        self._pending = text[cut:]
+        return self.pattern.sub(self.repl, text[:cut])
+
+    def _safe_cut(self, text: str) -> int:
+        spans = [m.span() for m in self.pattern.finditer(text)]
+        pos = 0
+        while True:
+            t = self.tail.search(text, pos)
+            if t is None:
+                return len(text)
+            cut = t.start()
+            inside = next((end for start, end in spans if start < cut < end), None)
+            if inside is None:
+                return cut
+            pos = inside
+
+
+class _StreamStrip:
+    """
+    Incremental str.strip: drops leading whitespace and holds trailing whitespace until
+    more text follows it.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._pending = ""
+
+    def feed(self, chunk: str, final: bool = False) -> str:
+        if not self._started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return ""
+            self._started = True
+        text = self._pending + chunk
+        if final:
+            self._pending = ""
+            return text.rstrip()
+        body = text.rstrip()
+        self._pending = text[len(body):]
+        return body
+
+
+class StreamingFormatter:
+    """
+    Chunk-by-chunk version of clean_agent_output for streamed replies.
+
+        formatter = StreamingFormatter()
+        for delta in deltas:
+            send(formatter.feed(delta))
+        send(formatter.finish())
+
+    The concatenated output equals clean_agent_output() of the concatenated input for
+    any chunking. Each stage holds back only the few characters that could still change
+    once the next chunk arrives, e.g. a trailing '3. *' before a possible '*'.
+    The wrapping-quote rule needs the last character, so a reply that starts with '"'
+    is buffered and formatted in one go at finish().
+    """
+
+    def __init__(self):
+        self._mode = None  # None until the first character, then 'stream' or 'buffer'
+        self._buffer: List[str] = []
+        self._stages = [_StreamReplace(old, new) for old, new in _UNESCAPES] + [
+            _StreamSub(_NUMBERED_BOLD, r'\n\n\1', r'\d+(?:\.(?:\s\*?)?)?', r'\d'),
+            _StreamSub(_SENTENCE_THEN_NUMBER, r'\1\n\n\2', r'\.(?:\s(?:\d+\.?)?)?', r'\.'),
+            _StreamSub(_CLOSING_QUESTION, r'\1\n\n\2',
+                       r'\.(?:\s' + _prefix_alternation(['Would you like', 'Do you need', 'Is there anything']) + r'?)?', r'\.'),
+            _StreamSub(_EXTRA_NEWLINES, '\n\n', r'\n+', r'\n'),
+            _StreamStrip(),
+        ]
+
+    def _run(self, text: str, final: bool) -> str:
+        for stage in self._stages:
+            text = stage.feed(text, final)
+        return text
+
+    def feed(self, chunk: str) -> str:
+        if not chunk:
+            return ""
+        if self._mode is None:
+            self._mode = "buffer" if chunk.startswith('"') else "stream"
+        if self._mode == "buffer":
+            self._buffer.append(chunk)
+            return ""
+        return self._run(chunk, final=False)
+
+    def finish(self) -> str:
+        if self._mode == "buffer":
+            return clean_agent_output("".join(self._buffer))
+        return self._run("", final=True)
+
+
+def format_stream(chunks: Iterable[str]) -> str:
+    """
+    Format a sequence of chunks with StreamingFormatter and return the full text.
+    """
+    formatter = StreamingFormatter()
+    parts = [formatter.feed(chunk) for chunk in chunks]
+    parts.append(formatter.finish())
+    return "".join(parts)
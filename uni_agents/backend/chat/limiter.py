@@ -0,0 +1,203 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextlib
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+# Priority for agents not listed in AGENT_PRIORITIES (lower runs first)
+DEFAULT_PRIORITY = 1
+
+
+class LimiterBusy(Exception):
+    """
+    No agent slot is available. status is 429 when the wait queue is full, 503 when the
+    request waited AGENT_QUEUE_TIMEOUT seconds without getting a slot; retry_after is a
+    suggested delay in seconds.
+    """
+
+    def __init__(self, message: str, status: int, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("agent", "future", "loop", "granted")
+
+    def __init__(self, agent: str, future: "asyncio.Future", loop):
+        self.agent = agent
+        self.future = future
+        self.loop = loop
+        self.granted = False
+
+
+class AgentLimiter:
+    """
+    Process-wide limit on concurrent agent runs (LLM calls).
+
+    At most max_concurrency runs are in flight, and at most quotas[agent] of them for
+    one agent. Callers that cannot run yet wait in a bounded queue ordered by priority
+    (then arrival), so a burst of poet requests cannot hold up routing. A waiter whose
+    agent is at its quota does not block waiters for other agents. When the queue is
+    full, acquire() fails at once with LimiterBusy (429); a waiter that gets no slot
+    within queue_timeout seconds fails with LimiterBusy (503).
+
+    State is guarded by a thread lock and waiters are woken on their own event loop,
+    so the limiter works however many loops the process runs.
+    """
+
+    def __init__(self, max_concurrency: int = 16, quotas: Optional[Dict[str, int]] = None,
+                 priorities: Optional[Dict[str, int]] = None, queue_size: int = 64, queue_timeout: float = 10.0):
+        self.max_concurrency = max_concurrency
+        self.quotas = dict(quotas or {})
+        self.priorities = dict(priorities or {})
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._active: Counter = Counter()
+        self._active_total = 0
+        self._waiters: List[tuple] = []  # heap of (priority, seq, _Waiter)
+        self._seq = itertools.count()
+        self._wait_times: deque = deque(maxlen=500)
+        self._run_times: deque = deque(maxlen=500)
+        self.counts: Counter = Counter()
+        self.max_queue_depth = 0
+
+    def _can_run(self, agent: str) -> bool:
+        if self.max_concurrency and self._active_total >= self.max_concurrency:
+            return False
+        quota = self.quotas.get(agent)
+        return quota is None or self._active[agent] < quota
+
+    def _take(self, agent: str) -> None:
+        self._active[agent] += 1
+        self._active_total += 1
+
+    def _dispatch(self) -> None:
+        # Called with the lock held: hand free slots to waiters in priority order
+        blocked = []
+        while self._waiters and (not self.max_concurrency or self._active_total < self.max_concurrency):
+            entry = heapq.heappop(self._waiters)
+            waiter = entry[2]
+            if waiter.future.done():
+                continue
+            if not self._can_run(waiter.agent):
+                blocked.append(entry)
+                continue
+            self._take(waiter.agent)
+            waiter.granted = True
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+        for entry in blocked:
+            heapq.heappush(self._waiters, entry)
+
+    def retry_after(self) -> int:
+        """Suggested seconds before retrying: the queue ahead divided by throughput."""
+        with self._lock:
+            run_times = list(self._run_times)
+            depth = len(self._waiters)
+        mean_run = sum(run_times) / len(run_times) if run_times else 1.0
+        slots = self.max_concurrency or 1
+        return max(1, min(60, math.ceil(mean_run * (depth + 1) / slots)))
+
+    def saturated(self) -> bool:
+        """True when a new waiter would be turned away (the queue is full)."""
+        with self._lock:
+            return bool(self.max_concurrency) and len(self._waiters) >= self.queue_size
+
+    async def acquire(self, agent: str) -> None:
+        start = time.monotonic()
+        with self._lock:
+            if not self.max_concurrency or (self._can_run(agent) and not self._waiters):
+                self._take(agent)
+                self.counts["granted"] += 1
+                self._wait_times.append(0.0)
+                return
+            if len(self._waiters) >= self.queue_size:
+                self.counts["rejected_queue_full"] += 1
+                full = True
+            else:
+                full = False
+                loop = asyncio.get_running_loop()
+                waiter = _Waiter(agent, loop.create_future(), loop)
+                priority = self.priorities.get(agent, DEFAULT_PRIORITY)
+                heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+                self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+                # A slot may already be free for this agent even though others are waiting
+                self._dispatch()
+        if full:
+            raise LimiterBusy(f"Agent queue is full ({self.queue_size} waiting)", 429, self.retry_after())
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                granted = waiter.granted
+                waiter.future.cancel()
+                self._waiters = [entry for entry in self._waiters if entry[2] is not waiter]
+                heapq.heapify(self._waiters)
+            if granted:
+                # The slot arrived just as we gave up; hand it on
+                self.release(agent, None)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.counts["rejected_wait_timeout"] += 1
+            raise LimiterBusy(f"No agent slot for {agent} within {self.queue_timeout:.0f}s", 503, self.retry_after())
+        with self._lock:
+            self.counts["granted"] += 1
+            self.counts["queued"] += 1
+            self._wait_times.append(time.monotonic() - start)
+
+    def release(self, agent: str, run_seconds: Optional[float]) -> None:
+        with self._lock:
+            self._active[agent] -= 1
+            if self._active[agent] <= 0:
+                del self._active[agent]
+            self._active_total -= 1
+            if run_seconds is not None:
+                self._run_times.append(run_seconds)
+            self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, agent: str):
+        """async with limiter.slot(agent_name): ... one agent run ..."""
+        await self.acquire(agent)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(agent, time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._wait_times)
+            queue_depth = len(self._waiters)
+            active = dict(self._active)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": active,
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+            **self.counts,
+        }
+
+
+def _resolve(future: "asyncio.Future") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+agent_limiter = AgentLimiter(
+    max_concurrency=getattr(settings, "AGENT_MAX_CONCURRENCY", 16),
+    quotas=getattr(settings, "AGENT_CONCURRENCY_QUOTAS", {}),
+    priorities=getattr(settings, "AGENT_PRIORITIES", {}),
+    queue_size=getattr(settings, "AGENT_QUEUE_SIZE", 64),
+    queue_timeout=getattr(settings, "AGENT_QUEUE_TIMEOUT", 10.0),
+)
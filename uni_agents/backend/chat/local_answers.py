@@ -0,0 +1,122 @@
+import re
+import datetime
+from typing import Any, Dict, Optional
+
+from .catalog import COURSE_CODE_PATTERN, get_catalog
+from .routing import get_rules
+from .tools import academic_calendar
+
+# Agent a local answer is attributed to
+LOCAL_ANSWER_AGENT = "Scheduling Assistant"
+
+# Longer messages are rarely a plain lookup ("Should I take CS320 if its final is ...")
+MAX_QUERY_WORDS = 14
+
+# Schedule facts a message can ask for, with the words that ask for them
+_FIELD_PATTERNS = {
+    "final": re.compile(r"\bfinals?\b", re.IGNORECASE),
+    "midterm": re.compile(r"\bmid-?terms?\b", re.IGNORECASE),
+    "start": re.compile(r"\b(?:starts?|begins?|first (?:class|day))\b", re.IGNORECASE),
+    "end": re.compile(r"\b(?:ends?|last (?:class|day))\b", re.IGNORECASE),
+    "location": re.compile(r"\b(?:where|location|room|building)\b", re.IGNORECASE),
+    "times": re.compile(r"\b(?:what time|times?|what days|meets?|meeting)\b", re.IGNORECASE),
+}
+# The question words that ask for each field: a lookup has to ask ("When is the CS320
+# final?"), not just mention it ("Is the CS320 final hard?", "CS320 final grades")
+_ASKS_DATE = re.compile(r"\b(?:when|(?:what|which) (?:day|date))\b", re.IGNORECASE)
+_QUESTION_PATTERNS = {
+    "final": _ASKS_DATE,
+    "midterm": _ASKS_DATE,
+    "start": _ASKS_DATE,
+    "end": _ASKS_DATE,
+    "location": re.compile(r"\b(?:where|(?:what|which) (?:room|building))\b", re.IGNORECASE),
+    "times": re.compile(r"\b(?:when|what time|(?:what|which) days)\b", re.IGNORECASE),
+}
+# Asking for advice or explanations needs the agent, even with a course code and a field
+_NOT_A_LOOKUP = re.compile(r"\b(?:should|why|how (?:hard|difficult)|recommend|prepare|study|worth|compare)\b",
+                           re.IGNORECASE)
+# Routing keywords for other agents that still fit a lookup ("the CS320 class final")
+_LOOKUP_KEYWORDS = {"class", "classes", "course", "courses"}
+
+# Answer templates by field. Each entry is tried in order; the first whose schedule
+# keys are all present is used.
+_TEMPLATES = {
+    "final": [("final_exam", "The {code} ({title}) final exam is on {final_exam}."),
+              ("final_presentation", "{code} ({title}) has a final presentation instead of an exam, on {final_presentation}.")],
+    "midterm": [("midterm_exam", "The {code} ({title}) midterm exam is on {midterm_exam}."),
+                ("midterm_presentation", "{code} ({title}) has a midterm presentation instead of an exam, on {midterm_presentation}.")],
+    "start": [("start_date", "{code} ({title}) starts on {start_date}.")],
+    "end": [("end_date", "{code} ({title}) ends on {end_date}.")],
+    "location": [("location", "{code} ({title}) meets in {location}.")],
+    "times": [("class_times", "{code} ({title}) meets {class_times}.")],
+}
+_NOTE = "Dates and rooms are subject to change, so check with your instructor."
+
+
+def _format_date(value: str) -> str:
+    try:
+        day = datetime.date.fromisoformat(value)
+    except ValueError:
+        return value
+    return f"{day:%A, %B} {day.day}, {day.year}"
+
+
+def _other_agent_topic(user_text: str) -> bool:
+    """
+    True when the routing rules match a query category of another agent (a poem, course
+    advice), apart from course codes and words that fit a lookup anyway.
+    """
+    rules = get_rules()
+    for match in rules.scan(user_text):
+        meta = rules.categories.get(match.category)
+        if meta is None or meta["scope"] != "query" or meta["agent"] == LOCAL_ANSWER_AGENT:
+            continue
+        if match.keyword in _LOOKUP_KEYWORDS or COURSE_CODE_PATTERN.fullmatch(match.keyword):
+            continue
+        return True
+    return False
+
+
+def detect_intent(user_text: str) -> Optional[Dict[str, str]]:
+    """
+    A structured schedule question: exactly one scheduled course code and exactly one
+    field (final, midterm, start, end, location or times), asked for with a question
+    word (when, where, what time, ...), and nothing for another agent. Returns
+    { code, field } or None when the message is anything else. Reads the catalog, so
+    call it from sync code.
+    """
+    if len(user_text.split()) > MAX_QUERY_WORDS or _NOT_A_LOOKUP.search(user_text):
+        return None
+    fields = [field for field, pattern in _FIELD_PATTERNS.items() if pattern.search(user_text)]
+    if "location" in fields and "times" in fields:
+        # "Where does CS320 meet?" asks for the room
+        fields.remove("times")
+    if len(fields) != 1 or not _QUESTION_PATTERNS[fields[0]].search(user_text):
+        return None
+    if _other_agent_topic(user_text):
+        return None
+
+    codes = get_catalog().scheduled_codes_in(user_text)
+    if len(codes) != 1:
+        return None
+    return {"code": codes[0], "field": fields[0]}
+
+
+def local_answer(user_text: str) -> Optional[Dict[str, Any]]:
+    """
+    Answer a structured schedule question from the academic_calendar data, without
+    an LLM call. Returns { agent, text, intent } or None if the message is not such
+    a question or the schedule does not have the requested fact.
+    """
+    intent = detect_intent(user_text)
+    if intent is None:
+        return None
+    data = academic_calendar(query=intent["code"])
+    schedule = data.get("schedule") or {}
+    for key, template in _TEMPLATES[intent["field"]]:
+        if key in schedule:
+            values = {name: _format_date(value) if name.endswith(("_date", "_exam", "_presentation")) else value
+                      for name, value in schedule.items()}
+            text = template.format(code=data["course_code"], title=data["course_title"], **values)
+            return {"agent": LOCAL_ANSWER_AGENT, "text": f"{text} {_NOTE}", "intent": intent}
+    return None
@@ -0,0 +1,139 @@
+import csv
+import sys
+import json
+import datetime
+import contextlib
+from typing import Any, Dict, Iterator, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from chat.catalog import SCHEDULE_FIELDS, invalidate_catalog
+from chat.models import CatalogImport, Course, CourseSchedule
+
+COURSE_FIELDS = ["title", "area", "level", "why"]
+DATE_FIELDS = [field for field in SCHEDULE_FIELDS if field not in ("class_times", "location")]
+
+
+def read_rows(stream, fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (line number, row) one at a time, so the file is never held in memory."""
+    if fmt == "csv":
+        # Line numbers count the header; a quoted field spanning lines shifts them
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_no, row
+        return
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise CommandError(f"line {line_no}: invalid JSON: {e}")
+        if not isinstance(row, dict):
+            raise CommandError(f"line {line_no}: expected a JSON object")
+        yield line_no, row
+
+
+def _text(row: Dict[str, Any], field: str, default: str = "") -> str:
+    value = row.get(field)
+    return default if value is None else str(value).strip()
+
+
+def course_from_row(line_no: int, row: Dict[str, Any]) -> Course:
+    code, title = _text(row, "code"), _text(row, "title")
+    if not code or not title:
+        raise CommandError(f"line {line_no}: a course needs a code and a title")
+    return Course(code=code, title=title, area=_text(row, "area").lower(),
+                  level=_text(row, "level").lower() or "undergrad", why=_text(row, "why"))
+
+
+def schedule_from_row(line_no: int, row: Dict[str, Any]) -> CourseSchedule:
+    code = _text(row, "course_code") or _text(row, "code")
+    if not code:
+        raise CommandError(f"line {line_no}: a schedule needs a course_code")
+    values = {"class_times": _text(row, "class_times"), "location": _text(row, "location")}
+    for field in DATE_FIELDS:
+        value = _text(row, field)
+        try:
+            values[field] = datetime.date.fromisoformat(value) if value else None
+        except ValueError:
+            raise CommandError(f"line {line_no}: {field} must be a YYYY-MM-DD date, got '{value}'")
+    return CourseSchedule(course_code=code, **values)
+
+
+# kind -> (model, unique field, updated fields, row parser)
+KINDS = {
+    CatalogImport.KIND_COURSES: (Course, "code", COURSE_FIELDS, course_from_row),
+    CatalogImport.KIND_SCHEDULES: (CourseSchedule, "course_code", SCHEDULE_FIELDS, schedule_from_row),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Import courses or course schedules from a CSV or JSONL export. Rows are read and "
+        "upserted in chunks (by course code) inside one transaction; workers pick up the new "
+        "catalog once it commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(KINDS), help="what the file contains")
+        parser.add_argument("path", help="CSV or JSONL file, or - for stdin")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="rows per bulk upsert")
+        parser.add_argument("--replace", action="store_true",
+                            help="delete the rows of this kind that are not in the file")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.lower().endswith(".csv") else "jsonl")
+        chunk_size = max(1, options["chunk_size"])
+        model, unique_field, update_fields, parse = KINDS[options["kind"]]
+
+        stream = sys.stdin if path == "-" else None
+        try:
+            if stream is None:
+                stream = open(path, newline="", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        # Only close the stream if it was opened here, never stdin
+        closing = contextlib.nullcontext(stream) if stream is sys.stdin else stream
+
+        with closing, transaction.atomic():
+            catalog_import = CatalogImport.objects.create(kind=options["kind"], source=path)
+            # Distinct codes: a repeated code is upserted again (last row wins) but counted once
+            seen = set()
+            chunk: Dict[str, Any] = {}
+            for line_no, row in read_rows(stream, fmt):
+                obj = parse(line_no, row)
+                obj.catalog_import = catalog_import
+                key = getattr(obj, unique_field)
+                # Keyed by code: a code repeated within one upsert is an error on PostgreSQL
+                chunk[key] = obj
+                seen.add(key)
+                if len(chunk) >= chunk_size:
+                    self._upsert(model, unique_field, update_fields, chunk)
+            if chunk:
+                self._upsert(model, unique_field, update_fields, chunk)
+
+            deleted = 0
+            if options["replace"]:
+                deleted, _ = model.objects.exclude(catalog_import=catalog_import).delete()
+            total = len(seen)
+            catalog_import.rows = total
+            catalog_import.save(update_fields=["rows"])
+            transaction.on_commit(invalidate_catalog)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total} {options['kind']} from {path} (catalog version {catalog_import.id}"
+            + (f", {deleted} removed" if options["replace"] else "") + ")"
+        ))
+
+    def _upsert(self, model, unique_field: str, update_fields, chunk: Dict[str, Any]) -> None:
+        model.objects.bulk_create(
+            list(chunk.values()),
+            update_conflicts=True,
+            unique_fields=[unique_field],
+            update_fields=update_fields + ["catalog_import"],
+        )
+        chunk.clear()
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-16 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="message",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["session", "created_at", "id"],
+                name="chat_msg_session_created_idx",
+            ),
+        ),
+    ]
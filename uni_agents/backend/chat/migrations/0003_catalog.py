@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_session_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogImport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('courses', 'Courses'), ('schedules', 'Schedules')], max_length=16)),
+                ('source', models.CharField(blank=True, max_length=512)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Course',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=32, unique=True)),
+                ('title', models.CharField(max_length=255)),
+                ('area', models.CharField(blank=True, max_length=128)),
+                ('level', models.CharField(default='undergrad', max_length=32)),
+                ('why', models.TextField(blank=True)),
+                ('catalog_import', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='chat.catalogimport')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CourseSchedule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_code', models.CharField(max_length=32, unique=True)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('midterm_exam', models.DateField(blank=True, null=True)),
+                ('final_exam', models.DateField(blank=True, null=True)),
+                ('midterm_presentation', models.DateField(blank=True, null=True)),
+                ('final_presentation', models.DateField(blank=True, null=True)),
+                ('class_times', models.CharField(blank=True, max_length=128)),
+                ('location', models.CharField(blank=True, max_length=128)),
+                ('catalog_import', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='chat.catalogimport')),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 
 class Session(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -10,5 +11,53 @@ class Message(models.Model):
     session = models.ForeignKey(Session, related_name="messages", on_delete=models.CASCADE)
     sender = models.CharField(max_length=128)  # 'user', 'Triage Agent', 'Course Advisor', etc
     text = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the message is received, which can be before the turn is written
+    created_at = models.DateTimeField(default=timezone.now)
     meta = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            # Every history read is "messages of one session in created_at order"
+            models.Index(fields=["session", "created_at", "id"], name="chat_msg_session_created_idx"),
+        ]
+
+
+class CatalogImport(models.Model):
+    """
+    One committed catalog import. The highest id is the catalog's data version: workers
+    compare it with the version they have cached to pick up new imports.
+    """
+    KIND_COURSES = "courses"
+    KIND_SCHEDULES = "schedules"
+    KIND_CHOICES = [(KIND_COURSES, "Courses"), (KIND_SCHEDULES, "Schedules")]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    source = models.CharField(max_length=512, blank=True)
+    rows = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Course(models.Model):
+    code = models.CharField(max_length=32, unique=True)
+    title = models.CharField(max_length=255)
+    area = models.CharField(max_length=128, blank=True)
+    level = models.CharField(max_length=32, default="undergrad")
+    why = models.TextField(blank=True)
+    # Import that last wrote the row (an import with --replace deletes the rows it did not write)
+    catalog_import = models.ForeignKey(CatalogImport, null=True, blank=True, on_delete=models.SET_NULL)
+
+    def as_dict(self):
+        return {"code": self.code, "title": self.title, "area": self.area, "level": self.level, "why": self.why}
+
+
+class CourseSchedule(models.Model):
+    course_code = models.CharField(max_length=32, unique=True)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    midterm_exam = models.DateField(null=True, blank=True)
+    final_exam = models.DateField(null=True, blank=True)
+    midterm_presentation = models.DateField(null=True, blank=True)
+    final_presentation = models.DateField(null=True, blank=True)
+    class_times = models.CharField(max_length=128, blank=True)
+    location = models.CharField(max_length=128, blank=True)
+    catalog_import = models.ForeignKey(CatalogImport, null=True, blank=True, on_delete=models.SET_NULL)
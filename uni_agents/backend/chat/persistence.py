@@ -0,0 +1,242 @@
+import time
+import queue
+import atexit
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+# Message write modes (MESSAGE_WRITE_MODE)
+MODE_SYNC = "sync"                  # each turn is written before the reply is returned
+MODE_WRITE_BEHIND = "write_behind"  # turns are queued and written in batches by a background thread
+MODES = [MODE_SYNC, MODE_WRITE_BEHIND]
+
+# Write-behind durability (MESSAGE_WRITE_DURABILITY)
+DURABILITY_QUEUED = "queued"    # acknowledged once queued; a crash loses what is still queued
+DURABILITY_FLUSHED = "flushed"  # acknowledged once the batch holding the turn is committed
+DURABILITIES = [DURABILITY_QUEUED, DURABILITY_FLUSHED]
+
+# Turns from a failed batch are retried this many times before they are dropped and
+# the failure is recorded for their session
+WRITE_RETRIES = 3
+
+
+class WritesPending(Exception):
+    """A session's queued messages were not committed within MESSAGE_WRITE_WAIT_TIMEOUT."""
+
+
+class WritesFailed(Exception):
+    """Acknowledged messages of a session were dropped after WRITE_RETRIES failed writes."""
+
+
+def write_messages(messages: List[Any]) -> List[Any]:
+    """
+    Insert messages (unsaved Message instances) in a single transaction.
+    """
+    from .models import Message
+    with transaction.atomic():
+        return Message.objects.bulk_create(messages)
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat messages.
+
+    submit() puts one turn's rows on a bounded in-process queue and returns at once;
+    a background thread collects up to batch_size turns (or whatever arrived within
+    flush_interval seconds) and writes them with one bulk_create in one transaction.
+    Pending rows are counted per session, so a reader can wait_for_session() and never
+    see fewer messages than were acknowledged. A turn that cannot be written is dropped
+    and recorded as a failure of its session, which take_failure() reports once, so the
+    next reader answers with an error instead of a short history. Queued turns are flushed at interpreter
+    exit. The queue is per process: with several workers, a session's history is only
+    guaranteed complete on the worker that handled its turns.
+    """
+
+    def __init__(self, maxsize: int = 1000, batch_size: int = 100, flush_interval: float = 0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._pending: Counter = Counter()
+        self._failed: Dict[str, str] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.counts: Counter = Counter()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-message-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def submit(self, session_id, messages: List[Any], on_written: Optional[Callable[[List[Any]], None]] = None,
+               on_failed: Optional[Callable[[List[Any]], None]] = None) -> bool:
+        """
+        Queue one turn's rows. on_written(messages) runs on the writer thread after they
+        are committed, on_failed(messages) instead if they are dropped. Returns False
+        without queueing anything if the queue is full or the writer is shutting down;
+        the caller should then write synchronously.
+        """
+        if self._stopping:
+            return False
+        self._ensure_started()
+        key = str(session_id)
+        with self._cond:
+            self._pending[key] += len(messages)
+        try:
+            self._queue.put_nowait((key, messages, on_written, on_failed))
+        except queue.Full:
+            self._done(key, len(messages))
+            self.counts["queue_full"] += 1
+            return False
+        self.counts["turns_queued"] += 1
+        return True
+
+    def pending(self, session_id) -> int:
+        with self._cond:
+            return self._pending.get(str(session_id), 0)
+
+    def wait_for_session(self, session_id, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every queued row of the session is committed. Returns False on timeout.
+        """
+        key = str(session_id)
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending.get(key), timeout)
+
+    def take_failure(self, session_id) -> Optional[str]:
+        """
+        The error that made the writer drop messages of the session since the last call,
+        or None. Cleared once taken, so it is reported to one reader.
+        """
+        with self._cond:
+            return self._failed.pop(str(session_id), None)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until the queue is empty and every row is committed."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop accepting turns, write what is queued and stop the thread."""
+        self._stopping = True
+        if self._thread is not None:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+
+    def _done(self, key: str, count: int) -> None:
+        with self._cond:
+            self._pending[key] -= count
+            if self._pending[key] <= 0:
+                del self._pending[key]
+            self._cond.notify_all()
+
+    def _next_batch(self) -> Optional[List[tuple]]:
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown: write this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _write_batch(self, batch: List[tuple]) -> Dict[int, Exception]:
+        """
+        Write a batch in one transaction. If that fails, write it turn by turn (with
+        retries) so one bad turn does not take the rest of the batch with it.
+        Returns: { index in batch: error } for the turns that were dropped
+        """
+        rows = [m for _, messages, _, _ in batch for m in messages]
+        try:
+            close_old_connections()
+            write_messages(rows)
+            self.counts["batches"] += 1
+            self.counts["rows_written"] += len(rows)
+            return {}
+        except Exception as e:
+            print(f"DEBUG - Batch write of {len(rows)} messages failed, writing turn by turn: {e}")
+
+        failed = {}
+        for index, (_, messages, _, _) in enumerate(batch):
+            for attempt in range(WRITE_RETRIES + 1):
+                for m in messages:
+                    m.pk = None
+                try:
+                    close_old_connections()
+                    write_messages(messages)
+                    self.counts["rows_written"] += len(messages)
+                    break
+                except Exception as e:
+                    if attempt == WRITE_RETRIES:
+                        for m in messages:
+                            m.pk = None
+                        self.counts["rows_dropped"] += len(messages)
+                        failed[index] = e
+                        print(f"ERROR - Dropping {len(messages)} queued messages after {WRITE_RETRIES} retries: {e}")
+                    else:
+                        time.sleep(0.1 * 2 ** attempt)
+        return failed
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            failed = self._write_batch(batch)
+            for index, (key, messages, on_written, on_failed) in enumerate(batch):
+                if index in failed:
+                    # Recorded before _done() wakes the session's waiters, so they see it
+                    with self._cond:
+                        self._failed[key] = str(failed[index])
+                    if on_failed is not None:
+                        on_failed(messages)
+                elif on_written is not None and messages[0].pk is not None:
+                    on_written(messages)
+                self._done(key, len(messages))
+        close_old_connections()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending_rows = sum(self._pending.values())
+            sessions_failed = len(self._failed)
+        return {
+            "mode": write_mode(),
+            "durability": getattr(settings, "MESSAGE_WRITE_DURABILITY", DURABILITY_QUEUED),
+            "queue_depth": self._queue.qsize(),
+            "pending_rows": pending_rows,
+            "sessions_failed": sessions_failed,
+            **self.counts,
+        }
+
+
+message_writer = MessageWriter(
+    maxsize=getattr(settings, "MESSAGE_WRITE_QUEUE_SIZE", 1000),
+    batch_size=getattr(settings, "MESSAGE_WRITE_BATCH_SIZE", 100),
+    flush_interval=getattr(settings, "MESSAGE_WRITE_FLUSH_INTERVAL", 0.05),
+)
+
+
+def write_mode() -> str:
+    mode = getattr(settings, "MESSAGE_WRITE_MODE", MODE_SYNC)
+    if mode not in MODES:
+        raise ValueError(f"Unknown MESSAGE_WRITE_MODE '{mode}'. Expected one of: {', '.join(MODES)}")
+    return mode
@@ -0,0 +1,317 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, NamedTuple
+
+# Agent names the routers can return
+AGENT_NAMES = ["Course Advisor", "University Poet", "Scheduling Assistant", "Triage Agent"]
+
+# Routing rules live in a declarative rule-set file (categories, keywords, priorities,
+# follow-up indicators and target agents). The file is compiled into one in-memory
+# matcher at startup and recompiled when it changes on disk; requests in flight keep
+# using the rule set they started with.
+DEFAULT_RULES_PATH = Path(__file__).with_name("routing_rules.json")
+
+# Reserved matcher categories for the follow-up tables
+FOLLOW_UP = "follow_up"
+PRONOUN = "pronoun"
+
+_END = ""
+_WORD_CHAR = re.compile(r"\w")
+
+
+class KeywordMatch(NamedTuple):
+    category: str
+    keyword: str
+    start: int
+    end: int
+
+
+def _trie_pattern(node: Dict[str, Any]) -> str:
+    """
+    Render a character trie as a regex. Alternatives only branch where keywords
+    diverge, so matching cost depends on keyword length, not on how many there are.
+    """
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch != _END]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if _END in node:
+        # Greedy optional: the longest keyword is tried first
+        body = "(?:" + body + ")?"
+    return body
+
+
+class KeywordMatcher:
+    """
+    Multi-pattern keyword matcher compiled once from { category: [keywords] }.
+
+    Keywords match on word boundaries. scan() makes a single pass over the text and
+    reports every (category, keyword, start, end) hit, including keywords nested in
+    longer ones ('when' inside 'when is', 'that' inside 'that course').
+    Positions refer to the lower-cased text.
+    """
+
+    def __init__(self, rules: Dict[str, List[str]]):
+        self.categories: Dict[str, List[str]] = {}
+        trie: Dict[str, Any] = {}
+        for category, keywords in rules.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                self.categories.setdefault(keyword, [])
+                if category not in self.categories[keyword]:
+                    self.categories[keyword].append(category)
+                node = trie
+                for ch in keyword:
+                    node = node.setdefault(ch, {})
+                node[_END] = True
+        self._trie = trie
+        # Zero-width lookahead so hits starting inside a longer hit are still found
+        self._pattern = re.compile(r"(?<!\w)(?=(" + _trie_pattern(trie) + r")(?!\w))") if trie else None
+
+    def scan(self, text: str) -> List[KeywordMatch]:
+        if self._pattern is None:
+            return []
+        text_lower = text.lower()
+        matches = []
+        for m in self._pattern.finditer(text_lower):
+            start = m.start()
+            longest = m.group(1)
+            # Walk the trie along the longest hit to pick up shorter keywords with the same start
+            node = self._trie
+            for i, ch in enumerate(longest):
+                node = node[ch]
+                if _END not in node:
+                    continue
+                end = start + i + 1
+                if end < len(text_lower) and _WORD_CHAR.match(text_lower, end):
+                    continue
+                keyword = longest[:i + 1]
+                for category in self.categories[keyword]:
+                    matches.append(KeywordMatch(category, keyword, start, end))
+        return matches
+
+
+class RoutingRules:
+    """
+    A compiled rule set: category metadata plus one KeywordMatcher over every keyword
+    (query categories, reply-content categories and the follow-up tables).
+    """
+
+    def __init__(self, spec: Dict[str, Any], source: str = ""):
+        categories = spec.get("categories") or {}
+        if not categories:
+            raise ValueError("Routing rules must define at least one category.")
+
+        self.source = source
+        self.version = spec.get("version")
+        self.digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        self.default_agent = spec.get("default_agent", "Triage Agent")
+
+        self.categories: Dict[str, Dict[str, Any]] = {}
+        keyword_rules: Dict[str, List[str]] = {}
+        for name, rule in categories.items():
+            if name in (FOLLOW_UP, PRONOUN):
+                raise ValueError(f"Category name '{name}' is reserved.")
+            if not rule.get("agent") or not rule.get("keywords"):
+                raise ValueError(f"Category '{name}' needs an 'agent' and a non-empty 'keywords' list.")
+            self.categories[name] = {
+                "agent": rule["agent"],
+                "priority": rule.get("priority", 100),
+                "weight": float(rule.get("weight", 1.0)),
+                "scope": rule.get("scope", "query"),
+            }
+            keyword_rules[name] = rule["keywords"]
+
+        follow_up = spec.get("follow_up") or {}
+        keyword_rules[FOLLOW_UP] = follow_up.get("indicators", [])
+        keyword_rules[PRONOUN] = follow_up.get("pronouns", [])
+        self.follow_up_max_words = follow_up.get("max_words", 8)
+        self.follow_up_confidence = follow_up.get("confidence", 0.8)
+        self.contextual_follow_up_confidence = follow_up.get("contextual_confidence", 0.6)
+
+        self.matcher = KeywordMatcher(keyword_rules)
+
+        # Categories in priority order for each scope (file order breaks ties)
+        self._order = {}
+        for scope in ("query", "response"):
+            names = [name for name, meta in self.categories.items() if meta["scope"] == scope]
+            self._order[scope] = sorted(names, key=lambda name: self.categories[name]["priority"])
+
+    def scan(self, text: str) -> List[KeywordMatch]:
+        return self.matcher.scan(text)
+
+    def pick_agent(self, categories: set, scope: str = "query") -> Optional[str]:
+        """
+        Agent of the highest-priority matched category in the given scope, if any.
+        """
+        for name in self._order[scope]:
+            if name in categories:
+                return self.categories[name]["agent"]
+        return None
+
+    def is_follow_up(self, categories: set) -> bool:
+        return FOLLOW_UP in categories
+
+    def is_contextual_follow_up(self, user_text: str, categories: set) -> bool:
+        return len(user_text.split()) <= self.follow_up_max_words and PRONOUN in categories
+
+
+def load_rules(path) -> RoutingRules:
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    return RoutingRules(spec, source=str(path))
+
+
+# Active rule set. Reloads build a new RoutingRules and swap this reference in one
+# assignment, so readers always see either the old or the new rule set, never a mix.
+_rules: Optional[RoutingRules] = None
+_rules_path = DEFAULT_RULES_PATH
+_rules_mtime: Optional[float] = None
+_reload_interval = 5.0
+_last_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def configure_rules(path=None, reload_interval: Optional[float] = None) -> RoutingRules:
+    """
+    Point the routers at a rule-set file and compile it. reload_interval is how often
+    (seconds) the file's mtime is checked for changes; 0 disables hot reload.
+    """
+    global _rules_path, _reload_interval
+    if path:
+        _rules_path = Path(path)
+    if reload_interval is not None:
+        _reload_interval = float(reload_interval)
+    return reload_rules(force=True)
+
+
+def reload_rules(force: bool = False) -> RoutingRules:
+    """
+    Recompile the rule set if the file changed (or always, with force=True).
+    An invalid file is reported and the previous rule set stays active.
+    """
+    global _rules, _rules_mtime, _last_check
+    with _reload_lock:
+        _last_check = time.monotonic()
+        mtime = None
+        try:
+            mtime = _rules_path.stat().st_mtime
+            if force or _rules is None or mtime != _rules_mtime:
+                new_rules = load_rules(_rules_path)
+                _rules, _rules_mtime = new_rules, mtime
+                print(f"DEBUG - Loaded routing rules from {_rules_path} (version {new_rules.version}, digest {new_rules.digest})")
+        except (OSError, ValueError) as e:
+            if _rules is None:
+                raise
+            # Remember the broken file's mtime so it is reported once, not on every check
+            _rules_mtime = mtime
+            print(f"DEBUG - Keeping current routing rules, reload of {_rules_path} failed: {e}")
+        return _rules
+
+
+def get_rules() -> RoutingRules:
+    """
+    Return the active rule set, picking up file changes at most every reload interval.
+    Callers should fetch it once per request and use that object throughout.
+    """
+    rules = _rules
+    if rules is None:
+        return reload_rules()
+    if _reload_interval and time.monotonic() - _last_check >= _reload_interval:
+        # Only one thread checks the file; the others carry on with the current rules
+        if not _reload_lock.locked():
+            return reload_rules()
+    return rules
+
+
+def matched_categories(matches: List[KeywordMatch]) -> set:
+    return {m.category for m in matches}
+
+
+def find_last_agent(session_messages: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+    """
+    Return the most recent agent that replied in the session, if any.
+    """
+    for msg in reversed(session_messages or []):
+        if msg.get('sender') not in ['user', 'You', 'tool']:
+            return msg.get('sender')
+    return None
+
+
+def last_turn_digest(session_messages: Optional[List[Dict[str, Any]]]) -> Dict[str, Optional[str]]:
+    """
+    The previous agent reply and the user message before it, excluding the current
+    (last) user message. Walks back from the end and stops as soon as both are found,
+    so the cost does not grow with the session.
+    Returns: { 'last_agent': ..., 'last_reply': ..., 'last_user': ... } (None where absent)
+    """
+    digest = {"last_agent": None, "last_reply": None, "last_user": None}
+    messages = session_messages or []
+    for i in range(len(messages) - 2, -1, -1):
+        msg = messages[i]
+        sender = msg.get('sender')
+        if sender in ['user', 'You']:
+            if digest["last_user"] is None:
+                digest["last_user"] = msg.get('text')
+        elif sender != 'tool' and digest["last_agent"] is None:
+            digest["last_agent"] = sender
+            digest["last_reply"] = msg.get('text')
+        if digest["last_agent"] is not None and digest["last_user"] is not None:
+            break
+    return digest
+
+
+def score_categories(matches: List[KeywordMatch], rules: RoutingRules) -> Dict[str, float]:
+    """
+    Score each specialist agent by the weighted distinct query keywords that matched.
+    """
+    scores = {}
+    seen = set()
+    for m in matches:
+        meta = rules.categories.get(m.category)
+        if meta is None or meta["scope"] != "query" or (m.category, m.keyword) in seen:
+            continue
+        seen.add((m.category, m.keyword))
+        scores[meta["agent"]] = scores.get(meta["agent"], 0.0) + meta["weight"]
+    return scores
+
+
+def classify_query(user_text: str, session_messages: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Local keyword classifier that returns a routing decision with a confidence in [0, 1].
+
+    Confidence grows with the strength of the winning category and shrinks with the
+    score of the runner-up, so a query that mentions several domains is left to the
+    Router Agent. Returns: { 'agent': agent_name, 'confidence': float, 'reason': str, 'scores': {...} }
+    """
+    rules = get_rules()
+    matches = rules.scan(user_text)
+    scores = score_categories(matches, rules)
+
+    if scores:
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        top_agent, top_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        strength = 1.0 - 0.5 ** top_score
+        margin = (top_score - runner_up) / top_score
+        return {
+            "agent": top_agent,
+            "confidence": round(strength * margin, 3),
+            "reason": "keywords",
+            "scores": scores,
+        }
+
+    # No domain keywords: look for a follow-up to the previous specialist
+    categories = matched_categories(matches)
+    last_agent = find_last_agent(session_messages)
+    if last_agent and last_agent != rules.default_agent:
+        if rules.is_follow_up(categories):
+            return {"agent": last_agent, "confidence": rules.follow_up_confidence, "reason": "follow_up", "scores": scores}
+        if rules.is_contextual_follow_up(user_text, categories):
+            return {"agent": last_agent, "confidence": rules.contextual_follow_up_confidence, "reason": "contextual_follow_up", "scores": scores}
+
+    return {"agent": rules.default_agent, "confidence": 0.0, "reason": "no_match", "scores": scores}
@@ -0,0 +1,219 @@
+import re
+import heapq
+import math
+import operator
+from bisect import bisect_right
+from collections import Counter
+from functools import lru_cache
+from itertools import compress, repeat
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Fields indexed for course search and how much a term in each counts (BM25F-style)
+FIELD_WEIGHTS = {"code": 3.0, "title": 2.0, "area": 1.5, "why": 1.0, "level": 0.5}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# How far the conjunctive search lowers its score bar per round, as a fraction of the
+# best possible score (doubling each round)
+_CONJUNCTIVE_STEP = 0.02
+
+# Postings per list the threshold algorithm reads before the conjunctive search is tried
+# (ties at the top of lists that mostly share their courses finish well within it)
+_SHALLOW_DEPTH = 8
+
+_ANY_LEVEL = ""
+_TOKEN = re.compile(r"[a-z]+|\d+")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"a", "an", "and", "the", "of", "for", "in", "on", "to", "with", "about", "or", "by", "at", "is"}
+
+
+def _normalize(token: str) -> str:
+    # Light plural folding, applied to documents and queries alike
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def area_term(text: str) -> str:
+    """Extra term for a whole area name, so 'data science' ranks Data Science courses above 'Data Structures'."""
+    return "area:" + " ".join(_normalize(t) for t in _TOKEN.findall((text or "").lower()))
+
+
+@lru_cache(maxsize=65536)
+def tokenize(text: str) -> Tuple[str, ...]:
+    """
+    Lower-cased word tokens with letters and digits split ('cs320' -> 'cs', '320') plus
+    each mixed alphanumeric word whole ('cs320'), so course codes match either way.
+    Cached: catalog fields (areas, levels, title words) repeat a lot.
+    """
+    text = (text or "").lower()
+    tokens = [_normalize(t) for t in _TOKEN.findall(text) if t not in _STOPWORDS]
+    tokens.extend(w for w in _WORD.findall(text) if not w.isalpha() and not w.isdigit())
+    return tuple(tokens)
+
+
+class CourseIndex:
+    """
+    Inverted index over course code, title, area, level and description ('why'),
+    ranked with BM25 (field-weighted term frequencies; a query that names a whole
+    area also matches that area as one term).
+
+    Built once per catalog. Every posting stores the term's precomputed BM25 impact
+    for that course, and each term's postings are kept per level, sorted by impact.
+    A multi-term search runs the threshold algorithm (read the query terms' lists in
+    impact order, stop as soon as no unseen course can enter the top `limit`) for a
+    few postings, which settles queries whose best courses lead every list. Otherwise
+    it tries the conjunctive path: above the best score a course missing one of the
+    terms can reach, every hit contains all of them with a high impact in each, so
+    the candidates are the intersection of the lists' prefixes. Only when the top
+    needs courses that miss a term does the threshold algorithm run to the end.
+    Either way a lookup touches a few postings however large the catalog is.
+    """
+
+    def __init__(self, courses: Iterable[Dict[str, Any]]):
+        self.courses: List[Dict[str, Any]] = list(courses)
+        doc_terms: List[Counter] = []
+        doc_lengths: List[float] = []
+        for course in self.courses:
+            weighted = Counter()
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(str(course.get(field, ""))):
+                    weighted[token] += weight
+            weighted[area_term(course.get("area", ""))] += FIELD_WEIGHTS["area"]
+            doc_terms.append(weighted)
+            doc_lengths.append(sum(weighted.values()))
+
+        n = len(self.courses)
+        avg_length = (sum(doc_lengths) / n) if n else 1.0
+        df = Counter(term for terms in doc_terms for term in terms)
+        idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+        # impacts[term][doc_id] = BM25 contribution of term to doc
+        self._impacts: Dict[str, Dict[int, float]] = {}
+        doc_ids_by_term: Dict[str, Dict[str, List[int]]] = {}
+        for doc_id, terms in enumerate(doc_terms):
+            norm = K1 * (1 - B + B * doc_lengths[doc_id] / avg_length)
+            level = self.courses[doc_id].get("level", "")
+            for term, tf in terms.items():
+                term_impacts = self._impacts.get(term)
+                if term_impacts is None:
+                    term_impacts = self._impacts[term] = {}
+                    doc_ids_by_term[term] = {_ANY_LEVEL: []}
+                term_impacts[doc_id] = idf[term] * tf * (K1 + 1) / (tf + norm)
+                by_level = doc_ids_by_term[term]
+                by_level[_ANY_LEVEL].append(doc_id)
+                if level != _ANY_LEVEL:
+                    by_level.setdefault(level, []).append(doc_id)
+
+        # Postings per term and level as parallel lists: negated impacts (ascending, for
+        # bisect) and doc ids, best first. The sort is stable, so ties stay in catalog order.
+        self._postings: Dict[str, Dict[str, Tuple[List[float], List[int]]]] = {}
+        for term, by_level in doc_ids_by_term.items():
+            neg_impact = {doc_id: -score for doc_id, score in self._impacts[term].items()}.__getitem__
+            self._postings[term] = postings = {}
+            for level, doc_ids in by_level.items():
+                doc_ids.sort(key=neg_impact)
+                postings[level] = (list(map(neg_impact, doc_ids)), doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.courses)
+
+    def search(self, query: str, level: Optional[str] = None, limit: int = 4) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Top `limit` courses for the query, optionally restricted to one level.
+        Returns: [(score, course), ...] best first; empty if no query term is indexed.
+        """
+        if limit <= 0:
+            return []
+        terms = list(dict.fromkeys(tokenize(query) + (area_term(query),)))
+        lists = []
+        impacts = []
+        for term in terms:
+            postings = self._postings.get(term, {}).get(level or _ANY_LEVEL)
+            if postings:
+                lists.append(postings)
+                impacts.append(self._impacts[term])
+        if not lists:
+            return []
+
+        if len(lists) == 1:
+            neg_scores, doc_ids = lists[0]
+            top = [(-neg_score, doc_id) for neg_score, doc_id in zip(neg_scores[:limit], doc_ids[:limit])]
+        else:
+            top = (self._threshold_top(lists, impacts, limit, max_depth=_SHALLOW_DEPTH)
+                   or self._conjunctive_top(lists, impacts, limit)
+                   or self._threshold_top(lists, impacts, limit))
+        return [(round(score, 4), self.courses[doc_id]) for score, doc_id in top]
+
+    def _conjunctive_top(self, lists: List[Tuple[List[float], List[int]]], impacts: List[Dict[int, float]],
+                         limit: int) -> Optional[List[Tuple[float, int]]]:
+        """
+        Top `limit` among courses that contain every query term, or None when that
+        cannot be decided without also ranking courses that miss a term.
+
+        Lowers a score bar `theta` from the best possible total. While theta is above
+        the best a course missing a term can reach (all maxima but the smallest), a
+        course scoring theta or more has every term, each with an impact of at least
+        theta minus the other terms' maxima: a prefix of that term's list. Once enough
+        candidates in the prefixes' intersection reach theta, they hold the top.
+        """
+        maxima = [-neg_scores[0] for neg_scores, _ in lists]
+        best_total = sum(maxima)
+        best_partial = best_total - min(maxima)
+        theta = best_total
+        step = best_total * _CONJUNCTIVE_STEP
+        while theta > best_partial:
+            # Slack for float rounding: an extra candidate is harmless, a missing one is not
+            needed = [theta - (best_total - best) - 1e-9 for best in maxima]
+            prefixes = [bisect_right(neg_scores, -need) for (neg_scores, _), need in zip(lists, needed)]
+            # Walk the shortest prefix and keep the courses that clear the bar in every other list
+            shortest = min(range(len(lists)), key=prefixes.__getitem__)
+            candidates = lists[shortest][1][:prefixes[shortest]]
+            for i, term_impacts in enumerate(impacts):
+                if i != shortest and candidates:
+                    passed = map(needed[i].__le__, map(term_impacts.get, candidates, repeat(0.0)))
+                    candidates = list(compress(candidates, passed))
+            if len(candidates) >= limit:
+                totals = list(map(impacts[0].__getitem__, candidates))
+                for term_impacts in impacts[1:]:
+                    totals = list(map(operator.add, totals, map(term_impacts.__getitem__, candidates)))
+                hits = [(-total, doc_id) for total, doc_id in zip(totals, candidates) if total >= theta]
+                if len(hits) >= limit:
+                    return [(-neg_total, doc_id) for neg_total, doc_id in heapq.nsmallest(limit, hits)]
+            theta -= step
+            step *= 2
+        return None
+
+    def _threshold_top(self, lists: List[Tuple[List[float], List[int]]], impacts: List[Dict[int, float]],
+                       limit: int, max_depth: Optional[int] = None) -> Optional[List[Tuple[float, int]]]:
+        """Threshold algorithm; None if it has not finished after `max_depth` postings per list."""
+        heap: List[Tuple[float, int]] = []  # min-heap of (score, -doc_id): worst of the top on top
+        seen = set()
+        depth = 0
+        while True:
+            threshold = 0.0
+            progressed = False
+            for neg_scores, doc_ids in lists:
+                if depth >= len(doc_ids):
+                    continue
+                progressed = True
+                threshold -= neg_scores[depth]
+                doc_id = doc_ids[depth]
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                total = sum(term_impacts.get(doc_id, 0.0) for term_impacts in impacts)
+                item = (total, -doc_id)
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            # No unseen course can score above the sum of the current positions
+            if not progressed or (len(heap) >= limit and heap[0][0] >= threshold):
+                break
+            depth += 1
+            if depth == max_depth:
+                return None
+        return [(score, -neg_id) for score, neg_id in sorted(heap, reverse=True)]
@@ -0,0 +1,219 @@
+import threading
+from typing import Dict, Any, List, Optional
+from django.conf import settings
+
+from .cache import TTLCache
+
+# Per-session conversation state, so a message turn does not reload the transcript.
+# Holds the last agent, the turn count and a bounded window of recent turns in two
+# formats: session messages ({ id, sender, text }) for routing and summary compaction,
+# and specialist history ({ role, content }). Updated incrementally as messages are
+# stored; rebuilt from the last few rows of the session on a cache miss. 'evicted'
+# counts unsummarized turns that have fallen out of the window (see load_history).
+#
+# A cached state is only used while its last_message_id is still the session's newest
+# message, so a worker that missed turns handled elsewhere rebuilds it. Set
+# SESSION_STATE_BACKEND to a CACHES alias when running several workers, so they can
+# share states instead of each rebuilding after the others' turns.
+#
+# The cache only ever holds private copies: load_state() hands out a copy and
+# save_state() stores one, so concurrent requests on a session (and the write-behind
+# thread filling in ids) never mutate the same lists.
+session_state_cache = TTLCache(
+    "session_state",
+    maxsize=getattr(settings, "SESSION_STATE_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "SESSION_STATE_CACHE_TTL", 1800),
+    shared_backend=getattr(settings, "SESSION_STATE_BACKEND", ""),
+)
+
+# Makes fill_ids' read-modify-write atomic with respect to save_state
+_state_lock = threading.Lock()
+
+
+def window_size() -> int:
+    """
+    Number of recent turns kept in the state. Always more than the summary threshold,
+    so compaction still sees enough turns to fire.
+    """
+    window = getattr(settings, "SESSION_STATE_WINDOW", 40)
+    return max(window, getattr(settings, "CONVERSATION_SUMMARY_THRESHOLD", 0) + 1)
+
+
+def history_item(sender: str, text: str) -> Dict[str, str]:
+    """Specialist history entry for a session message (no agent name prefix)."""
+    return {"role": "user" if sender == "user" else "assistant", "content": text}
+
+
+def new_state() -> Dict[str, Any]:
+    return {"last_agent": None, "turn_count": 0, "last_message_id": None, "messages": [], "history": [], "evicted": 0}
+
+
+def copy_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a state whose window lists and entries can be changed independently."""
+    return {**state,
+            "messages": [dict(entry) for entry in state["messages"]],
+            "history": [dict(item) for item in state["history"]]}
+
+
+def append_message(state: Dict[str, Any], message_id: Optional[int], sender: str, text: str) -> Optional[Dict[str, Any]]:
+    """
+    Record a newly stored message and return its window entry. Tool messages only move
+    last_message_id; they are never part of the conversation window (returns None).
+    message_id is None for a message still queued for writing (see persistence); the
+    writer fills it in once the row exists.
+    """
+    state["last_message_id"] = message_id
+    if sender == "tool":
+        return None
+    entry = {"id": message_id, "sender": sender, "text": text}
+    state["messages"].append(entry)
+    state["history"].append(history_item(sender, text))
+    state["turn_count"] += 1
+    if sender not in ["user", "You"]:
+        state["last_agent"] = sender
+
+    overflow = len(state["messages"]) - window_size()
+    if overflow > 0:
+        del state["messages"][:overflow]
+        del state["history"][:overflow]
+        state["evicted"] = state.get("evicted", 0) + overflow
+    return entry
+
+
+def fill_ids(session_id, written: List[Any]) -> None:
+    """
+    Give the cached state's queued entries (id None) the ids of their rows once
+    write-behind has written them, and store the state again so a shared backend and
+    other workers see the ids too (compaction only folds turns with an id). Runs on the
+    writer thread; turns are written in order, so they are the oldest queued entries.
+    If a request saves a state loaded before this ran, the ids are missing again and the
+    next call finds its entries out of step, which rebuilds the state from the database.
+    """
+    with _state_lock:
+        state = session_state_cache.get(str(session_id))
+        if state is None:
+            return
+        state = copy_state(state)
+        queued = [entry for entry in state["messages"] if entry["id"] is None]
+        for entry, m in zip(queued, [m for m in written if m.sender != "tool"]):
+            if entry["sender"] != m.sender or entry["text"] != m.text:
+                # The window moved on (or another worker's turn got in between); rebuild it
+                session_state_cache.delete(str(session_id))
+                return
+            entry["id"] = m.pk
+        if written and all(entry["id"] is not None for entry in state["messages"]):
+            # Nothing of the session is queued any more: its newest row is this turn's last
+            state["last_message_id"] = written[-1].pk
+        session_state_cache.set(str(session_id), state)
+
+
+def drop_through(state: Dict[str, Any], through_id: int) -> Dict[str, Any]:
+    """Remove window turns up to through_id, once they are folded into the session summary."""
+    keep = next((i for i, m in enumerate(state["messages"]) if m["id"] is None or m["id"] > through_id),
+                len(state["messages"]))
+    del state["messages"][:keep]
+    del state["history"][:keep]
+    # Turns that fell out of the window earlier are older still; compaction folds them
+    # too (see load_evicted), so they are behind the summary as well
+    state["evicted"] = 0
+    return state
+
+
+def apply_summary(session_id, through_id: int) -> None:
+    """
+    drop_through() on the cached state once a summary has been saved. Runs after the
+    turn, so it edits whatever state is cached now rather than the turn's own copy,
+    which a later turn may already have replaced.
+    """
+    with _state_lock:
+        state = session_state_cache.get(str(session_id))
+        if state is None:
+            return
+        session_state_cache.set(str(session_id), drop_through(copy_state(state), through_id))
+
+
+async def build_state(session) -> Dict[str, Any]:
+    """
+    Rebuild a session's state from the database: one query for the recent window
+    (newest turns not yet in the summary) and one count.
+    """
+    summary = session.metadata.get("summary") or {}
+    queryset = session.messages.exclude(sender="tool")
+    if summary:
+        queryset = queryset.filter(id__gt=summary["through_id"])
+    rows = [row async for row in queryset.order_by("-created_at", "-id").values("id", "sender", "text")[:window_size()]]
+    rows.reverse()
+
+    state = new_state()
+    state["messages"] = rows
+    state["history"] = [history_item(row["sender"], row["text"]) for row in rows]
+    state["turn_count"] = await session.messages.exclude(sender="tool").acount()
+    state["evicted"] = await queryset.acount() - len(rows) if len(rows) == window_size() else 0
+    state["last_message_id"] = await latest_message_id(session)
+    state["last_agent"] = next((row["sender"] for row in reversed(rows) if row["sender"] not in ["user", "You"]), None)
+    return state
+
+
+async def load_history(session) -> List[Dict[str, str]]:
+    """
+    The whole specialist history not covered by the session summary, read from the
+    database, for context policies that need turns older than the window.
+    """
+    summary = session.metadata.get("summary") or {}
+    queryset = session.messages.exclude(sender="tool")
+    if summary:
+        queryset = queryset.filter(id__gt=summary["through_id"])
+    return [history_item(row["sender"], row["text"])
+            async for row in queryset.order_by("created_at", "id").values("sender", "text")]
+
+
+async def load_first_turn(session) -> Optional[Dict[str, str]]:
+    """The oldest turn not covered by the session summary, as a specialist history item."""
+    summary = session.metadata.get("summary") or {}
+    queryset = session.messages.exclude(sender="tool")
+    if summary:
+        queryset = queryset.filter(id__gt=summary["through_id"])
+    row = await queryset.order_by("created_at", "id").values("sender", "text").afirst()
+    return history_item(row["sender"], row["text"]) if row else None
+
+
+async def load_evicted(session, state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    The unsummarized turns older than the state's window (the ones counted in 'evicted'),
+    as session messages ({ id, sender, text }), oldest first.
+    """
+    if not state.get("evicted") or not state["messages"] or state["messages"][0]["id"] is None:
+        return []
+    summary = session.metadata.get("summary") or {}
+    queryset = session.messages.exclude(sender="tool").filter(id__lt=state["messages"][0]["id"])
+    if summary:
+        queryset = queryset.filter(id__gt=summary["through_id"])
+    return [row async for row in queryset.order_by("created_at", "id").values("id", "sender", "text")]
+
+
+async def latest_message_id(session) -> Optional[int]:
+    """Id of the session's newest message (tool messages included); one index lookup."""
+    return await session.messages.order_by("-created_at", "-id").values_list("id", flat=True).afirst()
+
+
+async def load_state(session) -> Dict[str, Any]:
+    """
+    The session's state, as a copy the caller may change and save_state() back. A cached
+    state that is behind the database (turns stored by another worker, or ids the
+    write-behind queue could not fill in) is rebuilt.
+    """
+    state = session_state_cache.get(str(session.id))
+    if state is not None and state["last_message_id"] == await latest_message_id(session):
+        return copy_state(state)
+    state = await build_state(session)
+    save_state(session, state)
+    return state
+
+
+def save_state(session, state: Dict[str, Any]) -> None:
+    with _state_lock:
+        session_state_cache.set(str(session.id), copy_state(state))
+
+
+def forget_state(session_id) -> None:
+    session_state_cache.delete(str(session_id))
@@ -4,8 +4,10 @@ from . import views
 urlpatterns = [
     path("session/", views.create_session, name="create_session"),
     path("message/", views.post_message, name="post_message"),
+    path("message/stream/", views.post_message_stream, name="post_message_stream"),
     path("clear/", views.clear_session, name="clear_session"),
     path("history/<uuid:session_id>/", views.session_history, name="session_history"),
+    path("metrics/", views.metrics, name="metrics"),
     path("chat/", views.chat, name="chat"),  # Alternative endpoint for compatibility
     path("", views.index, name="index"),
 ]
@@ -1,16 +1,27 @@
 import json
-import asyncio
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
-from rest_framework import status
-from django.shortcuts import get_object_or_404
+import hashlib
+from functools import partial
+from typing import Optional
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.core.exceptions import ValidationError
 
 from .models import Session, Message
-from .serializers import SessionSerializer, MessageSerializer
 from . import agents_integration
+from .context import POLICY_PINNED, compact_history, needs_older_turns
+from . import session_state, persistence
+from .persistence import WritesFailed, WritesPending, message_writer
+from .limiter import LimiterBusy, agent_limiter
+from .agent_loop import agent_loop
 
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.utils.cache import get_conditional_response
 
 @csrf_exempt
 def chat(request):
@@ -28,82 +39,481 @@ def chat(request):
         return JsonResponse(response)
     return JsonResponse({"error": "Invalid request"}, status=400)
 
-@api_view(["POST"])
-def create_session(request):
-    s = Session.objects.create()
-    return Response({"session_id": str(s.id)})
+def _request_data(request) -> Optional[dict]:
+    """
+    Parse a JSON (or form-encoded) request body; returns None if it is not a JSON object.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body.decode("utf-8") or "{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST.dict()
+
+async def _get_session_or_none(session_id):
+    try:
+        return await Session.objects.aget(pk=session_id)
+    except (Session.DoesNotExist, ValidationError):
+        return None
 
-@api_view(["POST"])
-def post_message(request):
+@csrf_exempt
+@require_POST
+async def create_session(request):
+    s = await Session.objects.acreate()
+    return JsonResponse({"session_id": str(s.id)})
+
+async def _wait_for_writes(session_id):
     """
-    Request body: { session_id: <uuid>, text: <string> }
+    Wait until the session's queued messages (write-behind mode) are committed, so reads
+    never miss an acknowledged message. Raises WritesPending if they are not committed
+    within MESSAGE_WRITE_WAIT_TIMEOUT seconds, and WritesFailed (once) if the writer
+    dropped some of them.
+    """
+    if message_writer.pending(session_id):
+        timeout = getattr(settings, "MESSAGE_WRITE_WAIT_TIMEOUT", 5.0)
+        flushed = await sync_to_async(message_writer.wait_for_session, thread_sensitive=False)(session_id, timeout)
+        if not flushed:
+            raise WritesPending(f"Messages of session {session_id} not written within {timeout:.0f}s")
+    error = message_writer.take_failure(session_id)
+    if error is not None:
+        # The cached window still holds the lost messages
+        session_state.forget_state(session_id)
+        raise WritesFailed(f"Messages of session {session_id} could not be saved: {error}")
+
+def _writes_pending_response(session_id, error: str = "Earlier messages are still being saved, please retry shortly.") -> JsonResponse:
+    """503 with Retry-After when the session's queued messages are not committed yet."""
+    response = JsonResponse({"error": error, "session_id": str(session_id)}, status=503)
+    response["Retry-After"] = "1"
+    return response
+
+def _writes_failed_response(session_id) -> JsonResponse:
+    """500 when acknowledged messages of the session were lost by the write-behind queue."""
+    return JsonResponse({"error": "Some earlier messages of this conversation could not be saved.",
+                         "session_id": str(session_id)}, status=500)
+
+async def _agent_history(session, state):
+    """
+    Prior specialist history for this turn: the state's window. Once turns have fallen out
+    of it, "pinned" gets the first turn read back, and last_n/token_budget limits larger
+    than the window get the whole unsummarized history; otherwise (e.g. "all") older turns
+    are covered by the session summary. Returns: (history, evicted_turns left out of it)
+    """
+    history = list(state["history"])
+    evicted = state.get("evicted", 0)
+    policy = getattr(settings, "CONTEXT_POLICY", "all")
+    if evicted and policy == POLICY_PINNED:
+        first = await session_state.load_first_turn(session)
+        return ([first] if first else []) + history, evicted - 1 if first else evicted
+    if evicted and needs_older_turns(history, policy,
+                                     getattr(settings, "CONTEXT_MAX_TURNS", None),
+                                     getattr(settings, "CONTEXT_TOKEN_BUDGET", None)):
+        return await session_state.load_history(session), 0
+    return history, evicted
+
+async def _store_turn(session, state, user_message, result=None):
+    """
+    Persist the rest of a turn (tool calls and agent reply) with a single batched insert
+    and add the whole turn to the session state. The user message was already written by
+    _start_turn; without a result (the agent run failed) only it is added. In write-behind
+    mode the tool calls and reply are queued. Returns: (agent_name, reply_text)
+    """
+    messages = []
+    agent_name = reply_text = None
+    if result is not None:
+        agent_name = result.get("agent", "Unknown")
+        reply_text = result.get("text", "Sorry, I couldn't produce a response.")
+
+        # Store tool outputs as messages if present
+        for t in result.get("tool_calls", []):
+            messages.append(Message(session=session, sender="tool", text=json.dumps(t)))
+
+        # Store agent reply, recording how the agent was chosen and how much history it was sent
+        meta = {"routing": result.get("routing", {}), "context": result.get("context", {})}
+        if result.get("answered_locally"):
+            meta["answered_locally"] = True
+        messages.append(Message(session=session, sender=agent_name, text=reply_text, meta=meta))
+
+    session_state.append_message(state, user_message.pk, user_message.sender, user_message.text)
+    if not messages:
+        session_state.save_state(session, state)
+        return agent_name, reply_text
+
+    if persistence.write_mode() == persistence.MODE_WRITE_BEHIND:
+        # Acknowledge now; the tool calls and reply are written in the background
+        for m in messages:
+            session_state.append_message(state, None, m.sender, m.text)
+        session_state.save_state(session, state)
+        on_written = partial(session_state.fill_ids, session.id)
+
+        def on_failed(_messages):
+            # The cached window must not keep dropped rows (readers get WritesFailed)
+            session_state.forget_state(session.id)
+
+        if message_writer.submit(session.id, messages, on_written, on_failed):
+            if getattr(settings, "MESSAGE_WRITE_DURABILITY", persistence.DURABILITY_QUEUED) == persistence.DURABILITY_FLUSHED:
+                await _wait_for_writes(session.id)
+            return agent_name, reply_text
+        # Queue full: write the rest of the turn now
+        messages = await sync_to_async(persistence.write_messages)(messages)
+        if all(m.pk is not None for m in messages):
+            on_written(messages)
+        return agent_name, reply_text
+
+    messages = await sync_to_async(persistence.write_messages)(messages)
+    if any(m.pk is None for m in messages):
+        # The database did not return the new ids; rebuild the state on the next turn
+        session_state.forget_state(session.id)
+    else:
+        for m in messages:
+            session_state.append_message(state, m.pk, m.sender, m.text)
+        session_state.save_state(session, state)
+    return agent_name, reply_text
+
+async def _start_turn(request):
     """
-    data = request.data
+    Validate a message request, load the session context and write the user message, so
+    history reads made while the agents run already show it (and its id orders before
+    the reply's). The rest of the turn is written by _store_turn.
+    Returns: (session, user_message, state, None) or (None, None, None, error_response)
+    where state is the session's cached conversation state (see session_state).
+    """
+    data = _request_data(request)
+    if data is None:
+        return None, None, None, JsonResponse({"error": "Invalid JSON body."}, status=400)
     session_id = data.get("session_id")
-    text = data.get("text", "").strip()
+    text = (data.get("text") or "").strip()
     if not text:
-        return Response({"error": "No text provided."}, status=status.HTTP_400_BAD_REQUEST)
+        return None, None, None, JsonResponse({"error": "No text provided."}, status=400)
 
     if session_id:
-        session = get_object_or_404(Session, pk=session_id)
+        session = await _get_session_or_none(session_id)
+        if session is None:
+            return None, None, None, JsonResponse({"detail": "Not found."}, status=404)
+        # Recent window from the cached session state; only a cache miss reads messages
+        try:
+            await _wait_for_writes(session.id)
+        except WritesPending:
+            return None, None, None, _writes_pending_response(session.id)
+        except WritesFailed:
+            return None, None, None, _writes_failed_response(session.id)
+        state = await session_state.load_state(session)
     else:
-        session = Session.objects.create()
+        session = await Session.objects.acreate()
+        state = session_state.new_state()
 
-    # store user message
-    Message.objects.create(session=session, sender="user", text=text)
+    user_message = Message(session=session, sender="user", text=text)
+    await user_message.asave()
+    return session, user_message, state, None
 
-    # Build session_messages array for context
-    msgs = []
-    for m in session.messages.order_by("created_at").all():
-        msgs.append({"sender": m.sender, "text": m.text, "meta": m.meta})
+def _turn_messages(state, user_message):
+    """Session messages for the agents: the state's window plus the current user message."""
+    return state["messages"] + [{"id": user_message.pk, "sender": user_message.sender, "text": user_message.text}]
 
-    # Run triage & handle (this executes handoffs and tool calls)
+# Sessions with a summary compaction running in this worker (see _compact_after_turn)
+_compacting = set()
+
+def _compact_after_turn(session, state):
+    """
+    Start summary compaction for a stored turn on the agent loop, so the summarizer call
+    never delays a reply or the first streamed event. Skipped while the session is still
+    being compacted; the next turn tries again.
+    """
+    if not getattr(settings, "CONVERSATION_SUMMARY_THRESHOLD", 0) or session.id in _compacting:
+        return
+    _compacting.add(session.id)
+    future = agent_loop.spawn(partial(_compact_history, session, session_state.copy_state(state)))
+    future.add_done_callback(lambda _: _compacting.discard(session.id))
+
+async def _compact_history(session, state):
+    """
+    Fold older turns into the session's running summary once the unsummarized history
+    passes CONVERSATION_SUMMARY_THRESHOLD turns (0 disables), and drop them from the
+    cached window.
+    """
+    threshold = getattr(settings, "CONVERSATION_SUMMARY_THRESHOLD", 0)
+    if not threshold:
+        return
     try:
-        result = asyncio.run(agents_integration.run_triage_and_handle(session_messages=msgs, user_text=text))
+        # The summary may have moved on since the session was loaded (another worker)
+        await session.arefresh_from_db(fields=["metadata"])
+        summary = session.metadata.get("summary")
+        through_id = (summary or {}).get("through_id", 0)
+        messages = [m for m in state["messages"] if m["id"] is None or m["id"] > through_id]
+        # Turns that fell out of the window before compaction ran (e.g. the threshold was
+        # turned on for a long session) are folded too, or they would be lost from context
+        messages = await session_state.load_evicted(session, state) + messages
+        _, new_summary = await compact_history(
+            messages, summary,
+            summarizer=agents_integration.get_summarizer(),
+            threshold=threshold,
+            keep_recent=getattr(settings, "CONVERSATION_SUMMARY_KEEP_RECENT", 6),
+        )
+        if new_summary is summary:
+            return
+        session.metadata["summary"] = new_summary
+        await session.asave(update_fields=["metadata"])
     except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Without a new summary the full window is sent; compaction is retried next turn
+        print(f"DEBUG - Conversation summary failed, sending full history: {e}")
+        return
+    session_state.apply_summary(session.id, new_summary["through_id"])
+    print(f"DEBUG - Folded history through message {new_summary['through_id']} into the session summary "
+          f"({new_summary['turns']} turns summarized)")
 
-    agent_name = result.get("agent", "Unknown")
-    reply_text = result.get("text", "Sorry, I couldn't produce a response.")
+def _busy_response(session, status: int, retry_after: int) -> JsonResponse:
+    """429 (wait queue full) or 503 (no agent slot in time), with Retry-After."""
+    response = JsonResponse({"error": "The assistants are busy, please retry shortly.",
+                             "session_id": str(session.id), "retry_after": retry_after}, status=status)
+    response["Retry-After"] = str(retry_after)
+    return response
 
-    # Store tool outputs as messages if present
-    tool_calls = result.get("tool_calls", [])
-    for t in tool_calls:
-        Message.objects.create(session=session, sender="tool", text=json.dumps(t))
+def _summary_text(session) -> str:
+    return (session.metadata.get("summary") or {}).get("text", "")
 
-    # Store agent reply
-    Message.objects.create(session=session, sender=agent_name, text=reply_text)
+@csrf_exempt
+@require_POST
+async def post_message(request):
+    """
+    Request body: { session_id: <uuid>, text: <string> }
+    Answers 429 or 503 with Retry-After when no agent slot is available (see chat.limiter).
+    """
+    session, user_message, state, error_response = await _start_turn(request)
+    if error_response is not None:
+        return error_response
+
+    # Run triage & handle (this executes handoffs and tool calls) on the server's event loop
+    agent_history, evicted_turns = await _agent_history(session, state)
+    try:
+        result = await agents_integration.run_triage_and_handle(session_messages=_turn_messages(state, user_message),
+                                                                user_text=user_message.text,
+                                                                conversation_summary=_summary_text(session),
+                                                                agent_history=agent_history,
+                                                                evicted_turns=evicted_turns)
+    except LimiterBusy as e:
+        # Not kept: the client is expected to send the message again
+        await user_message.adelete()
+        return _busy_response(session, e.status, e.retry_after)
+    except Exception as e:
+        # Keep the user's message even though there is no reply
+        await _store_turn(session, state, user_message)
+        return JsonResponse({"error": str(e)}, status=500)
+
+    try:
+        agent_name, reply_text = await _store_turn(session, state, user_message, result)
+    except WritesPending:
+        # durability=flushed: the turn is queued but its commit could not be confirmed
+        return _writes_pending_response(session.id, "Your message was received but could not be confirmed as saved yet.")
+    except WritesFailed:
+        # durability=flushed: the turn's queued rows were dropped
+        return _writes_failed_response(session.id)
+    _compact_after_turn(session, state)
 
-    return Response({
+    return JsonResponse({
         "session_id": str(session.id),
         "agent": agent_name,
         "text": reply_text
     })
 
-@api_view(["POST"])
-def clear_session(request):
-    session_id = request.data.get("session_id")
-    if session_id:
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+@csrf_exempt
+@require_POST
+async def post_message_stream(request):
+    """
+    Streaming variant of post_message, sent as Server-Sent Events.
+    Request body: { session_id: <uuid>, text: <string> }
+    Events: 'routing' once the agent is chosen, 'delta' for each chunk of specialist text,
+    then 'done' with the final formatted text after the reply has been stored
+    ('error' replaces 'done' if the agent run fails). 'busy' (with status and retry_after)
+    replaces it when no agent slot is available; the message is then not kept, as with
+    post_message's 429/503.
+    """
+    session, user_message, state, error_response = await _start_turn(request)
+    if error_response is not None:
+        return error_response
+    # Turn the stream away before it starts if the agent queue is already full
+    if agent_limiter.saturated():
+        await user_message.adelete()
+        return _busy_response(session, 429, agent_limiter.retry_after())
+
+    agent_history, evicted_turns = await _agent_history(session, state)
+
+    async def event_stream():
+        stored = busy = False
         try:
-            s = Session.objects.get(pk=session_id)
-            s.delete()
-            # create new session
-            ns = Session.objects.create()
-            return Response({"session_id": str(ns.id)})
-        except Session.DoesNotExist:
-            ns = Session.objects.create()
-            return Response({"session_id": str(ns.id)})
+            async for event in agents_integration.stream_triage_and_handle(session_messages=_turn_messages(state, user_message),
+                                                                              user_text=user_message.text,
+                                                                              conversation_summary=_summary_text(session),
+                                                                              agent_history=agent_history,
+                                                                              evicted_turns=evicted_turns):
+                if event["type"] == "routing":
+                    yield _sse("routing", {"session_id": str(session.id), "agent": event["agent"]})
+                elif event["type"] == "delta":
+                    yield _sse("delta", {"text": event["text"]})
+                elif event["type"] == "busy":
+                    # As post_message answering 429/503: the message is not kept, the client retries
+                    busy = True
+                    await user_message.adelete()
+                    yield _sse("busy", {"session_id": str(session.id), "status": event["status"],
+                                        "retry_after": event["retry_after"],
+                                        "error": "The assistants are busy, please retry shortly."})
+                else:
+                    try:
+                        agent_name, reply_text = await _store_turn(session, state, user_message, event)
+                    except WritesPending:
+                        # Queued (so not stored again below), but its commit could not be confirmed
+                        stored = True
+                        yield _sse("error", {"session_id": str(session.id),
+                                             "error": "Your message was received but could not be confirmed as saved yet."})
+                        return
+                    except WritesFailed:
+                        stored = True
+                        yield _sse("error", {"session_id": str(session.id),
+                                             "error": "Your message was received but the reply could not be saved."})
+                        return
+                    stored = True
+                    _compact_after_turn(session, state)
+                    yield _sse(event["type"], {"session_id": str(session.id), "agent": agent_name, "text": reply_text})
+        except Exception as e:
+            yield _sse("error", {"session_id": str(session.id), "error": str(e)})
+        finally:
+            # Keep the user's message if the run failed or the client went away mid-stream
+            if not stored and not busy:
+                await _store_turn(session, state, user_message)
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Keep reverse proxies (nginx) from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@csrf_exempt
+@require_POST
+async def clear_session(request):
+    data = _request_data(request) or {}
+    session_id = data.get("session_id")
+    if session_id:
+        s = await _get_session_or_none(session_id)
+        if s is not None:
+            try:
+                await _wait_for_writes(s.id)
+            except WritesPending:
+                return _writes_pending_response(s.id)
+            except WritesFailed:
+                pass  # the session is deleted anyway
+            await s.adelete()
+            session_state.forget_state(session_id)
+    # create new session
+    ns = await Session.objects.acreate()
+    return JsonResponse({"session_id": str(ns.id)})
+
+def _encode_cursor(created_at, message_id) -> str:
+    raw = f"{created_at.isoformat()}|{message_id}"
+    return urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str):
+    """
+    Returns: (created_at, id) or None if the cursor is malformed.
+    """
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, message_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except ValueError:
+        return None
+
+def _serialize_message(m) -> dict:
+    return {"id": m.id, "sender": m.sender, "text": m.text, "meta": m.meta, "created_at": m.created_at}
+
+@require_GET
+async def session_history(request, session_id):
+    """
+    Keyset-paginated history on (created_at, id).
+    Query params: limit (default HISTORY_PAGE_SIZE), and at most one of
+      before=<cursor>  the page of messages just older than the cursor
+      since=<cursor>   messages newer than the cursor, oldest first
+    Without a cursor the newest page is returned. Messages are always in chronological
+    order. prev_cursor (pass as 'before') is set when older messages exist; next_cursor
+    (pass as 'since') is the newest message returned. The ETag comes from the session's
+    latest message and the page asked for, so an unchanged page answers 304 without
+    loading it.
+    """
+    s = await _get_session_or_none(session_id)
+    if s is None:
+        return JsonResponse({"detail": "Not found."}, status=404)
+    try:
+        await _wait_for_writes(s.id)
+    except WritesPending:
+        # Never serve a page that could miss an acknowledged message
+        return _writes_pending_response(s.id)
+    except WritesFailed:
+        return _writes_failed_response(s.id)
+
+    page_size = getattr(settings, "HISTORY_PAGE_SIZE", 50)
+    try:
+        limit = min(max(int(request.GET.get("limit", page_size)), 1), getattr(settings, "HISTORY_MAX_PAGE_SIZE", 200))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer."}, status=400)
+    before, since = request.GET.get("before"), request.GET.get("since")
+    if before and since:
+        return JsonResponse({"error": "Use either 'before' or 'since', not both."}, status=400)
+    position = _decode_cursor(before or since) if (before or since) else None
+    if (before or since) and position is None:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    # Conditional GET: messages are only ever appended, so the latest one identifies the state
+    latest = await s.messages.order_by("-created_at", "-id").values("id", "created_at").afirst()
+    # ETag only: Last-Modified has one-second granularity, so a message written in the same
+    # second as the previous response would get a stale 304. The page (limit and decoded
+    # cursor) is part of it, so one page's validator never matches another page
+    page_key = f"{limit}|{'before' if before else 'since' if since else ''}|{position or ''}"
+    page_digest = hashlib.sha1(page_key.encode("utf-8")).hexdigest()[:12]
+    etag = f'"{s.id}-{latest["id"] if latest else 0}-{page_digest}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    messages = s.messages.all()
+    if since:
+        created_at, message_id = position
+        messages = messages.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id))
+        page = [m async for m in messages.order_by("created_at", "id")[:limit + 1]]
+        has_more = len(page) > limit
+        page = page[:limit]
+        has_older = False
     else:
-        ns = Session.objects.create()
-        return Response({"session_id": str(ns.id)})
+        if before:
+            created_at, message_id = position
+            messages = messages.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id))
+        page = [m async for m in messages.order_by("-created_at", "-id")[:limit + 1]]
+        has_older = len(page) > limit
+        page = page[:limit]
+        page.reverse()
+        has_more = False
 
-@api_view(["GET"])
-def session_history(request, session_id):
-    s = get_object_or_404(Session, pk=session_id)
-    messages = []
-    for m in s.messages.order_by("created_at").all():
-        messages.append({"sender": m.sender, "text": m.text, "meta": m.meta, "created_at": m.created_at})
-    return Response({"session_id": str(s.id), "messages": messages})
+    if page:
+        next_cursor = _encode_cursor(page[-1].created_at, page[-1].id)
+    else:
+        next_cursor = since or (_encode_cursor(latest["created_at"], latest["id"]) if latest else None)
+
+    response = JsonResponse({
+        "session_id": str(s.id),
+        "messages": [_serialize_message(m) for m in page],
+        "prev_cursor": _encode_cursor(page[0].created_at, page[0].id) if has_older else None,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    }, encoder=DjangoJSONEncoder)
+    response["ETag"] = etag
+    # Let browsers keep the page but revalidate it every time
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+@require_GET
+def metrics(request):
+    """Process-wide routing and caching counters for this worker"""
+    return JsonResponse(agents_integration.get_metrics())
 
 def index(request):
     """API root endpoint - returns information about available endpoints"""
@@ -113,8 +523,10 @@ def index(request):
         "endpoints": {
             "POST /api/session/": "Create a new chat session",
             "POST /api/message/": "Send a message to agents",
+            "POST /api/message/stream/": "Send a message and stream the reply (Server-Sent Events)",
             "POST /api/clear/": "Clear chat session",
-            "GET /api/history/<session_id>/": "Get session history",
+            "GET /api/history/<session_id>/": "Get session history (paginated: ?limit=&before=<cursor> or ?since=<cursor>)",
+            "GET /api/metrics/": "Routing and cache counters for this worker",
             "POST /api/chat/": "Alternative chat endpoint (compatibility)"
         },
         "frontend_url": "http://localhost:5173",